@@ -0,0 +1,214 @@
+# stage-level benchmarks over synthetic archives.
+#   python -m bench.run --files 1000,20000 --repeat 3 --out bench.json
+#   python -m bench.run --files 20000 --baseline bench.json --tolerance 0.25
+# exits non-zero when a stage's median is slower than the baseline by more than the tolerance
+import os
+
+# keep the benchmark offline and uncached
+os.environ.setdefault("DOX_DISABLE_REMOTE_RENDER", "1")
+os.environ.setdefault("DOX_RENDER_WORKERS", "0")
+os.environ.setdefault("DOX_CACHE_ENABLED", "false")
+
+import io
+import sys
+import json
+import time
+import asyncio
+import argparse
+import platform
+import statistics
+import tempfile
+import shutil
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+from starlette.datastructures import UploadFile, Headers
+
+import util.methods as methods
+import util.archive as archive
+import util.diagram as diagram
+from bench.synth import generate
+
+
+# times fn over repeat runs; setup output is passed in and not timed
+def measure(fn: Callable[..., Any], repeat: int, setup: Callable[[], Any] = None) -> Dict[str, Any]:
+    times = []
+    for _ in range(repeat):
+        arg = setup() if setup else None
+        start = time.perf_counter()
+        fn(arg) if setup else fn()
+        times.append(time.perf_counter() - start)
+
+    return {"median_s": statistics.median(times), "min_s": min(times), "runs": repeat}
+
+
+# drives the ASGI app directly with a multipart POST, returning (status, body size)
+async def asgi_post(app: Any, path: str, filename: str, payload: bytes) -> tuple:
+    boundary = "doxbenchboundary"
+    body = (
+        f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"{filename}\"\r\n"
+        f"Content-Type: application/zip\r\n\r\n"
+    ).encode() + payload + f"\r\n--{boundary}--\r\n".encode()
+
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": b"",
+        "root_path": "", "client": ("127.0.0.1", 0), "server": ("127.0.0.1", 80),
+        "headers": [
+            (b"content-type", f"multipart/form-data; boundary={boundary}".encode()),
+            (b"content-length", str(len(body)).encode()),
+        ],
+    }
+    sent = False
+    status = 0
+    size = 0
+
+    async def receive():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await asyncio.sleep(3600)
+
+    async def send(message):
+        nonlocal status, size
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body":
+            size += len(message.get("body", b""))
+
+    await app(scope, receive, send)
+    return status, size
+
+
+# runs every stage against one archive
+def bench_archive(zip_path: Path, repeat: int) -> Dict[str, Any]:
+    payload = zip_path.read_bytes()
+    stages: Dict[str, Any] = {}
+    work = Path(tempfile.mkdtemp(prefix="dox_bench_"))
+
+    try:
+        def save():
+            tmp = Path(tempfile.mkdtemp(dir=work))
+            upload = UploadFile(io.BytesIO(payload), size=len(payload), filename="bench.zip",
+                                headers=Headers({"content-type": "application/zip"}))
+            asyncio.run(methods.save_upload(tmp, upload))
+        stages["save_upload"] = measure(save, repeat)
+
+        def fresh_dir():
+            d = Path(tempfile.mkdtemp(dir=work)) / "repo"
+            d.mkdir()
+            return d
+        stages["unzip"] = measure(lambda d: methods.unzip(zip_path, d), repeat, setup=fresh_dir)
+
+        repo_dir = fresh_dir()
+        methods.unzip(zip_path, repo_dir)
+        stages["get_files"] = measure(lambda: methods.get_files(repo_dir), repeat)
+        files = methods.get_files(repo_dir)
+
+        def detectors():
+            methods.scan_repo(repo_dir, files)
+            methods.get_languages(files)
+            methods.get_packages(files)
+            methods.detect_entry_points(repo_dir, files)
+            methods.get_test(repo_dir, files)
+        stages["detectors"] = measure(detectors, repeat)
+
+        stages["make_tree"] = measure(lambda: methods.make_tree(repo_dir), repeat)
+        tree = methods.make_tree(repo_dir)
+        stages["tree_to_markdown"] = measure(lambda: methods.tree_to_markdown(tree), repeat)
+
+        scan = methods.scan_repo(repo_dir, files)
+        stages["generate_mermaid_syntax"] = measure(
+            lambda: diagram.generate_mermaid_syntax("repo", scan["frameworks"], scan["dependencies"], tree), repeat)
+
+        def archive_dir():
+            for _ in archive.stream_dir_archive(repo_dir):
+                pass
+        stages["stream_dir"] = measure(archive_dir, repeat)
+
+        def zip_scan():
+            with archive.ZipRepo(zip_path) as repo:
+                zfiles = repo.list_files()
+                methods.scan_repo(repo, zfiles)
+                repo.tree()
+        stages["zip_repo_scan"] = measure(zip_scan, repeat)
+
+        gen = work / "generated"
+        (gen / "docs").mkdir(parents=True)
+        (gen / "README.md").write_text("# bench\n")
+        (gen / "docs" / "diagram.mmd").write_text("flowchart TD\n")
+        stages["build_archive_from_zip"] = measure(
+            lambda: archive.build_archive_from_zip(zip_path, gen, work / "out.zip"), repeat)
+
+        import main
+        diagram.render_mermaid = lambda *a, **k: None
+
+        def full():
+            status, _ = asyncio.run(asgi_post(main.app, "/analyze", "bench.zip", payload))
+            if status != 200:
+                raise RuntimeError(f"/analyze returned {status}")
+        stages["analyze"] = measure(full, repeat)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+    return stages
+
+
+# compares medians against a stored baseline, returning regression descriptions
+def find_regressions(results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    out = []
+    for case, stages in results["cases"].items():
+        base_stages = baseline.get("cases", {}).get(case, {})
+        for stage, r in stages.items():
+            base = base_stages.get(stage)
+            if not base:
+                continue
+            if r["median_s"] > base["median_s"] * (1 + tolerance):
+                out.append(f"{case} {stage}: {base['median_s']:.4f}s -> {r['median_s']:.4f}s")
+    return out
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the /analyze pipeline stage by stage")
+    parser.add_argument("--files", default="1000", help="comma-separated file counts, e.g. 1000,20000,200000")
+    parser.add_argument("--depth", type=int, default=5)
+    parser.add_argument("--mean-size", type=int, default=2000)
+    parser.add_argument("--mix", default="py:0.5,js:0.3,ts:0.2")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", type=Path, help="write results json here")
+    parser.add_argument("--baseline", type=Path, help="results json to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown before flagging, 0.25 = 25%%")
+    args = parser.parse_args()
+
+    results: Dict[str, Any] = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {"depth": args.depth, "mean_size": args.mean_size, "mix": args.mix,
+                   "repeat": args.repeat, "seed": args.seed},
+        "cases": {},
+    }
+
+    with tempfile.TemporaryDirectory(prefix="dox_bench_zip_") as d:
+        for count in [int(c) for c in args.files.split(",") if c.strip()]:
+            zip_path = generate(Path(d) / f"repo_{count}.zip", count, args.depth, args.mean_size, args.mix, args.seed)
+            case = f"files={count}"
+            results["cases"][case] = bench_archive(zip_path, args.repeat)
+
+            for stage, r in results["cases"][case].items():
+                print(f"{case:>14} {stage:<24} {r['median_s'] * 1000:10.1f} ms")
+
+    if args.out:
+        args.out.write_text(json.dumps(results, indent=2), encoding="utf-8")
+
+    if args.baseline:
+        regressions = find_regressions(results, json.loads(args.baseline.read_text(encoding="utf-8")), args.tolerance)
+        for r in regressions:
+            print(f"REGRESSION {r}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+# synthetic repository archives for benchmarking.
+#   python -m bench.synth out.zip --files 20000 --depth 6 --mix py:0.5,js:0.3,ts:0.2
+import argparse
+import json
+import math
+import random
+import zipfile
+from pathlib import Path
+from typing import Dict, List
+
+# per-language snippets: (extension, import lines, body line)
+LANGUAGES = {
+    "py": (".py", [
+        "import os", "import json", "from fastapi import FastAPI", "from sqlalchemy import Column",
+        "import requests", "from django.db import models", "import numpy as np", "from flask import Flask",
+    ], "def handler_{n}(x):\n    return x * {n}\n"),
+    "js": (".js", [
+        "const express = require('express');", "import React from 'react';", "import axios from 'axios';",
+        "const fs = require('fs');", "import { useState } from 'react';", "const dotenv = require('dotenv');",
+    ], "function handler{n}(x) {{ return x * {n}; }}\n"),
+    "ts": (".ts", [
+        "import { Injectable } from '@angular/core';", "import next from 'next';", "import { z } from 'zod';",
+        "import type { Request } from 'express';", "import Vue from 'vue';",
+    ], "export const handler{n} = (x: number): number => x * {n};\n"),
+    "go": (".go", [
+        "import \"fmt\"", "import \"net/http\"", "import \"github.com/gin-gonic/gin\"",
+    ], "func Handler{n}(x int) int {{ return x * {n} }}\n"),
+    "md": (".md", [], "Some documentation paragraph number {n}.\n"),
+}
+
+DIR_NAMES = ["src", "lib", "api", "routes", "models", "services", "utils", "components", "core", "pkg", "internal", "web"]
+
+
+# parses "py:0.5,js:0.5" into normalized weights
+def parse_mix(mix: str) -> Dict[str, float]:
+    weights = {}
+    for part in mix.split(","):
+        lang, _, w = part.partition(":")
+        if lang.strip() not in LANGUAGES:
+            raise ValueError(f"Unknown language {lang!r}; choose from {', '.join(LANGUAGES)}")
+        weights[lang.strip()] = float(w or 1)
+
+    total = sum(weights.values())
+    return {k: v / total for k, v in weights.items()}
+
+
+# builds a file body of roughly size bytes for the language
+def make_body(rng: random.Random, lang: str, size: int) -> bytes:
+    _, imports, body = LANGUAGES[lang]
+    lines = []
+    if imports:
+        lines.extend(rng.sample(imports, k=min(len(imports), rng.randint(1, 4))))
+        if lang in ("py", "js", "ts") and rng.random() < 0.05:
+            lines.append("API_KEY = os.environ.get('API_KEY')" if lang == "py" else "const key = process.env.API_KEY;")
+
+    n = 0
+    out = "\n".join(lines) + "\n"
+    while len(out) < size:
+        n += 1
+        out += body.format(n=n)
+    return out.encode("utf-8")
+
+
+# random directory path no deeper than depth
+def make_dir(rng: random.Random, depth: int) -> List[str]:
+    return [rng.choice(DIR_NAMES) + str(rng.randint(0, 9)) for _ in range(rng.randint(0, depth))]
+
+
+# writes a zip of files members under a top-level project folder
+def generate(out: Path, files: int = 1000, depth: int = 5, mean_size: int = 2000,
+             mix: str = "py:0.5,js:0.3,ts:0.2", seed: int = 0) -> Path:
+    rng = random.Random(seed)
+    weights = parse_mix(mix)
+    langs = list(weights)
+    sigma = 1.0
+    mu = math.log(max(mean_size, 1)) - sigma * sigma / 2
+    root = "project"
+
+    with zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED) as z:
+        if "py" in weights:
+            z.writestr(f"{root}/requirements.txt", "fastapi==0.1\nsqlalchemy\npsycopg2\nrequests\n")
+            z.writestr(f"{root}/main.py", make_body(rng, "py", 400))
+        if "js" in weights or "ts" in weights:
+            z.writestr(f"{root}/package.json", json.dumps({
+                "main": "index.js",
+                "scripts": {"start": "node index.js"},
+                "dependencies": {"express": "^4", "react": "^18", "axios": "^1"},
+            }))
+
+        written = z.namelist()
+        for i in range(max(0, files - len(written))):
+            lang = rng.choices(langs, weights=[weights[l] for l in langs])[0]
+            ext = LANGUAGES[lang][0]
+            size = int(rng.lognormvariate(mu, sigma))
+            name = ("test_" if rng.random() < 0.05 else "") + f"file{i}{ext}"
+            path = "/".join([root, *make_dir(rng, depth), name])
+            z.writestr(path, make_body(rng, lang, size))
+
+    return out
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Generate a synthetic repository archive")
+    parser.add_argument("out", type=Path)
+    parser.add_argument("--files", type=int, default=1000)
+    parser.add_argument("--depth", type=int, default=5)
+    parser.add_argument("--mean-size", type=int, default=2000)
+    parser.add_argument("--mix", default="py:0.5,js:0.3,ts:0.2")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    generate(args.out, args.files, args.depth, args.mean_size, args.mix, args.seed)
+    print(args.out)
+
+
+if __name__ == "__main__":
+    main()
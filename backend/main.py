@@ -1,18 +1,58 @@
 import shutil
 import tempfile
-import re
+import hashlib
+import asyncio
+import json
 import os
+import re
 import sys
 import logging
+import zipfile
+import zlib
 import util.methods as methods
 import util.diagram as diagram
+import util.pipeline as pipeline
+import util.archive as archive
+import util.workers as workers
+import util.cache as cache
+import util.jobs as jobs
+import util.metrics as metrics
+from util.budget import Budget, REQUEST_TIMEOUT
+from contextlib import asynccontextmanager
 from pathlib import Path
-from fastapi import FastAPI, File, UploadFile, HTTPException
+from typing import Any, Callable, Iterable, Literal, Optional
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-
-app = FastAPI(title = "repo analyzer")
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from util.consts import MAX_UPLOAD
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # the pool's socket goes into the environment before any process-pool child spawns
+    diagram.start_renderer_pool()
+    workers.get_executor()
+    reaper = asyncio.create_task(jobs_queue.reap_forever())
+    dumper = asyncio.create_task(_dump_metrics_forever())
+    try:
+        yield
+    finally:
+        reaper.cancel()
+        dumper.cancel()
+        await run_in_threadpool(metrics.dump, _cache_stats())
+        await jobs_queue.shutdown()
+        workers.shutdown()
+        diagram.stop_renderer_pool()
+
+app = FastAPI(title = "repo analyzer", lifespan=lifespan)
 logger = logging.getLogger(__name__)
 
+# slack for multipart boundaries and headers around the zip itself
+UPLOAD_OVERHEAD = 1024 * 1024
+# repos one /analyze/batch request may carry, and the size of its whole body
+MAX_BATCH_REPOS = int(os.getenv("DOX_MAX_BATCH_REPOS", "200"))
+MAX_BATCH_UPLOAD = int(os.getenv("DOX_MAX_BATCH_UPLOAD", str(2 * 1024 * 1024 * 1024)))
+
 def _cors_origins() -> list[str]:
     origins = os.getenv("CORS_ORIGINS", "http://localhost:3000,http://127.0.0.1:3000")
     return [origin.strip() for origin in origins.split(",") if origin.strip()]
@@ -25,193 +65,384 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-TEMPLATE_PATH = Path(__file__).resolve().parent / "util" / "template.md"
+# refuse bodies that can't fit under MAX_UPLOAD before reading them
+@app.middleware("http")
+async def limit_upload_size(request: Request, call_next):
+    length = request.headers.get("content-length")
+    limit = MAX_BATCH_UPLOAD if request.url.path == "/analyze/batch" else MAX_UPLOAD
+    if request.method == "POST" and length and length.isdigit() and int(length) > limit + UPLOAD_OVERHEAD:
+        return JSONResponse(status_code=413, content={"detail": "Upload too large"})
+    return await call_next(request)
 
 @app.get("/health")
 async def health() -> dict[str, str]:
     return {"status": "ok"}
 
-@app.post('/analyze')
-async def generate(file: UploadFile = File(...)):
-    tmp = tempfile.mkdtemp(prefix="dox_analyze_")
-    tmpdir = Path(tmp)
-    
-    try:
+def _cache_stats() -> dict[str, Any]:
+    return {"results": cache.results.stats(), "diagrams": cache.diagrams.stats(), "scan": cache.scan_results.stats()}
+
+# snapshots this worker's metrics so scrapes answered by the other workers include them
+async def _dump_metrics_forever() -> None:
+    while True:
+        await asyncio.sleep(metrics.METRICS_FLUSH_INTERVAL)
         try:
-            zip_path = methods.save_upload(tmpdir, file)
-        except HTTPException:
-            raise
-        except Exception as e:
-            shutil.rmtree(tmpdir, ignore_errors=True)
-            raise HTTPException(status_code=500, detail=f"Failed saving upload: {e}")
+            await run_in_threadpool(metrics.dump, _cache_stats())
+        except Exception:
+            logger.exception("Failed writing metrics snapshot")
+
+# both endpoints sum every web worker on the host, whichever one answers
+@app.get("/metrics")
+async def prometheus_metrics() -> PlainTextResponse:
+    body = await run_in_threadpool(metrics.render, _cache_stats())
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4")
+
+@app.get("/cache/stats")
+async def cache_stats() -> dict[str, Any]:
+    total = await run_in_threadpool(metrics.aggregate, _cache_stats())
+    return total["caches"]
+
+# hands back a cached result. entries hold only the generated files, since the upload that
+# hit the cache supplies the rest of the archive; they're hard-linked into tmpdir so
+# eviction can't pull them mid-stream
+def _from_cache(entry: Path, tmpdir: Path, output: str = "archive") -> Optional[dict[str, Any]]:
+    try:
+        info = json.loads((entry / "result.json").read_text(encoding="utf-8"))
+        if output == "archive":
+            cached = entry / "generated"
+            if not cached.is_dir():
+                return None
+            generated = tmpdir / "cached_generated"
+            for src in cached.rglob("*"):
+                if not src.is_file():
+                    continue
+                dest = generated / src.relative_to(cached)
+                dest.parent.mkdir(parents=True, exist_ok=True)
+                try:
+                    os.link(src, dest)
+                except OSError:
+                    shutil.copyfile(src, dest)
+            info["generated"] = str(generated)
+    except Exception:
+        logger.exception("Unreadable cache entry %s", entry)
+        return None
+
+    return info
+
+def _to_cache(key: str, result: dict[str, Any], output: str = "archive") -> None:
+    if output == "json":
+        info = {k: result[k] for k in ("metadata", "readme", "mermaid")}
+        cache.results.put(key, {"result.json": json.dumps(info).encode("utf-8")})
+        return
+
+    info = {"download_name": result["download_name"], "metadata": result["metadata"]}
+    generated = Path(result["generated"])
+    files: dict[str, Any] = {"result.json": json.dumps(info).encode("utf-8")}
+    for p in generated.rglob("*"):
+        if p.is_file():
+            files[f"generated/{p.relative_to(generated).as_posix()}"] = p
+    cache.results.put(key, files)
+
+# streams a result's archive: the upload's members plus the generated files, zipped while the
+# client reads, so nothing is staged on disk and the first bytes follow the analysis directly
+def _stream_result(result: dict[str, Any], cleanup_dirs: Iterable[Path] = ()) -> StreamingResponse:
+    chunks = archive.stream_archive_from_zip(Path(result["upload"]), Path(result["generated"]))
+    return methods.stream_zip(chunks, result["download_name"], cleanup_dirs=cleanup_dirs,
+                              on_done=lambda sent: metrics.stage_bytes.observe(sent, stage="archive"))
+
+# the response for an archive result in one of the download formats: zip is the whole repo,
+# artifacts only the generated files, patch a unified diff adding them to the repo
+async def _result_response(result: dict[str, Any], format: str, cleanup_dirs: Iterable[Path] = ()) -> Response:
+    if format == "zip":
+        return _stream_result(result, cleanup_dirs)
+
+    stem = Path(result["download_name"]).stem
+    if format == "artifacts":
+        chunks = archive.stream_artifacts(Path(result["generated"]))
+        return methods.stream_zip(chunks, f"{stem}-docs.zip", cleanup_dirs=cleanup_dirs)
 
-        repo_dir = tmpdir / "repo"
-        repo_dir.mkdir(exist_ok=True)
+    try:
+        patch = await run_in_threadpool(archive.artifacts_patch, Path(result["upload"]), Path(result["generated"]))
+    finally:
+        for d in cleanup_dirs:
+            shutil.rmtree(d, ignore_errors=True)
+    return PlainTextResponse(patch, media_type="text/x-diff",
+                             headers={"Content-Disposition": f'attachment; filename="{stem}.patch"'})
+
+# result-cache key of an upload's sha256 digest
+def _cache_key(digest: str) -> str:
+    return f"{digest}-{pipeline.ANALYZE_MODE}-{pipeline.RESULT_VERSION}"
+
+def _new_tmpdir() -> Path:
+    return Path(tempfile.mkdtemp(prefix="dox_analyze_"))
+
+# request body docs for the upload endpoints, which read the multipart stream themselves
+def _upload_body(field: str, many: bool = False) -> dict[str, Any]:
+    schema: dict[str, Any] = {"type": "string", "format": "binary"}
+    if many:
+        schema = {"type": "array", "items": schema}
+    return {"requestBody": {"required": True, "content": {"multipart/form-data": {"schema": {
+        "type": "object", "required": [field], "properties": {field: schema}}}}}}
+
+# streams the uploads in the request's field to disk as they arrive, each in its own temp dir;
+# items carry a cache key once saved. strict raises the first rejected file
+async def _receive_all(request: Request, field: str, body_limit: int, max_files: int = 1,
+                       strict: bool = True) -> list[dict[str, Any]]:
+    try:
+        items = await methods.receive_uploads(request, field, _new_tmpdir, body_limit + UPLOAD_OVERHEAD,
+                                              max_files=max_files, strict=strict)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed saving upload: {e}")
+
+    for item in items:
+        if "sha256" in item:
+            item["key"] = _cache_key(item.pop("sha256"))
+    return items
+
+# saves the one upload into a fresh temp dir and returns (tmpdir, zip path, cache key)
+async def _receive(request: Request) -> tuple[Path, Path, str]:
+    item = (await _receive_all(request, "file", MAX_UPLOAD))[0]
+    return item["tmpdir"], item["zip_path"], item["key"]
+
+# per-request budget; process workers get a copy, so they watch a marker file for cancellation.
+# the marker lives in tmpdir so it goes with it however the request ends
+def _budget(tmpdir: Path, timeout: float = REQUEST_TIMEOUT) -> Budget:
+    if workers.POOL_KIND == "process":
+        return Budget(timeout, cancel_path=str(tmpdir / ".cancel"))
+    return Budget(timeout)
+
+# cancels the budgets when the client goes away, so the workers stop early
+async def _watch_disconnect(request: Request, *budgets: Budget) -> None:
+    while not await request.is_disconnected():
+        await asyncio.sleep(0.5)
+    for budget in budgets:
+        budget.cancel()
+
+# serves from the result cache or runs the pipeline on the worker pool. output "json"
+# returns metadata, readme and mermaid text without rendering or archiving
+async def _analyze(zip_path: Path, tmpdir: Path, key: str, progress: Optional[Callable[[str], None]] = None,
+                   timer: Optional[metrics.StageTimer] = None, budget: Optional[Budget] = None,
+                   output: str = "archive") -> dict[str, Any]:
+    timer = timer or metrics.StageTimer()
+    budget = budget or _budget(tmpdir)
+    if output != "archive":
+        key = f"{key}-{output}"
+
+    if cache.CACHE_ENABLED:
+        with timer.stage("cache"):
+            entry = await run_in_threadpool(cache.results.get, key)
+            result = await run_in_threadpool(_from_cache, entry, tmpdir, output) if entry is not None else None
+        if result is not None:
+            metrics.analyses.inc(outcome="cache_hit")
+            if output == "archive":
+                result["upload"] = str(zip_path)
+            return result
 
-        try:
-            methods.unzip(zip_path, repo_dir)
-        except HTTPException:
-            shutil.rmtree(tmpdir, ignore_errors=True)
-            raise
-        except Exception as e:
-            shutil.rmtree(tmpdir, ignore_errors=True)
-            raise HTTPException(status_code=400, detail=f"Failed to unpack zip: {e}")
+    try:
+        result = await workers.run(pipeline.run_analysis, str(zip_path), str(tmpdir), progress, budget, output)
+    except asyncio.CancelledError:
+        budget.cancel()
+        metrics.analyses.inc(outcome="cancelled")
+        raise
+    except Exception:
+        metrics.analyses.inc(outcome="error")
+        raise
 
-        files = methods.get_files(repo_dir)
+    timer.merge(result["timings"])
+    metrics.observe(timer.stages, result["stats"], result["backend"])
+    metrics.analyses.inc(outcome="ok")
 
-        if not files:
-            shutil.rmtree(tmpdir, ignore_errors=True)
-            raise HTTPException(status_code=400, detail="Archive contained no files")
-
-        languages = methods.get_languages(files)
-        frameworks = methods.get_frameworks(files)
-        package_manager = methods.get_packages(files)
-        entry_points = methods.detect_entry_points(repo_dir, files)
-        dependencies = methods.get_dependencies(repo_dir, files)
-        env_files = methods.get_env(repo_dir, files)
-        has_tests = methods.get_test(repo_dir, files)
-        file_tree = methods.make_tree(repo_dir)
-
-        project_name = repo_dir.name
-        summary_bits = []
-
-        if languages:
-            summary_bits.append("built with " + ", ".join(languages))
-
-        if frameworks:
-            summary_bits.append("uses " + ", ".join(frameworks))
-
-        summary = "; ".join(summary_bits) if summary_bits else ""
-
-        languages_txt = "\n".join(languages) if languages else "None detected"
-        frameworks_txt = "\n".join(frameworks) if frameworks else "None detected"
-        package_manager_txt = package_manager or "None detected"
-        entry_points_txt = "\n".join(entry_points) if entry_points else "None detected"
-        project_structure_txt = methods.tree_to_markdown(file_tree)
-
-        if dependencies:
-            parts = []
-            for k, v in dependencies.items():
-                if isinstance(v, list) and v:
-                    parts.append(f"**{k}**\n" + "\n".join(f"- {x}" for x in v))
-                elif isinstance(v, list):
-                    parts.append(f"**{k}**: (none detected)")
-                else:
-                    parts.append(f"**{k}**: {v}")
-            deps_txt = "\n\n".join(parts)
-        else:
-            deps_txt = "None detected"
-
-        env_txt = "\n".join(env_files) if env_files else "None detected"
-        test_status = "Yes" if has_tests else "No"
-        if not TEMPLATE_PATH.exists():
-            template_text = (
-                "# {project_name}\n\n"
-                "{summary}\n\n"
-                "## Detected Languages\n\n"
-                "{languages}\n\n"
-                "## Detected Frameworks\n\n"
-                "{frameworks}\n\n"
-                "## Package Manager\n\n"
-                "{package_manager}\n\n"
-                "## Entry Points\n\n"
-                "{entry_points}\n\n"
-                "## Project Structure\n\n"
-                "```\n"
-                "{project_structure}\n"
-                "```\n\n"
-                "## Dependencies\n\n"
-                "{dependencies}\n\n"
-                "## Environment Configuration\n\n"
-                "{environment_files}\n\n"
-                "## Test Files Detected\n\n"
-                "{test_status}\n"
-            )
-            template_path_text = template_text
-        else:
-            template_path_text = TEMPLATE_PATH.read_text(encoding="utf-8")
-
-        mapping = {
-            "project_name": project_name,
-            "summary": summary,
-            "languages": languages_txt,
-            "frameworks": frameworks_txt,
-            "package_manager": package_manager_txt,
-            "entry_points": entry_points_txt,
-            "project_structure": project_structure_txt,
-            "dependencies": deps_txt,
-            "environment_files": env_txt,
-            "test_status": test_status,
-        }
+    # a scan cut off by the clock depends on machine load, not just the upload, so it isn't
+    # stored under the upload's content key
+    if cache.CACHE_ENABLED and result["stats"].get("scan_stopped") != "time_budget":
+        with timer.stage("cache"):
+            await run_in_threadpool(_to_cache, key, result, output)
 
-        readme = template_path_text
-        for k, v in mapping.items():
-            readme = readme.replace("{" + k + "}", str(v))
-
-        readme = re.sub(r"\{[^\}]+\}", "", readme)
-
-        metadata = {
-            "projectName": project_name,
-            "languages": languages,
-            "frameworks": frameworks,
-            "package_manager": package_manager,
-            "entry_points": entry_points,
-            "dependencies": dependencies,
-            "has_tests": has_tests,
-            "env_files": env_files,
-            "file_tree": file_tree,
-            "summary": summary,
-        }
+    return result
+
+# jobs run under their own, longer time limit
+async def _run_job(zip_path: Path, tmpdir: Path, key: str,
+                   progress: Optional[Callable[[str], None]] = None) -> dict[str, Any]:
+    return await _analyze(zip_path, tmpdir, key, progress, budget=_budget(tmpdir, jobs.JOB_TIMEOUT))
+
+jobs_queue = jobs.JobQueue(runner=_run_job)
 
-        readme_path = repo_dir / "README.md"
-        readme_path.write_text(readme, encoding="utf-8")
+# format=zip streams the repo back with the generated docs; artifacts and patch return only
+# the generated files, as a zip or a unified diff; json returns only the metadata, readme
+# and mermaid source, skipping the diagram render
+@app.post('/analyze', openapi_extra=_upload_body("file"))
+async def generate(request: Request, format: Literal["zip", "artifacts", "patch", "json"] = "zip"):
+    timer = metrics.StageTimer()
+    with timer.stage("upload"):
+        tmpdir, zip_path, key = await _receive(request)
 
+    try:
+        budget = _budget(tmpdir)
+        watcher = asyncio.create_task(_watch_disconnect(request, budget))
         try:
-            diagram_info = diagram.make_docs_with_diagram(
-                repo_dir=repo_dir,
-                project_name=project_name,
-                frameworks=frameworks,
-                dependencies=dependencies,
-                file_tree=file_tree,
-            )
-        except Exception:
-            logger.exception("Diagram generation failed")
-            docs_dir = repo_dir / "docs"
-            fallback_mmd = docs_dir / "diagram.mmd"
+            result = await _analyze(zip_path, tmpdir, key, timer=timer, budget=budget,
+                                    output="json" if format == "json" else "archive")
+        except pipeline.AnalysisError as e:
+            raise HTTPException(status_code=e.status_code, detail=e.detail)
+        finally:
+            watcher.cancel()
+
+        if format == "json":
+            shutil.rmtree(tmpdir, ignore_errors=True)
+            body = {k: result[k] for k in ("metadata", "readme", "mermaid")}
+            return JSONResponse(body, headers={"Server-Timing": timer.header()})
+
+        response = await _result_response(result, format, cleanup_dirs=[tmpdir])
+        response.headers["Server-Timing"] = timer.header()
+        return response
+
+    except BaseException:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+        raise
+
+# folder name for a batch item inside the combined archive, unique within the batch
+def _batch_name(filename: Optional[str], taken: set[str]) -> str:
+    stem = re.sub(r"[^A-Za-z0-9._-]+", "_", Path(filename or "repo").stem).strip("._") or "repo"
+    name = stem
+    n = 2
+    while name in taken:
+        name = f"{stem}-{n}"
+        n += 1
+    taken.add(name)
+    return name
+
+# batch items are dicts: source (the upload or bundled file name) plus either tmpdir,
+# zip_path and key once staged, or error when it couldn't be; a bad upload becomes a
+# failed item instead of failing the batch
+
+# copies each zip of a bundle upload into its own temp dir
+def _unbundle(zip_path: Path, infos: list[Any]) -> list[dict[str, Any]]:
+    Budget().check_archive(infos)
+    items: list[dict[str, Any]] = []
+
+    try:
+        for info in infos:
+            item: dict[str, Any] = {"source": info.filename}
+            items.append(item)
+            # members get the same size and zip checks as a direct upload, failing on their own
+            if info.file_size > MAX_UPLOAD:
+                item["error"] = {"status_code": 413, "detail": "Upload too large"}
+                continue
+
+            item["tmpdir"] = tmpdir = _new_tmpdir()
+            hasher = hashlib.sha256()
             try:
-                docs_dir.mkdir(parents=True, exist_ok=True)
-                fallback_mmd.write_text("flowchart TD\n  A[Architecture diagram unavailable]\n", encoding="utf-8")
-                diagram_info = {"mmd": str(fallback_mmd), "svg": None, "rendered": False}
-            except Exception:
-                diagram_info = {"mmd": None, "svg": None, "rendered": False}
-
-        if diagram_info.get("rendered") and diagram_info.get("svg"):
-            readme += "\n\n## Automatically generated architecture diagram\n\n"
-            readme += f"![Architecture](docs/diagram.svg)\n"
-        else:
-            mmd_path = diagram_info.get("mmd")
-            
-            if mmd_path:
-                try:
-                    mermaid_source = Path(mmd_path).read_text(encoding="utf-8")
-                except Exception:
-                    mermaid_source = ""
-                
-                if mermaid_source:
-                    readme += "\n\n## Automatically generated architecture diagram (Mermaid)\n\n"
-                    readme += "```mermaid\n" + mermaid_source + "\n```\n"
+                member = archive.extract_member(zip_path, info, tmpdir / Path(info.filename).name, hasher)
+                methods.check_zip(member)
+            except (HTTPException, zipfile.BadZipFile, zlib.error) as e:
+                shutil.rmtree(item.pop("tmpdir"), ignore_errors=True)
+                item["error"] = ({"status_code": e.status_code, "detail": e.detail} if isinstance(e, HTTPException)
+                                 else {"status_code": 400, "detail": f"Unreadable bundle member: {e}"})
+                continue
+            item["zip_path"] = member
+            item["key"] = _cache_key(hasher.hexdigest())
+    except BaseException:
+        for item in items:
+            if "tmpdir" in item:
+                shutil.rmtree(item["tmpdir"], ignore_errors=True)
+        raise
 
-        readme_path.write_text(readme, encoding="utf-8")
+    return items
 
-        safe_name = (project_name or "project").replace(" ", "_")
-        download_filename = f"{safe_name}.zip"
+# analyzes one batch item into its manifest entry; failures stay in the entry
+async def _analyze_item(name: str, item: dict[str, Any], budget: Budget) -> dict[str, Any]:
+    entry: dict[str, Any] = {"name": name, "source": item["source"]}
+    if "error" in item:
+        entry.update(status="failed", error=item["error"])
+        return entry
 
-        return methods.stream_dir(repo_dir, download_filename)
+    try:
+        result = await _analyze(item["zip_path"], item["tmpdir"], item["key"], budget=budget)
+    except (pipeline.AnalysisError, HTTPException) as e:
+        entry.update(status="failed", error={"status_code": e.status_code, "detail": e.detail})
+        return entry
+    except Exception as e:
+        logger.exception("Batch item %s failed", item["source"])
+        entry.update(status="failed", error={"status_code": 500, "detail": f"Analysis failed: {e}"})
+        return entry
+
+    metadata = {k: v for k, v in result["metadata"].items() if k != "file_tree"}
+    entry.update(status="done", upload=result["upload"], generated=result["generated"], metadata=metadata)
+    return entry
+
+# analyzes several zips, or one zip of zips, in parallel on the worker pool and returns one
+# archive with each repo's output under its own folder and a manifest.json describing them.
+# format=artifacts puts only the generated files in each folder
+@app.post("/analyze/batch", openapi_extra=_upload_body("files", many=True))
+async def analyze_batch(request: Request, format: Literal["zip", "artifacts"] = "zip"):
+    items = await _receive_all(request, "files", MAX_BATCH_UPLOAD, max_files=MAX_BATCH_REPOS, strict=False)
+    try:
 
-    except Exception:
-        shutil.rmtree(tmpdir, ignore_errors=True)
+        if len(items) == 1 and "error" not in items[0]:
+            infos = await run_in_threadpool(archive.bundle_members, items[0]["zip_path"])
+            if infos:
+                if len(infos) > MAX_BATCH_REPOS:
+                    raise HTTPException(status_code=413, detail=f"Batch has more than {MAX_BATCH_REPOS} archives")
+                outer = items.pop()
+                try:
+                    items.extend(await run_in_threadpool(_unbundle, outer["zip_path"], infos))
+                finally:
+                    shutil.rmtree(outer["tmpdir"], ignore_errors=True)
+
+        taken: set[str] = set()
+        names = [_batch_name(item["source"], taken) for item in items]
+        # each deadline starts when its analysis gets a worker, not while it waits for one
+        budgets = [_budget(item["tmpdir"]) if "tmpdir" in item else Budget() for item in items]
+        watcher = asyncio.create_task(_watch_disconnect(request, *budgets))
+        try:
+            entries = await asyncio.gather(*(
+                _analyze_item(name, item, budget) for name, item, budget in zip(names, items, budgets)))
+        finally:
+            watcher.cancel()
+
+        parts = [(e["name"], Path(e.pop("upload")), Path(e.pop("generated"))) for e in entries if "upload" in e]
+        manifest = {
+            "repos": entries,
+            "done": sum(e["status"] == "done" for e in entries),
+            "failed": sum(e["status"] == "failed" for e in entries),
+        }
+        chunks = archive.stream_batch_archive(parts, json.dumps(manifest, indent=2).encode("utf-8"),
+                                              artifacts_only=format == "artifacts")
+        # the item temp dirs now belong to the response, which removes them once it's sent
+        return methods.stream_zip(chunks, "batch.zip", cleanup_dirs=[item["tmpdir"] for item in items if "tmpdir" in item])
+    except BaseException:
+        for item in items:
+            if "tmpdir" in item:
+                shutil.rmtree(item["tmpdir"], ignore_errors=True)
         raise
 
+@app.post("/jobs", status_code=202, openapi_extra=_upload_body("file"))
+async def create_job(request: Request) -> dict[str, Any]:
+    tmpdir, zip_path, key = await _receive(request)
+    job = jobs_queue.submit(zip_path, tmpdir, key)
+    return job.info()
+
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: str) -> dict[str, Any]:
+    job = jobs_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired job")
+    return job.info()
+
+@app.get("/jobs/{job_id}/result")
+async def job_result(job_id: str, format: Literal["zip", "artifacts", "patch"] = "zip"):
+    job = jobs_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired job")
+    if job.status == "failed" and job.error:
+        raise HTTPException(status_code=job.error["status_code"], detail=job.error["detail"])
+    if job.status != "done" or not job.result:
+        raise HTTPException(status_code=409, detail=f"Job is {job.status}")
+
+    # the job keeps its temp dir until it expires, so nothing is removed after the response
+    return await _result_response(job.result, format)
+
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,133 @@
+# production entry point: a supervisor running several uvicorn worker processes on one socket.
+#   python serve.py
+# DOX_WEB_WORKERS defaults to the cpu count. a worker is recycled after DOX_MAX_REQUESTS
+# requests (plus jitter, so workers don't restart together) or once its memory passes
+# DOX_MAX_WORKER_MEMORY: it stops accepting, drains in-flight requests and jobs, exits,
+# and the supervisor starts a fresh one. result, diagram and scan caches live under
+# DOX_CACHE_DIR and job records under DOX_JOBS_DIR, so every worker shares them. the
+# supervisor hosts the warm mermaid renderers (DOX_RENDER_WORKERS browsers in total) and
+# the workers render through its socket instead of each starting a browser of their own
+import os
+import time
+import logging
+import resource
+import threading
+from typing import Any, Dict, List, Optional
+
+import uvicorn
+from uvicorn.supervisors import Multiprocess
+
+import util.diagram as diagram
+
+CPUS = os.cpu_count() or 1
+WEB_WORKERS = max(1, int(os.getenv("DOX_WEB_WORKERS", str(CPUS))))
+# 0 turns request-count recycling off
+MAX_REQUESTS = int(os.getenv("DOX_MAX_REQUESTS", "1000"))
+MAX_REQUESTS_JITTER = int(os.getenv("DOX_MAX_REQUESTS_JITTER", str(MAX_REQUESTS // 10)))
+# resident memory in bytes, child processes included, after which a worker is recycled; 0 turns it off
+MAX_WORKER_MEMORY = int(os.getenv("DOX_MAX_WORKER_MEMORY", str(1024 * 1024 * 1024)))
+MEMORY_CHECK_INTERVAL = float(os.getenv("DOX_MEMORY_CHECK_INTERVAL", "5"))
+# seconds a stopping worker waits for open connections before closing them
+GRACEFUL_TIMEOUT = float(os.getenv("DOX_GRACEFUL_TIMEOUT", "60"))
+
+# uvicorn configures this logger in every worker
+logger = logging.getLogger("uvicorn.error")
+
+
+# current resident set size; falls back to the peak where /proc isn't available
+def rss_bytes(pid: Any = "self") -> int:
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        if pid != "self":
+            return 0
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # kilobytes on linux, bytes on macos
+        return peak if os.uname().sysname == "Darwin" else peak * 1024
+
+
+# every process below pid: process-pool children and whatever they run (mmdc, node)
+def descendants(pid: int) -> List[int]:
+    children: Dict[int, List[int]] = {}
+    try:
+        entries = os.listdir("/proc")
+    except OSError:
+        return []
+    for entry in entries:
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # the command name in parentheses may itself hold spaces
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, ValueError, IndexError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+
+    found: List[int] = []
+    pending = [pid]
+    while pending:
+        kids = children.get(pending.pop(), [])
+        found.extend(kids)
+        pending.extend(kids)
+    return found
+
+
+# this worker's memory including its child processes, whose pages aren't in its own rss
+def tree_rss_bytes() -> int:
+    return rss_bytes() + sum(rss_bytes(pid) for pid in descendants(os.getpid()))
+
+
+# asks the server to shut down gracefully once the process grows past the memory limit
+def watch_memory(server: uvicorn.Server, limit: int, interval: float) -> None:
+    while not server.should_exit:
+        time.sleep(interval)
+        rss = tree_rss_bytes()
+        if rss > limit:
+            logger.info("Worker [%d] uses %d MiB, recycling", os.getpid(), rss // (1024 * 1024))
+            server.should_exit = True
+            return
+
+
+# runs in each spawned worker process; a class so the supervisor can pickle it
+class Worker:
+    def __init__(self, config: uvicorn.Config) -> None:
+        self.config = config
+
+    def __call__(self, sockets: Optional[List[Any]] = None) -> None:
+        server = uvicorn.Server(self.config)
+        if MAX_WORKER_MEMORY > 0:
+            threading.Thread(target=watch_memory, args=(server, MAX_WORKER_MEMORY, MEMORY_CHECK_INTERVAL),
+                             daemon=True, name="dox-memory-watch").start()
+        server.run(sockets=sockets)
+
+
+def main() -> None:
+    # split the cpus between web workers so the per-process pools don't oversubscribe them;
+    # set before the workers spawn, which inherit the environment
+    os.environ.setdefault("DOX_POOL_SIZE", str(max(1, CPUS // WEB_WORKERS)))
+    # one set of browsers for the whole deploy; its socket reaches the workers the same way
+    diagram.start_renderer_pool()
+
+    config = uvicorn.Config(
+        "main:app",
+        host=os.getenv("HOST", "0.0.0.0"),
+        port=int(os.getenv("PORT", "8000")),
+        workers=WEB_WORKERS,
+        limit_max_requests=MAX_REQUESTS or None,
+        limit_max_requests_jitter=MAX_REQUESTS_JITTER,
+        timeout_graceful_shutdown=GRACEFUL_TIMEOUT,
+        proxy_headers=True,
+    )
+    # the supervisor restarts any worker that exits, which is what makes recycling work,
+    # so it is used even for a single worker
+    sock = config.bind_socket()
+    try:
+        Multiprocess(config, target=Worker(config), sockets=[sock]).run()
+    finally:
+        diagram.stop_renderer_pool()
+
+
+if __name__ == "__main__":
+    main()
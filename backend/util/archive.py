@@ -0,0 +1,489 @@
+import io
+import time
+import difflib
+import zlib
+import struct
+import zipfile
+from pathlib import Path, PurePosixPath
+from typing import Dict, Any, Iterable, List, Optional, Tuple, Iterator, BinaryIO
+from fastapi import HTTPException
+
+try:
+    from .filetree import FileTree, DIR
+except ImportError:
+    from util.filetree import FileTree, DIR
+
+ZIP64_LIMIT = 0xFFFFFFFF
+COPY_CHUNK = 1024 * 64
+
+
+# a repo read straight from the uploaded zip; members are only decompressed when read
+class ZipRepo:
+    root = Path("")
+
+    def __init__(self, zip_path: Path, budget: Any = None) -> None:
+        self.zip_path = zip_path
+        self.zf = zipfile.ZipFile(zip_path, "r")
+        self.infos: Dict[str, zipfile.ZipInfo] = {}
+
+        try:
+            if budget is not None:
+                budget.check_archive(self.zf.infolist())
+            for info in self.zf.infolist():
+                p = PurePosixPath(info.filename)
+
+                if p.is_absolute() or ".." in p.parts:
+                    raise HTTPException(status_code=400, detail="Invalid archive entry")
+                if not info.is_dir():
+                    self.infos[str(p)] = info
+        except Exception:
+            self.zf.close()
+            raise
+
+    def close(self) -> None:
+        self.zf.close()
+
+    def __enter__(self) -> "ZipRepo":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def path(self, name: str) -> Path:
+        return Path(name)
+
+    def exists(self, path: Path) -> bool:
+        return path.as_posix() in self.infos
+
+    # (crc32, size) from the central directory, identifying a member's content without reading it
+    def fingerprint(self, path: Path) -> Optional[Tuple[int, int]]:
+        info = self.infos.get(path.as_posix())
+        return (info.CRC, info.file_size) if info else None
+
+    def size(self, path: Path) -> Optional[int]:
+        info = self.infos.get(path.as_posix())
+        return info.file_size if info else None
+
+    def read_text(self, path: Path, max_chars: Optional[int] = None) -> str:
+        info = self.infos.get(path.as_posix())
+        if info is None:
+            return ""
+
+        try:
+            with self.zf.open(info) as raw:
+                with io.TextIOWrapper(raw, encoding="utf-8", errors="ignore") as f:
+                    return f.read(max_chars)
+        except Exception:
+            return ""
+
+    def list_files(self, entries: int = 2000) -> List[Path]:
+        files = []
+
+        for name in self.infos:
+            files.append(Path(name))
+            if len(files) >= entries:
+                break
+
+        return files
+
+    # same shape as DirRepo.tree, built from the central directory
+    def tree(self, max_depth: int = 6) -> FileTree:
+        root: Dict[str, Any] = {"name": "repo", "type": "dir", "dirs": {}, "files": []}
+
+        for name, info in self.infos.items():
+            parts = name.split("/")
+            if len(parts) > max_depth:
+                parts_dirs = parts[:max_depth]
+                leaf = None
+            else:
+                parts_dirs = parts[:-1]
+                leaf = parts[-1]
+
+            node = root
+            for d in parts_dirs:
+                node = node["dirs"].setdefault(d, {"name": d, "type": "dir", "dirs": {}, "files": []})
+
+            if leaf is not None:
+                node["files"].append({"name": leaf, "type": "file", "size": info.file_size})
+
+        tree = FileTree()
+        stack = [(root, -1, 0)]
+
+        while stack:
+            node, parent, depth = stack.pop()
+            if node["type"] == "file":
+                tree.add(node["name"], parent, depth, node["size"])
+                continue
+
+            i = tree.add(node["name"], parent, depth, DIR)
+            dirs = sorted(node["dirs"].values(), key=lambda x: x["name"].lower())
+            files = sorted(node["files"], key=lambda x: x["name"].lower())
+            children = (dirs + files)[:200]
+            stack.extend((c, i, depth + 1) for c in reversed(children))
+
+        return tree
+
+
+# minimal zip writer that can copy already-compressed members byte-for-byte. it yields the
+# archive's bytes instead of writing them, so a response can go out while it's being built;
+# only the central directory entries are held until the end
+class ZipWriter:
+    def __init__(self) -> None:
+        self.offset = 0
+        self.central: List[bytes] = []
+
+    def _emit(self, data: bytes) -> bytes:
+        self.offset += len(data)
+        return data
+
+    def _local_header(self, name_bytes: bytes, flags: int, method: int, date_time: Tuple[int, ...],
+                      crc: int, compress_size: int, file_size: int, zip64: bool, version: int) -> bytes:
+        dostime, dosdate = _dos_time(date_time)
+        extra = b""
+        if zip64:
+            extra = struct.pack("<HHQQ", 0x0001, 16, file_size, compress_size)
+
+        return struct.pack(
+            "<IHHHHHIIIHH", 0x04034B50, version, flags, method, dostime, dosdate, crc,
+            0xFFFFFFFF if zip64 else compress_size,
+            0xFFFFFFFF if zip64 else file_size,
+            len(name_bytes), len(extra),
+        ) + name_bytes + extra
+
+    def _central_entry(self, name_bytes: bytes, flags: int, method: int, date_time: Tuple[int, ...],
+                       crc: int, compress_size: int, file_size: int, external_attr: int,
+                       create_system: int, version: int, header_offset: int) -> None:
+        dostime, dosdate = _dos_time(date_time)
+        zip64 = compress_size >= ZIP64_LIMIT or file_size >= ZIP64_LIMIT
+
+        cd_extra_fields = []
+        cd_sizes = (compress_size, file_size)
+        if zip64:
+            cd_extra_fields.extend([file_size, compress_size])
+            cd_sizes = (0xFFFFFFFF, 0xFFFFFFFF)
+        cd_offset = header_offset
+        if header_offset >= ZIP64_LIMIT:
+            cd_extra_fields.append(header_offset)
+            cd_offset = 0xFFFFFFFF
+        cd_extra = b""
+        if cd_extra_fields:
+            cd_extra = struct.pack("<HH", 0x0001, 8 * len(cd_extra_fields)) + struct.pack(f"<{len(cd_extra_fields)}Q", *cd_extra_fields)
+            version = max(version, 45)
+
+        self.central.append(struct.pack(
+            "<IBBHHHHHIIIHHHHHII", 0x02014B50, version, create_system, version, flags, method,
+            dostime, dosdate, crc, cd_sizes[0], cd_sizes[1],
+            len(name_bytes), len(cd_extra), 0, 0, 0, external_attr, cd_offset,
+        ) + name_bytes + cd_extra)
+
+    # a member whose crc and sizes are known up front, so they go in the local header
+    def _add(self, name_bytes: bytes, flags: int, method: int, date_time: Tuple[int, ...],
+             crc: int, compress_size: int, file_size: int, external_attr: int,
+             create_system: int, payload: Iterator[bytes], version: int = 20) -> Iterator[bytes]:
+        header_offset = self.offset
+        zip64 = compress_size >= ZIP64_LIMIT or file_size >= ZIP64_LIMIT
+        version = max(version, 45 if zip64 else 20)
+
+        yield self._emit(self._local_header(name_bytes, flags, method, date_time, crc,
+                                            compress_size, file_size, zip64, version))
+        for chunk in payload:
+            yield self._emit(chunk)
+
+        self._central_entry(name_bytes, flags, method, date_time, crc, compress_size, file_size,
+                            external_attr, create_system, version, header_offset)
+
+    # copies a member's compressed bytes straight from the source archive, optionally renamed
+    def add_raw(self, src: BinaryIO, info: zipfile.ZipInfo, name: Optional[str] = None) -> Iterator[bytes]:
+        src.seek(info.header_offset)
+        header = src.read(30)
+        if len(header) != 30 or header[:4] != b"PK\x03\x04":
+            raise zipfile.BadZipFile(f"Bad local header for {info.filename}")
+        name_len, extra_len = struct.unpack("<HH", header[26:30])
+        src.seek(info.header_offset + 30 + name_len + extra_len)
+
+        def payload(remaining: int = info.compress_size) -> Iterator[bytes]:
+            while remaining > 0:
+                chunk = src.read(min(COPY_CHUNK, remaining))
+                if not chunk:
+                    raise zipfile.BadZipFile(f"Truncated member {info.filename}")
+                remaining -= len(chunk)
+                yield chunk
+
+        name_bytes, utf8_flag = _encode_name(name or info.filename)
+        # sizes and crc go in the local header, so no data descriptor follows
+        flags = (info.flag_bits & ~0x0808) | utf8_flag
+
+        yield from self._add(name_bytes, flags, info.compress_type, info.date_time, info.CRC,
+                             info.compress_size, info.file_size, info.external_attr, info.create_system,
+                             payload(), version=info.extract_version)
+
+    # deflates and adds a generated file
+    def add_bytes(self, name: str, data: bytes, date_time: Optional[Tuple[int, ...]] = None) -> Iterator[bytes]:
+        comp = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+        compressed = comp.compress(data) + comp.flush()
+        name_bytes, utf8_flag = _encode_name(name)
+
+        yield from self._add(name_bytes, utf8_flag, zipfile.ZIP_DEFLATED, date_time or time.localtime()[:6],
+                             zlib.crc32(data), len(compressed), len(data), 0o100644 << 16, 3, iter([compressed]))
+
+    # deflates a member as its chunks arrive. crc and sizes are only known at the end, so the
+    # local header leaves them zero and a data descriptor follows the data. whether sizes are
+    # zip64 has to be settled before any data is seen, hence size_hint
+    def add_stream(self, name: str, chunks: Iterable[bytes], size_hint: int = 0,
+                   date_time: Optional[Tuple[int, ...]] = None,
+                   external_attr: int = 0o100644 << 16) -> Iterator[bytes]:
+        header_offset = self.offset
+        name_bytes, utf8_flag = _encode_name(name)
+        flags = utf8_flag | 0x08
+        date_time = date_time or time.localtime()[:6]
+        # leaves room for deflate's overhead on incompressible data
+        zip64 = size_hint + size_hint // 100 + COPY_CHUNK >= ZIP64_LIMIT
+        version = 45 if zip64 else 20
+
+        yield self._emit(self._local_header(name_bytes, flags, zipfile.ZIP_DEFLATED, date_time, 0, 0, 0, zip64, version))
+
+        comp = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+        crc = file_size = compress_size = 0
+        for chunk in chunks:
+            crc = zlib.crc32(chunk, crc)
+            file_size += len(chunk)
+            out = comp.compress(chunk)
+            if out:
+                compress_size += len(out)
+                yield self._emit(out)
+        out = comp.flush()
+        compress_size += len(out)
+        yield self._emit(out)
+
+        if zip64:
+            yield self._emit(struct.pack("<IIQQ", 0x08074B50, crc, compress_size, file_size))
+        elif compress_size >= ZIP64_LIMIT or file_size >= ZIP64_LIMIT:
+            raise ValueError(f"{name} grew past the size it was added with")
+        else:
+            yield self._emit(struct.pack("<IIII", 0x08074B50, crc, compress_size, file_size))
+
+        self._central_entry(name_bytes, flags, zipfile.ZIP_DEFLATED, date_time, crc, compress_size,
+                            file_size, external_attr, 3, version, header_offset)
+
+    # the central directory and end records
+    def close(self) -> Iterator[bytes]:
+        cd_start = self.offset
+        for entry in self.central:
+            yield self._emit(entry)
+        cd_size = self.offset - cd_start
+        count = len(self.central)
+
+        if count >= 0xFFFF or cd_start >= ZIP64_LIMIT or cd_size >= ZIP64_LIMIT:
+            zip64_end = self.offset
+            yield self._emit(struct.pack("<IQHHIIQQQQ", 0x06064B50, 44, 45, 45, 0, 0, count, count, cd_size, cd_start))
+            yield self._emit(struct.pack("<IIQI", 0x07064B50, 0, zip64_end, 1))
+            yield self._emit(struct.pack("<IHHHHIIH", 0x06054B50, 0, 0, 0xFFFF, 0xFFFF, 0xFFFFFFFF, 0xFFFFFFFF, 0))
+        else:
+            yield self._emit(struct.pack("<IHHHHIIH", 0x06054B50, 0, 0, count, count, cd_size, cd_start, 0))
+
+
+# joins the writer's small pieces (headers, deflate output) into writes of about size bytes
+def _coalesce(chunks: Iterable[bytes], size: int = COPY_CHUNK) -> Iterator[bytes]:
+    buf: List[bytes] = []
+    n = 0
+    for chunk in chunks:
+        if not chunk:
+            continue
+        buf.append(chunk)
+        n += len(chunk)
+        if n >= size:
+            yield b"".join(buf)
+            buf = []
+            n = 0
+    if buf:
+        yield b"".join(buf)
+
+
+def _generated_files(generated_dir: Path) -> Dict[str, Path]:
+    generated = {}
+    for p in sorted(generated_dir.rglob("*")):
+        if p.is_file():
+            generated[p.relative_to(generated_dir).as_posix()] = p
+    return generated
+
+
+# one repo's output: the upload's members, copied without recompression, then the generated
+# files, which replace members of the same name
+def _repo_members(writer: ZipWriter, zip_path: Path, generated_dir: Path, prefix: str = "") -> Iterator[bytes]:
+    generated = _generated_files(generated_dir)
+
+    with zipfile.ZipFile(zip_path, "r") as src, zip_path.open("rb") as raw:
+        for info in src.infolist():
+            if info.filename in generated:
+                continue
+            yield from writer.add_raw(raw, info, name=prefix + info.filename)
+
+    yield from _generated_members(writer, generated, prefix)
+
+
+def _generated_members(writer: ZipWriter, generated: Dict[str, Path], prefix: str = "") -> Iterator[bytes]:
+    for name, p in generated.items():
+        yield from writer.add_bytes(prefix + name, p.read_bytes())
+
+
+# the result archive, produced as it's read: nothing is written to disk and memory stays at
+# one copy chunk plus the central directory, so the first bytes go out right away
+def stream_archive_from_zip(zip_path: Path, generated_dir: Path) -> Iterator[bytes]:
+    writer = ZipWriter()
+
+    def chunks() -> Iterator[bytes]:
+        yield from _repo_members(writer, zip_path, generated_dir)
+        yield from writer.close()
+
+    return _coalesce(chunks())
+
+
+# just the generated files, for clients that already have their repo
+def stream_artifacts(generated_dir: Path) -> Iterator[bytes]:
+    writer = ZipWriter()
+
+    def chunks() -> Iterator[bytes]:
+        yield from _generated_members(writer, _generated_files(generated_dir))
+        yield from writer.close()
+
+    return _coalesce(chunks())
+
+
+# git-style unified diff taking the upload to the upload plus its generated files, for
+# `git apply` or `patch -p1` from the zip's root. unchanged files are left out
+def artifacts_patch(zip_path: Path, generated_dir: Path) -> str:
+    generated = _generated_files(generated_dir)
+    parts: List[str] = []
+
+    with zipfile.ZipFile(zip_path, "r") as zf:
+        existing = {i.filename: i for i in zf.infolist() if i.filename in generated and not i.is_dir()}
+        for name, p in generated.items():
+            old = zf.read(existing[name]) if name in existing else None
+            parts.append(_file_diff(name, old, p.read_bytes()))
+
+    return "".join(parts)
+
+
+def _diff_lines(data: bytes) -> List[str]:
+    lines = data.decode("utf-8").splitlines(keepends=True)
+    if lines and not lines[-1].endswith("\n"):
+        lines[-1] += "\n\\ No newline at end of file\n"
+    return lines
+
+
+def _file_diff(name: str, old: Optional[bytes], new: bytes) -> str:
+    if old == new:
+        return ""
+
+    header = f"diff --git a/{name} b/{name}\n"
+    if old is None:
+        header += "new file mode 100644\n"
+
+    try:
+        old_lines = _diff_lines(old) if old is not None else []
+        new_lines = _diff_lines(new)
+    except UnicodeDecodeError:
+        return header + f"Binary files {'/dev/null' if old is None else 'a/' + name} and b/{name} differ\n"
+
+    body = difflib.unified_diff(old_lines, new_lines, "/dev/null" if old is None else f"a/{name}", f"b/{name}")
+    return header + "".join(body)
+
+
+# writes the result archive to out_path, for callers that need a file
+def build_archive_from_zip(zip_path: Path, generated_dir: Path, out_path: Path) -> Path:
+    with out_path.open("wb") as out:
+        for chunk in stream_archive_from_zip(zip_path, generated_dir):
+            out.write(chunk)
+    return out_path
+
+
+# one zip with each repo's output under its own folder and the manifest at the top.
+# parts are (folder, upload zip, generated dir); artifacts_only leaves the uploads out
+def stream_batch_archive(parts: List[Tuple[str, Path, Path]], manifest: bytes,
+                         artifacts_only: bool = False) -> Iterator[bytes]:
+    writer = ZipWriter()
+
+    def chunks() -> Iterator[bytes]:
+        yield from writer.add_bytes("manifest.json", manifest)
+        for folder, zip_path, generated_dir in parts:
+            if artifacts_only:
+                yield from _generated_members(writer, _generated_files(generated_dir), prefix=f"{folder}/")
+            else:
+                yield from _repo_members(writer, zip_path, generated_dir, prefix=f"{folder}/")
+        yield from writer.close()
+
+    return _coalesce(chunks())
+
+
+def _read_chunks(path: Path) -> Iterator[bytes]:
+    with path.open("rb") as f:
+        while True:
+            chunk = f.read(COPY_CHUNK)
+            if not chunk:
+                break
+            yield chunk
+
+
+# a directory zipped on the fly, each file deflated as it's read. directories are implied
+# by the files inside them
+def stream_dir_archive(root_dir: Path) -> Iterator[bytes]:
+    writer = ZipWriter()
+
+    def chunks() -> Iterator[bytes]:
+        for p in sorted(root_dir.rglob("*")):
+            if not p.is_file():
+                continue
+            st = p.stat()
+            yield from writer.add_stream(p.relative_to(root_dir).as_posix(), _read_chunks(p), size_hint=st.st_size,
+                                         date_time=time.localtime(st.st_mtime)[:6],
+                                         external_attr=(st.st_mode & 0xFFFF) << 16)
+        yield from writer.close()
+
+    return _coalesce(chunks())
+
+
+# the repo zips inside a bundle upload, i.e. a zip holding nothing but other zips.
+# None for an ordinary repo, which may well contain a few zips of its own
+def bundle_members(zip_path: Path) -> Optional[List[zipfile.ZipInfo]]:
+    try:
+        with zipfile.ZipFile(zip_path, "r") as zf:
+            infos = [i for i in zf.infolist()
+                     if not i.is_dir() and not i.filename.startswith("__MACOSX/")
+                     and PurePosixPath(i.filename).name != ".DS_Store"]
+    except zipfile.BadZipFile:
+        return None
+
+    if infos and all(i.filename.lower().endswith(".zip") for i in infos):
+        return infos
+    return None
+
+
+# copies one bundled zip out to dest, feeding its bytes to hasher on the way
+def extract_member(zip_path: Path, info: zipfile.ZipInfo, dest: Path, hasher: Any = None) -> Path:
+    with zipfile.ZipFile(zip_path, "r") as zf, zf.open(info) as src, dest.open("wb") as out:
+        while True:
+            chunk = src.read(COPY_CHUNK)
+            if not chunk:
+                break
+            if hasher is not None:
+                hasher.update(chunk)
+            out.write(chunk)
+
+    return dest
+
+
+# zip stores times as packed dos date/time words
+def _dos_time(date_time: Tuple[int, ...]) -> Tuple[int, int]:
+    year, month, day, hour, minute, second = date_time[:6]
+    year = min(max(year, 1980), 2107)
+    dostime = (hour << 11) | (minute << 5) | (second // 2)
+    dosdate = ((year - 1980) << 9) | (month << 5) | day
+    return dostime, dosdate
+
+
+# encodes a member name the way zipfile does, flagging utf-8 when needed
+def _encode_name(name: str) -> Tuple[bytes, int]:
+    try:
+        return name.encode("ascii"), 0
+    except UnicodeEncodeError:
+        return name.encode("utf-8"), 0x800
@@ -0,0 +1,92 @@
+import os
+import time
+import zipfile
+from pathlib import Path
+from typing import Iterable, Optional
+from fastapi import HTTPException
+
+# per-request limits; 0 turns a limit off
+MAX_UNCOMPRESSED = int(os.getenv("DOX_MAX_UNCOMPRESSED_BYTES", str(1024 * 1024 * 1024)))
+MAX_MEMBERS = int(os.getenv("DOX_MAX_MEMBERS", "100000"))
+MAX_RATIO = float(os.getenv("DOX_MAX_COMPRESSION_RATIO", "200"))
+# members smaller than this are exempt from the ratio check; tiny files compress well legitimately
+RATIO_MIN_BYTES = int(os.getenv("DOX_RATIO_MIN_BYTES", str(1024 * 1024)))
+REQUEST_TIMEOUT = float(os.getenv("DOX_REQUEST_TIMEOUT", "120"))
+MAX_TMP_BYTES = int(os.getenv("DOX_MAX_TMP_BYTES", str(2 * 1024 * 1024 * 1024)))
+# how often the cancel marker file is checked
+CANCEL_POLL = 0.25
+
+
+# resource budget for one request. plain attributes so it crosses process pools; the
+# deadline is wall-clock time and cancellation is a marker file, both visible to any
+# process. is_set() makes it usable wherever a threading.Event cancel flag is accepted.
+# the deadline only runs once start() is called, so time spent queued for a worker is free
+class Budget:
+    def __init__(self, timeout: float = REQUEST_TIMEOUT, cancel_path: Optional[str] = None) -> None:
+        self.timeout = timeout
+        self.deadline: Optional[float] = None
+        self.cancel_path = cancel_path
+        self.disk_used = 0
+        self._cancelled = False
+        self._polled = 0.0
+
+    # starts the clock; called by the pipeline when the analysis begins on a worker
+    def start(self) -> None:
+        if self.deadline is None and self.timeout > 0:
+            self.deadline = time.time() + self.timeout
+
+    def remaining(self) -> Optional[float]:
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.time())
+
+    def cancel(self) -> None:
+        self._cancelled = True
+        if self.cancel_path:
+            try:
+                Path(self.cancel_path).touch()
+            except OSError:
+                pass
+
+    def cancelled(self) -> bool:
+        if self._cancelled:
+            return True
+
+        now = time.monotonic()
+        if self.cancel_path and now - self._polled >= CANCEL_POLL:
+            self._polled = now
+            self._cancelled = os.path.exists(self.cancel_path)
+        return self._cancelled
+
+    def is_set(self) -> bool:
+        return self.cancelled() or (self.deadline is not None and time.time() >= self.deadline)
+
+    # raises once the request is cancelled or out of time; called between units of work
+    def check(self) -> None:
+        if self.cancelled():
+            raise HTTPException(status_code=503, detail="Analysis was cancelled")
+        if self.deadline is not None and time.time() >= self.deadline:
+            raise HTTPException(status_code=503, detail="Analysis exceeded its time budget")
+
+    # counts bytes written to the request's temp dir
+    def charge_disk(self, nbytes: int) -> None:
+        self.disk_used += nbytes
+        if MAX_TMP_BYTES and self.disk_used > MAX_TMP_BYTES:
+            raise HTTPException(status_code=413, detail="Archive needs more temporary disk than allowed")
+
+    # rejects archives from their central directory alone, before anything is decompressed
+    def check_archive(self, infos: Iterable[zipfile.ZipInfo]) -> None:
+        members = 0
+        total = 0
+
+        for info in infos:
+            members += 1
+            total += info.file_size
+
+            if MAX_MEMBERS and members > MAX_MEMBERS:
+                raise HTTPException(status_code=413, detail=f"Archive has more than {MAX_MEMBERS} members")
+            if MAX_UNCOMPRESSED and total > MAX_UNCOMPRESSED:
+                raise HTTPException(status_code=413, detail="Archive expands beyond the allowed size")
+            if (MAX_RATIO and info.file_size >= RATIO_MIN_BYTES
+                    and info.file_size > MAX_RATIO * max(info.compress_size, 1)):
+                raise HTTPException(status_code=413, detail=f"Suspicious compression ratio in {info.filename}")
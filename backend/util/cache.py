@@ -0,0 +1,395 @@
+import os
+import time
+import uuid
+import hashlib
+import shutil
+import sqlite3
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Union
+
+CACHE_ROOT = Path(os.getenv("DOX_CACHE_DIR", str(Path(tempfile.gettempdir()) / "dox_cache")))
+CACHE_ENABLED = os.getenv("DOX_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+RESULT_CACHE_MAX_BYTES = int(os.getenv("DOX_CACHE_MAX_BYTES", str(1024 * 1024 * 1024)))
+RESULT_CACHE_TTL = int(os.getenv("DOX_CACHE_TTL", str(24 * 60 * 60)))
+DIAGRAM_CACHE_MAX_BYTES = int(os.getenv("DOX_DIAGRAM_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+DIAGRAM_CACHE_TTL = int(os.getenv("DOX_DIAGRAM_CACHE_TTL", str(7 * 24 * 60 * 60)))
+SCAN_CACHE_MAX_BYTES = int(os.getenv("DOX_SCAN_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+SCAN_CACHE_TTL = int(os.getenv("DOX_SCAN_CACHE_TTL", str(7 * 24 * 60 * 60)))
+# seconds between full walks of a disk cache; in between, a put only walks it once the
+# running size estimate passes max_bytes
+CACHE_EVICT_INTERVAL = float(os.getenv("DOX_CACHE_EVICT_INTERVAL", "300"))
+# in-process front of the shared scan cache
+SCAN_MEMORY_MAX_BYTES = int(os.getenv("DOX_SCAN_MEMORY_MAX_BYTES", str(16 * 1024 * 1024)))
+# writes buffered before the shared store is updated in one transaction
+SHARED_FLUSH_EVERY = 256
+
+logger = logging.getLogger(__name__)
+
+
+# short hash of the given source files, for cache keys that must change when the code
+# producing the cached values does
+def code_version(*paths: Union[str, Path]) -> str:
+    h = hashlib.sha256()
+    for path in sorted(str(p) for p in paths):
+        try:
+            h.update(Path(path).read_bytes())
+        except OSError:
+            h.update(path.encode("utf-8"))
+    return h.hexdigest()[:12]
+
+
+def _file_size(path: Path) -> int:
+    try:
+        return os.stat(path).st_size
+    except OSError:
+        return 0
+
+
+# disk-backed cache of small file bundles, size-bounded with LRU eviction and a TTL.
+# entries are published with an atomic rename, so several processes can share a directory
+class DiskCache:
+    def __init__(self, directory: Path, max_bytes: int, ttl: int) -> None:
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        # size as of the last walk plus what this process has put since; other processes'
+        # writes show up at the next walk
+        self._size: Optional[int] = None
+        self._walked = 0.0
+        self._lock = threading.Lock()
+
+    def _entry(self, key: str) -> Path:
+        return self.directory / key[:2] / key
+
+    def _expired(self, entry: Path, now: float) -> bool:
+        try:
+            return self.ttl > 0 and now - entry.stat().st_mtime > self.ttl
+        except FileNotFoundError:
+            return True
+
+    # returns the entry directory on a hit and marks it recently used
+    def get(self, key: str) -> Optional[Path]:
+        entry = self._entry(key)
+        now = time.time()
+
+        if entry.is_dir() and not self._expired(entry, now):
+            try:
+                os.utime(entry, (now, now))
+            except OSError:
+                pass
+            with self._lock:
+                self.hits += 1
+            return entry
+
+        if entry.is_dir():
+            shutil.rmtree(entry, ignore_errors=True)
+        with self._lock:
+            self.misses += 1
+        return None
+
+    # stores files (paths are hard-linked when possible, bytes are written) under key
+    def put(self, key: str, files: Dict[str, Union[Path, bytes]]) -> Optional[Path]:
+        entry = self._entry(key)
+        staging = self.directory / f".tmp-{uuid.uuid4().hex}"
+
+        try:
+            staging.mkdir(parents=True)
+            for name, src in files.items():
+                dest = staging / name
+                dest.parent.mkdir(parents=True, exist_ok=True)
+                if isinstance(src, bytes):
+                    dest.write_bytes(src)
+                else:
+                    try:
+                        os.link(src, dest)
+                    except OSError:
+                        shutil.copyfile(src, dest)
+
+            entry.parent.mkdir(parents=True, exist_ok=True)
+            if entry.exists():
+                shutil.rmtree(entry, ignore_errors=True)
+            os.replace(staging, entry)
+        except Exception:
+            logger.exception("Failed writing cache entry %s", key)
+            shutil.rmtree(staging, ignore_errors=True)
+            return None
+
+        added = sum(len(src) if isinstance(src, bytes) else _file_size(src) for src in files.values())
+        with self._lock:
+            if self._size is not None:
+                self._size += added
+            due = (self._size is None or self._size > self.max_bytes
+                   or time.monotonic() - self._walked >= CACHE_EVICT_INTERVAL)
+        if due:
+            # the entry is written; a failed trim must not fail the request that wrote it
+            try:
+                self.evict()
+            except Exception:
+                logger.exception("Cache eviction failed in %s", self.directory)
+        return entry
+
+    # walks every entry: drops expired ones, then least recently used ones until under max_bytes
+    def evict(self) -> None:
+        now = time.time()
+        entries = []
+        total = 0
+
+        with self._lock:
+            self._walked = time.monotonic()
+
+        if not self.directory.exists():
+            with self._lock:
+                self._size = 0
+            return
+
+        for shard in self.directory.iterdir():
+            if not shard.is_dir() or shard.name.startswith(".tmp-"):
+                continue
+            try:
+                shard_entries = list(shard.iterdir())
+            except OSError:
+                continue
+            for entry in shard_entries:
+                if self._expired(entry, now):
+                    shutil.rmtree(entry, ignore_errors=True)
+                    continue
+                # other threads and workers remove entries while this walk runs
+                try:
+                    size = sum(f.stat().st_size for f in entry.rglob("*") if f.is_file())
+                    mtime = entry.stat().st_mtime
+                except OSError:
+                    continue
+                entries.append((mtime, size, entry))
+                total += size
+
+        # once over max_bytes, trim to 90% so the next walk is a while off
+        target = self.max_bytes if total <= self.max_bytes else self.max_bytes * 9 // 10
+        entries.sort()
+        for _, size, entry in entries:
+            if total <= target:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+
+        with self._lock:
+            self._size = total
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+
+# in-process LRU of byte values, bounded by total size
+class MemoryCache:
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self.items: "OrderedDict[str, bytes]" = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            value = self.items.get(key)
+            if value is not None:
+                self.items.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+            return value
+
+    def put(self, key: str, value: bytes) -> None:
+        if len(value) > self.max_bytes:
+            return
+
+        with self._lock:
+            old = self.items.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            self.items[key] = value
+            self.size += len(value)
+
+            while self.size > self.max_bytes:
+                _, evicted = self.items.popitem(last=False)
+                self.size -= len(evicted)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+
+# the running byte and row totals live in a one-row table kept current by triggers, so a
+# flush never scans the entries. the totals row is seeded once, when the table is created
+SHARED_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value BLOB, used REAL)",
+    "CREATE INDEX IF NOT EXISTS entries_used ON entries (used)",
+    "CREATE TABLE IF NOT EXISTS totals (id INTEGER PRIMARY KEY CHECK (id = 0), bytes INTEGER, entries INTEGER)",
+    "CREATE TRIGGER IF NOT EXISTS entries_insert AFTER INSERT ON entries BEGIN "
+    "UPDATE totals SET bytes = bytes + length(new.value), entries = entries + 1; END",
+    "CREATE TRIGGER IF NOT EXISTS entries_update AFTER UPDATE OF value ON entries BEGIN "
+    "UPDATE totals SET bytes = bytes + length(new.value) - length(old.value); END",
+    "CREATE TRIGGER IF NOT EXISTS entries_delete AFTER DELETE ON entries BEGIN "
+    "UPDATE totals SET bytes = bytes - length(old.value), entries = entries - 1; END",
+    "INSERT OR IGNORE INTO totals SELECT 0, total(length(value)), count(*) FROM entries",
+)
+
+
+# many small byte values in one sqlite file, shared by every process on the host (web
+# workers and process-pool workers alike), with a MemoryCache in front. writes and
+# recency updates are buffered and committed in batches; flush() forces them out
+class SharedCache:
+    def __init__(self, path: Path, max_bytes: int, memory_bytes: int, ttl: int) -> None:
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.memory = MemoryCache(memory_bytes)
+        self.hits = 0
+        self.misses = 0
+        self._pending: Dict[str, bytes] = {}
+        self._touched: set = set()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid = 0
+        self._lock = threading.Lock()
+
+    # one connection per process; connections must not cross a fork
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None or self._pid != os.getpid():
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), timeout=5.0, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for statement in SHARED_SCHEMA:
+                    conn.execute(statement)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            self._conn = conn
+            self._pid = os.getpid()
+        return self._conn
+
+    # rows last used before this are expired; 0 when there is no ttl
+    def _oldest(self) -> float:
+        return time.time() - self.ttl if self.ttl > 0 else 0.0
+
+    def get(self, key: str) -> Optional[bytes]:
+        value = self.memory.get(key)
+        if value is None:
+            with self._lock:
+                value = self._pending.get(key)
+                if value is None:
+                    try:
+                        row = self._db().execute("SELECT value FROM entries WHERE key = ? AND used >= ?",
+                                                 (key, self._oldest())).fetchone()
+                    except sqlite3.Error:
+                        logger.exception("Shared cache read failed")
+                        row = None
+                    value = row[0] if row else None
+                    if value is not None:
+                        self._touched.add(key)
+            if value is not None:
+                self.memory.put(key, value)
+
+        with self._lock:
+            if value is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return value
+
+    # looks many keys up with one query per SHARED_FLUSH_EVERY keys; returns the ones found
+    def get_many(self, keys: List[str]) -> Dict[str, bytes]:
+        found: Dict[str, bytes] = {}
+        missing = []
+        for key in keys:
+            value = self.memory.get(key)
+            if value is None:
+                missing.append(key)
+            else:
+                found[key] = value
+
+        with self._lock:
+            rest = [k for k in missing if k not in self._pending]
+            found.update((k, self._pending[k]) for k in missing if k in self._pending)
+
+            for i in range(0, len(rest), SHARED_FLUSH_EVERY):
+                chunk = rest[i:i + SHARED_FLUSH_EVERY]
+                try:
+                    rows = self._db().execute(
+                        f"SELECT key, value FROM entries WHERE key IN ({','.join('?' * len(chunk))}) AND used >= ?",
+                        chunk + [self._oldest()]).fetchall()
+                except sqlite3.Error:
+                    logger.exception("Shared cache read failed")
+                    rows = []
+                for k, v in rows:
+                    found[k] = v
+                    self._touched.add(k)
+
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+
+        for key in missing:
+            if key in found:
+                self.memory.put(key, found[key])
+        return found
+
+    def put(self, key: str, value: bytes) -> None:
+        self.memory.put(key, value)
+        with self._lock:
+            self._pending[key] = value
+            full = len(self._pending) >= SHARED_FLUSH_EVERY
+        if full:
+            self.flush()
+
+    # commits buffered writes, drops expired entries, then trims the oldest ones once over max_bytes
+    def flush(self) -> None:
+        with self._lock:
+            if not self._pending and not self._touched:
+                return
+            pending, self._pending = self._pending, {}
+            touched, self._touched = self._touched, set()
+            now = time.time()
+
+            try:
+                db = self._db()
+                db.execute("BEGIN IMMEDIATE")
+                try:
+                    db.executemany("INSERT INTO entries (key, value, used) VALUES (?, ?, ?) ON CONFLICT (key) "
+                                   "DO UPDATE SET value = excluded.value, used = excluded.used",
+                                   [(k, v, now) for k, v in pending.items()])
+                    db.executemany("UPDATE entries SET used = ? WHERE key = ?", [(now, k) for k in touched])
+                    if self.ttl > 0:
+                        db.execute("DELETE FROM entries WHERE used < ?", (now - self.ttl,))
+                    total, count = db.execute("SELECT bytes, entries FROM totals").fetchone()
+                    if total > self.max_bytes:
+                        # drop about a tenth more than needed so trimming doesn't run on every flush
+                        excess = total - self.max_bytes * 0.9
+                        db.execute("DELETE FROM entries WHERE key IN (SELECT key FROM entries ORDER BY used LIMIT ?)",
+                                   (int(count * excess / total) + 1,))
+                    db.execute("COMMIT")
+                except BaseException:
+                    db.execute("ROLLBACK")
+                    raise
+            except sqlite3.Error:
+                logger.exception("Shared cache write failed")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+
+# full /analyze results keyed by the upload's content hash
+results = DiskCache(CACHE_ROOT / "results", RESULT_CACHE_MAX_BYTES, RESULT_CACHE_TTL)
+# rendered svgs keyed by a hash of the mermaid source
+diagrams = DiskCache(CACHE_ROOT / "diagrams", DIAGRAM_CACHE_MAX_BYTES, DIAGRAM_CACHE_TTL)
+# per-file detector results keyed by zip member (path, crc32, size)
+scan_results = SharedCache(CACHE_ROOT / "scan.sqlite3", SCAN_CACHE_MAX_BYTES, SCAN_MEMORY_MAX_BYTES, SCAN_CACHE_TTL)
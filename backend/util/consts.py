@@ -49,4 +49,11 @@ DB_KEYWORDS = {"postgres", "postgresql", "psycopg2", "mysql", "sqlite", "mongodb
 FRONTEND_KEYWORDS = {"react", "vue", "angular", "next", "nextjs", "svelte"}
 SERVICE_DIR_KEYWORDS = {"routes", "controllers", "api", "services"}
 MODEL_DIR_KEYWORDS = {"models", "entities", "schemas"}
-STATIC_DIR_KEYWORDS = {"static", "public", "assets"}
\ No newline at end of file
+STATIC_DIR_KEYWORDS = {"static", "public", "assets"}
+# node core modules, left out of the import heuristic like the python stdlib
+NODE_BUILTINS = {
+    "assert", "async_hooks", "buffer", "child_process", "cluster", "console", "crypto", "dgram", "dns",
+    "events", "fs", "http", "http2", "https", "module", "net", "os", "path", "perf_hooks", "process",
+    "querystring", "readline", "stream", "string_decoder", "timers", "tls", "tty", "url", "util", "v8",
+    "vm", "worker_threads", "zlib",
+}
@@ -1,22 +1,54 @@
 from pathlib import Path
 import subprocess
+from collections import deque
+import threading
 import shutil
+import socket
+import socketserver
+import tempfile
+import queue
+import json
+import time
 import os
-import urllib.request
-import urllib.error
-from typing import Dict, List, Any, Optional
+import http.client
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Dict, List, Any, Optional, Tuple
 import zlib
 import base64
+import hashlib
 import logging
 
 try:
     from .consts import DB_KEYWORDS, FRONTEND_KEYWORDS, SERVICE_DIR_KEYWORDS, MODEL_DIR_KEYWORDS, STATIC_DIR_KEYWORDS
+    from . import cache, metrics
+    from .filetree import as_tree
 except ImportError:
     from util.consts import DB_KEYWORDS, FRONTEND_KEYWORDS, SERVICE_DIR_KEYWORDS, MODEL_DIR_KEYWORDS, STATIC_DIR_KEYWORDS
+    import util.cache as cache
+    import util.metrics as metrics
+    from util.filetree import as_tree
 
 PUPPETEER_CONFIG_PATH = Path(__file__).resolve().with_name("puppeteer-config.json")
+RENDER_WORKER_SCRIPT = Path(__file__).resolve().with_name("render-worker.mjs")
 _DISABLE_REMOTE = os.getenv("DOX_DISABLE_REMOTE_RENDER", "false").lower() in ("1", "true", "yes")
 
+# warm render workers; 0 disables the pool and goes straight to mmdc
+RENDER_WORKERS = int(os.getenv("DOX_RENDER_WORKERS", "1"))
+RENDER_START_TIMEOUT = float(os.getenv("DOX_RENDER_START_TIMEOUT", "30"))
+RENDER_HEALTH_INTERVAL = float(os.getenv("DOX_RENDER_HEALTH_INTERVAL", "30"))
+RENDER_PING_TIMEOUT = 5.0
+RENDER_RESTART_BACKOFF = 60.0
+# unix socket of the process hosting the warm pool, inherited by processes started after it
+RENDER_SOCKET_ENV = "DOX_RENDER_SOCKET"
+
+# remote renderers are raced against each other within this many seconds
+REMOTE_RENDER_BUDGET = float(os.getenv("DOX_REMOTE_RENDER_BUDGET", "20"))
+KROKI_URL = os.getenv("DOX_KROKI_URL", "https://kroki.io/mermaid/svg")
+MERMAID_INK_URL = os.getenv("DOX_MERMAID_INK_URL", "https://r.mermaid.ink/svg/")
+
+SVG_MEMORY_MAX_BYTES = int(os.getenv("DOX_SVG_MEMORY_MAX_BYTES", str(32 * 1024 * 1024)))
+
 logger = logging.getLogger(__name__)
 
 # find database from dependencies
@@ -46,15 +78,15 @@ def choose_db(deps: Dict[str, List[str]]) -> Optional[str]:
 
     return None
 
-# grabs info from file tree
-def detect_layers(file_tree: Dict[str, Any]) -> Dict[str, bool]:
+# grabs info from file tree (a FileTree or the nested dict form)
+def detect_layers(file_tree: Any) -> Dict[str, bool]:
     flags = {"has_routes": False, "has_models": False, "has_frontend": False, "has_static": False}
+    tree = as_tree(file_tree)
 
-    def walk(node, depth=0):
-        if not node or depth > 3:
-            return
+    for i, name in enumerate(tree.names):
+        if tree.depths[i] > 3:
+            continue
 
-        name = node.get("name", "") or ""
         lower = name.lower()
 
         if any(k in lower for k in ("frontend", "web", "client", "ui")):
@@ -65,23 +97,88 @@ def detect_layers(file_tree: Dict[str, Any]) -> Dict[str, bool]:
             flags["has_models"] = True
         if any(k in lower for k in STATIC_DIR_KEYWORDS):
             flags["has_static"] = True
-        for c in node.get("children", []) or []:
-            walk(c, depth + 1)
 
-    walk(file_tree, 0)
     return flags
 
 # keep labels clean
 def sanitize_label(s: str) -> str:
     return s.replace('"', "'").replace("\n", " ").strip()
 
-# produces mermaid flowchart from inputs
+# internal modules shown in the diagram, busiest first
+DIAGRAM_MODULES = 5
+
+
+# module subgraph from the import graph; edges from modules to the libraries they import.
+# returns the lines and the library indexes some shown module links to
+def _module_lines(import_graph: Dict[str, Any], libs: List[str]) -> Tuple[List[str], set]:
+    internal = import_graph.get("internal") or {}
+    external = import_graph.get("external") or {}
+    activity: Dict[str, int] = {}
+    for table in (internal, external):
+        for src, targets in table.items():
+            activity[src] = activity.get(src, 0) + sum(targets.values())
+
+    mods = sorted(activity, key=lambda m: (-activity[m], m))[:DIAGRAM_MODULES]
+    if len(mods) < 2:
+        return [], set()
+
+    ids = {m: f"M{i}" for i, m in enumerate(mods, start=1)}
+    lines = ['  subgraph MODULES["Modules"]']
+    for m, mid in ids.items():
+        lines.append(f'    {mid}["{sanitize_label("(root)" if m == "." else m)}"]')
+    lines.append("  end")
+
+    linked = set()
+    for m, mid in ids.items():
+        lines.append(f"  S1 --> {mid}")
+        for dst in internal.get(m, {}):
+            if dst in ids:
+                lines.append(f"  {mid} --> {ids[dst]}")
+        for i, lib in enumerate(libs, start=1):
+            if lib in external.get(m, {}):
+                lines.append(f"  {mid} --> E{i}")
+                linked.add(i)
+
+    return lines, linked
+
+
+# sub-projects of a monorepo, with frontend projects pointing at the others
+def _project_lines(projects: List[Dict[str, Any]]) -> List[str]:
+    lines = ['  subgraph PROJECTS["Sub-projects"]']
+    frontends = []
+    others = []
+
+    for i, p in enumerate(projects, start=1):
+        details = [d for d in [p.get("package_manager")] + list(p.get("frameworks") or [])[:3] if d]
+        label = sanitize_label(p["path"] + (" (" + ", ".join(details) + ")" if details else ""))
+        lines.append(f'    P{i}["{label}"]')
+        if any(f.lower() in FRONTEND_KEYWORDS for f in p.get("frameworks") or []):
+            frontends.append(i)
+        else:
+            others.append(i)
+    lines.append("  end")
+
+    for i in frontends:
+        for j in others:
+            lines.append(f"  P{i} --> P{j}")
+    if not frontends:
+        lines.extend(f"  S1 --> P{i}" for i in others)
+
+    return lines
+
+
+# produces mermaid flowchart from inputs; with an import graph, libraries are the most
+# imported packages and the busiest internal modules are drawn with their imports.
+# monorepos also get one node per sub-project
 def generate_mermaid_syntax(project_name: str,
                             frameworks: List[str],
                             dependencies: Dict[str, List[str]],
-                            file_tree: Dict[str, Any]) -> str:
+                            file_tree: Any,
+                            import_graph: Optional[Dict[str, Any]] = None,
+                            projects: Optional[List[Dict[str, Any]]] = None) -> str:
     lines: List[str] = []
     lines.append("flowchart TD")
+    file_tree = as_tree(file_tree)
     flags = detect_layers(file_tree)
 
     has_frontend = any(f.lower() in FRONTEND_KEYWORDS for f in frameworks) or flags.get("has_frontend", False)
@@ -130,7 +227,10 @@ def generate_mermaid_syntax(project_name: str,
             lines.append('  MODELS --> DB' if db else '  MODELS')
 
     heur = None
-    if isinstance(dependencies, dict):
+    if import_graph and import_graph.get("packages"):
+        heur = list(import_graph["packages"])
+
+    if not heur and isinstance(dependencies, dict):
         heur = dependencies.get("heuristic")
 
         if not heur:
@@ -139,31 +239,28 @@ def generate_mermaid_syntax(project_name: str,
                     heur = v
                     break
 
-    if heur and isinstance(heur, list):
-        top = heur[:4]
-        if top:
-            lines.append('  subgraph EXTRAS["Detected libraries"]')
-            for i, pkg in enumerate(top, start=1):
-                lbl = sanitize_label(str(pkg))
-                lines.append(f'    E{i}[{lbl}]')
-                lines.append(f'    S1 --> E{i}')
-            lines.append('  end')
+    top = heur[:4] if heur and isinstance(heur, list) else []
+    module_lines, linked = _module_lines(import_graph, top) if import_graph else ([], set())
 
-    def _find_entry(node):
-        if not node:
-            return None
+    if top:
+        lines.append('  subgraph EXTRAS["Detected libraries"]')
+        for i, pkg in enumerate(top, start=1):
+            lbl = sanitize_label(str(pkg))
+            lines.append(f'    E{i}["{lbl}"]')
+            if i not in linked:
+                lines.append(f'    S1 --> E{i}')
+        lines.append('  end')
 
-        if node.get("type") == "file":
-            nm = node.get("name", "").lower()
-            if nm in ("main.py", "app.py", "server.py", "index.js", "app.js", "server.js"):
-                return node.get("name")
-            return None
+    lines.extend(module_lines)
 
-        for c in node.get("children", []) or []:
-            res = _find_entry(c)
-            if res:
-                return res
+    if projects and len(projects) > 1:
+        lines.extend(_project_lines(projects))
 
+    # first entry-like file in depth-first order
+    def _find_entry(tree):
+        for i, nm in enumerate(tree.names):
+            if not tree.is_dir(i) and nm.lower() in ("main.py", "app.py", "server.py", "index.js", "app.js", "server.js"):
+                return nm
         return None
 
     entry = _find_entry(file_tree)
@@ -172,62 +269,536 @@ def generate_mermaid_syntax(project_name: str,
 
     return "\n".join(lines)
 
-# render via Kroki (POST)
-def render_via_kroki(mermaid_text: str, svg_path: Path, timeout: int = 20, retries: int = 2) -> bool:
-    url = "https://kroki.io/mermaid/svg"
+# keep-alive http(s) connections reused across remote render requests
+class ConnectionPool:
+    def __init__(self, max_idle_per_host: int = 4) -> None:
+        self.max_idle_per_host = max_idle_per_host
+        self.idle: Dict[Tuple[str, str], List[http.client.HTTPConnection]] = {}
+        self._lock = threading.Lock()
+
+    def _checkout(self, scheme: str, netloc: str, timeout: float) -> Tuple[http.client.HTTPConnection, bool]:
+        with self._lock:
+            conns = self.idle.get((scheme, netloc))
+            if conns:
+                conn = conns.pop()
+                conn.timeout = timeout
+                if conn.sock is not None:
+                    conn.sock.settimeout(timeout)
+                return conn, True
+
+        cls = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+        return cls(netloc, timeout=timeout), False
+
+    def _checkin(self, scheme: str, netloc: str, conn: http.client.HTTPConnection) -> None:
+        with self._lock:
+            conns = self.idle.setdefault((scheme, netloc), [])
+            if len(conns) < self.max_idle_per_host:
+                conns.append(conn)
+                return
+        conn.close()
+
+    # returns (status, body); cancel.register lets a racing caller close the socket early
+    def request(self, method: str, url: str, body: Optional[bytes], headers: Dict[str, str],
+                timeout: float, cancel: Optional["RenderRace"] = None) -> Tuple[int, bytes]:
+        parts = urlsplit(url)
+        path = parts.path + (f"?{parts.query}" if parts.query else "")
+
+        for attempt in range(2):
+            conn, reused = self._checkout(parts.scheme, parts.netloc, timeout)
+            if cancel is not None and not cancel.register(conn):
+                self._checkin(parts.scheme, parts.netloc, conn)
+                raise RenderCancelled()
+
+            try:
+                conn.request(method, path or "/", body=body, headers=headers)
+                resp = conn.getresponse()
+                data = resp.read()
+            except Exception:
+                conn.close()
+                if cancel is not None and cancel.done.is_set():
+                    raise RenderCancelled()
+                # a reused keep-alive socket may have been closed by the server; retry once fresh
+                if reused and attempt == 0:
+                    continue
+                raise
+            finally:
+                if cancel is not None:
+                    cancel.unregister(conn)
+
+            if resp.will_close:
+                conn.close()
+            else:
+                self._checkin(parts.scheme, parts.netloc, conn)
+            return resp.status, data
+
+        raise ConnectionError(f"Request to {url} failed")
+
+
+class RenderCancelled(Exception):
+    pass
+
+
+# shared state for one hedged render: the first svg wins and in-flight sockets are closed
+class RenderRace:
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.conns: List[http.client.HTTPConnection] = []
+        self._lock = threading.Lock()
+
+    def register(self, conn: http.client.HTTPConnection) -> bool:
+        with self._lock:
+            if self.done.is_set():
+                return False
+            self.conns.append(conn)
+            return True
+
+    def unregister(self, conn: http.client.HTTPConnection) -> None:
+        with self._lock:
+            if conn in self.conns:
+                self.conns.remove(conn)
+
+    def cancel(self) -> None:
+        with self._lock:
+            self.done.set()
+            conns, self.conns = self.conns, []
+        for conn in conns:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+
+_http_pool = ConnectionPool()
+_race_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="dox-render")
+
+
+def _is_svg(data: bytes) -> bool:
+    return bool(data) and b"<svg" in data[:4096]
+
+# fetch svg from Kroki (POST), retrying until the attempts or the deadline run out
+def fetch_via_kroki(mermaid_text: str, timeout: float = 20, retries: int = 2,
+                    cancel: Optional[RenderRace] = None) -> Optional[bytes]:
     data = mermaid_text.encode("utf-8")
     headers = {
         "Content-Type": "text/plain; charset=utf-8",
         "User-Agent": "dox/diagram-renderer/1.0",
         "Content-Length": str(len(data)),
     }
+    deadline = time.monotonic() + timeout
 
     for attempt in range(1, retries + 1):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0 or (cancel is not None and cancel.done.is_set()):
+            break
+
         try:
-            req = urllib.request.Request(url, data=data, headers=headers, method="POST")
-            with urllib.request.urlopen(req, timeout=timeout) as resp:
-                if resp.status == 200:
-                    svg_bytes = resp.read()
-                    if svg_bytes:
-                        svg_path.write_bytes(svg_bytes)
-                        return True
-                else:
-                    body = resp.read()[:2000]
-                    logger.debug("Kroki non-200 response: %s, body: %s", resp.status, body)
-        
-        except urllib.error.HTTPError as e:
-            try:
-                err_body = e.read()[:2000]
-                logger.debug("Kroki HTTPError %s: %s", e.code, err_body)
-            except Exception:
-                logger.debug("Kroki HTTPError %s (no body)", getattr(e, "code", "unknown"))
+            status, body = _http_pool.request("POST", KROKI_URL, data, headers, remaining, cancel)
+            if status == 200 and _is_svg(body):
+                return body
+            logger.debug("Kroki non-200 response: %s, body: %s", status, body[:2000])
+        except RenderCancelled:
+            break
         except Exception as e:
             logger.debug("Kroki request attempt %d failed: %s", attempt, e)
 
-    return False
+    return None
 
-# render via mermaid.ink compressed GET
-def render_via_mermaid_ink(mermaid_text: str, svg_path: Path, timeout: int = 20) -> bool:
+# fetch svg from mermaid.ink (compressed GET)
+def fetch_via_mermaid_ink(mermaid_text: str, timeout: float = 20,
+                          cancel: Optional[RenderRace] = None) -> Optional[bytes]:
     try:
         compressed = zlib.compress(mermaid_text.encode("utf-8"), level=9)
         b64 = base64.urlsafe_b64encode(compressed).decode("ascii").rstrip("=")
-        url = f"https://r.mermaid.ink/svg/{b64}"
-        req = urllib.request.Request(url, headers={"Accept": "image/svg+xml", "User-Agent": "dox/diagram-renderer/1.0"})
-        
-        with urllib.request.urlopen(req, timeout=timeout) as resp:
-            if resp.status == 200:
-                svg_path.write_bytes(resp.read())
-                return True
-            else:
-                logger.debug("mermaid.ink non-200: %s", resp.status)
-    
+        headers = {"Accept": "image/svg+xml", "User-Agent": "dox/diagram-renderer/1.0"}
+        status, body = _http_pool.request("GET", MERMAID_INK_URL + b64, None, headers, timeout, cancel)
+
+        if status == 200 and _is_svg(body):
+            return body
+        logger.debug("mermaid.ink non-200: %s", status)
+
+    except RenderCancelled:
+        pass
     except Exception as e:
         logger.debug("mermaid.ink failed: %s", e)
-    
+
+    return None
+
+# render via Kroki (POST)
+def render_via_kroki(mermaid_text: str, svg_path: Path, timeout: int = 20, retries: int = 2) -> bool:
+    svg_bytes = fetch_via_kroki(mermaid_text, timeout=timeout, retries=retries)
+    if svg_bytes:
+        svg_path.write_bytes(svg_bytes)
+        return True
     return False
 
-# consolidated render function: try CLI then remote fallbacks
-def render_mermaid_to_svg(mmd_path: Path, svg_path: Path, timeout: int = 20) -> bool:
+# render via mermaid.ink compressed GET
+def render_via_mermaid_ink(mermaid_text: str, svg_path: Path, timeout: int = 20) -> bool:
+    svg_bytes = fetch_via_mermaid_ink(mermaid_text, timeout=timeout)
+    if svg_bytes:
+        svg_path.write_bytes(svg_bytes)
+        return True
+    return False
+
+# races every remote backend under one deadline, keeping the first valid svg;
+# returns the winning backend name, or None when nothing rendered in time
+def render_remote(mermaid_text: str, svg_path: Path, budget: float = REMOTE_RENDER_BUDGET) -> Optional[str]:
+    race = RenderRace()
+    futures = {
+        _race_executor.submit(fetch_via_kroki, mermaid_text, budget, 2, race): "kroki",
+        _race_executor.submit(fetch_via_mermaid_ink, mermaid_text, budget, race): "mermaid.ink",
+    }
+    deadline = time.monotonic() + budget
+    pending = set(futures)
+    svg_bytes = None
+    backend = None
+
+    try:
+        while pending and svg_bytes is None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for f in done:
+                if f.result():
+                    svg_bytes = f.result()
+                    backend = futures[f]
+                    break
+    finally:
+        race.cancel()
+
+    if not svg_bytes:
+        return None
+
+    svg_path.write_bytes(svg_bytes)
+    return backend
+
+# one node process running render-worker.mjs with a warm headless browser
+class RenderWorker:
+    def __init__(self) -> None:
+        self.proc: Optional[subprocess.Popen] = None
+        self.lines: "queue.Queue[Optional[str]]" = queue.Queue()
+        # last lines of the worker's stderr, logged when it fails to come up
+        self.stderr: "deque[str]" = deque(maxlen=20)
+        self.next_id = 0
+
+    def alive(self) -> bool:
+        return self.proc is not None and self.proc.poll() is None
+
+    def start(self, timeout: float = RENDER_START_TIMEOUT) -> bool:
+        self.stop()
+        cmd = ["node", str(RENDER_WORKER_SCRIPT)]
+        if PUPPETEER_CONFIG_PATH.exists():
+            cmd.append(str(PUPPETEER_CONFIG_PATH))
+
+        try:
+            self.proc = subprocess.Popen(
+                cmd,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                text=True,
+                bufsize=1,
+            )
+        except (FileNotFoundError, OSError) as e:
+            logger.warning("Render worker failed to spawn: %s", e)
+            self.proc = None
+            return False
+
+        self.lines = queue.Queue()
+        self.stderr = deque(maxlen=20)
+        threading.Thread(target=self._pump, args=(self.proc, self.lines), daemon=True).start()
+        drain = threading.Thread(target=self._drain, args=(self.proc, self.stderr), daemon=True)
+        drain.start()
+
+        try:
+            ready = self.lines.get(timeout=timeout)
+        except queue.Empty:
+            ready = None
+
+        try:
+            ok = bool(ready) and json.loads(ready).get("ready") is True
+        except ValueError:
+            ok = False
+
+        if not ok:
+            self.stop()
+            drain.join(timeout=1)
+            # e.g. ERR_MODULE_NOT_FOUND when backend/node_modules wasn't installed
+            logger.warning("Render worker did not become ready: %s", "".join(self.stderr).strip()[-2000:] or "no output")
+            return False
+
+        return True
+
+    # forwards stdout lines so reads can time out; None marks the end of the stream
+    @staticmethod
+    def _pump(proc: subprocess.Popen, lines: "queue.Queue[Optional[str]]") -> None:
+        for line in proc.stdout:
+            lines.put(line)
+        lines.put(None)
+
+    # keeps the tail of stderr; the pipe has to be read so the worker never blocks on it
+    @staticmethod
+    def _drain(proc: subprocess.Popen, tail: "deque[str]") -> None:
+        for line in proc.stderr:
+            tail.append(line)
+
+    def request(self, payload: Dict[str, Any], timeout: float) -> Optional[Dict[str, Any]]:
+        if not self.alive():
+            return None
+
+        self.next_id += 1
+        payload = dict(payload, id=self.next_id)
+
+        try:
+            self.proc.stdin.write(json.dumps(payload) + "\n")
+            self.proc.stdin.flush()
+            deadline = time.monotonic() + timeout
+
+            while True:
+                line = self.lines.get(timeout=max(0.0, deadline - time.monotonic()))
+                if line is None:
+                    self.stop()
+                    return None
+                resp = json.loads(line)
+                if resp.get("id") == self.next_id:
+                    return resp
+        except (queue.Empty, OSError, ValueError) as e:
+            # a worker that misses its deadline is killed so it can't answer late
+            logger.debug("Render worker request failed: %s", e)
+            self.stop()
+            return None
+
+    def stop(self) -> None:
+        if self.proc is None:
+            return
+
+        try:
+            self.proc.stdin.close()
+        except Exception:
+            pass
+        try:
+            self.proc.wait(timeout=2)
+        except Exception:
+            self.proc.kill()
+        self.proc = None
+
+
+# fixed set of warm render workers, health-checked and restarted when they crash
+class RendererPool:
+    def __init__(self, size: int) -> None:
+        self.pid = os.getpid()
+        self.workers = [RenderWorker() for _ in range(size)]
+        self.idle: "queue.Queue[RenderWorker]" = queue.Queue()
+        self.failed_at = 0.0
+        self.ready = threading.Event()
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+
+    # workers only ever start here and in the health loop, never while a request waits
+    def start(self) -> bool:
+        started = 0
+        for w in self.workers:
+            if w.start():
+                started += 1
+            self.idle.put(w)
+
+        if started:
+            logger.info("Started %d/%d mermaid render workers", started, len(self.workers))
+        else:
+            self.failed_at = time.monotonic()
+            logger.info("Mermaid render workers unavailable; using mmdc and remote renderers")
+
+        self.ready.set()
+        threading.Thread(target=self._health_loop, daemon=True, name="dox-render-health").start()
+        return started > 0
+
+    # restarts a dead worker unless spawning failed recently
+    def _ensure(self, w: RenderWorker) -> bool:
+        if w.alive():
+            return True
+        if time.monotonic() - self.failed_at < RENDER_RESTART_BACKOFF:
+            return False
+        if w.start():
+            return True
+        self.failed_at = time.monotonic()
+        return False
+
+    # None while the pool is starting or the worker it gets is down, so the caller falls
+    # through to mmdc and the remote renderers instead of waiting for a browser to start
+    def render(self, mermaid_text: str, timeout: float = 20) -> Optional[bytes]:
+        if not self.ready.is_set():
+            return None
+        try:
+            w = self.idle.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+        try:
+            resp = w.request({"type": "render", "text": mermaid_text}, timeout) if w.alive() else None
+        finally:
+            if not w.alive():
+                self._wake.set()
+            self.idle.put(w)
+
+        if resp and resp.get("ok") and resp.get("svg"):
+            return resp["svg"].encode("utf-8")
+        if resp:
+            logger.debug("Render worker error: %s", resp.get("error"))
+        return None
+
+    # pings idle workers and restarts any that died or stopped answering
+    def health_check(self) -> None:
+        for _ in range(len(self.workers)):
+            try:
+                w = self.idle.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                resp = w.request({"type": "ping"}, RENDER_PING_TIMEOUT) if w.alive() else None
+                if not resp or not resp.get("ok"):
+                    w.stop()
+                    self._ensure(w)
+            finally:
+                self.idle.put(w)
+
+    # runs every RENDER_HEALTH_INTERVAL, or as soon as a render finds its worker down
+    def _health_loop(self) -> None:
+        while not self._stop.is_set():
+            self._wake.wait(RENDER_HEALTH_INTERVAL)
+            self._wake.clear()
+            if self._stop.is_set():
+                return
+            self.health_check()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wake.set()
+        for w in self.workers:
+            w.stop()
+
+
+# answers one json line {"text", "timeout"} per connection with {"ok", "svg"} from the pool
+class _RenderHandler(socketserver.StreamRequestHandler):
+    def handle(self) -> None:
+        try:
+            req = json.loads(self.rfile.readline())
+            svg_bytes = self.server.pool.render(req["text"], timeout=float(req.get("timeout", 20)))
+        except (ValueError, KeyError, TypeError):
+            svg_bytes = None
+
+        resp = {"ok": True, "svg": svg_bytes.decode("utf-8")} if svg_bytes else {"ok": False}
+        try:
+            self.wfile.write((json.dumps(resp) + "\n").encode("utf-8"))
+        except OSError:
+            pass
+
+
+class _RenderServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path: str, pool: RendererPool) -> None:
+        self.pool = pool
+        super().__init__(path, _RenderHandler)
+
+
+_renderer_pool: Optional[RendererPool] = None
+_render_server: Optional[_RenderServer] = None
+_svg_memory = cache.MemoryCache(SVG_MEMORY_MAX_BYTES)
+
+
+# starts this process's warm renderer pool in the background and serves it on a unix socket,
+# advertised in DOX_RENDER_SOCKET to the processes started after it (process-pool children).
+# called from the serve.py supervisor for all of its workers, or else from the app lifespan;
+# renders never start a pool themselves
+def start_renderer_pool() -> Optional[RendererPool]:
+    global _renderer_pool, _render_server
+
+    if _renderer_pool is not None and _renderer_pool.pid == os.getpid():
+        return _renderer_pool
+    # another process already hosts one: the serve.py supervisor, or the app for its pool children
+    if RENDER_WORKERS <= 0 or os.getenv(RENDER_SOCKET_ENV):
+        return None
+
+    _renderer_pool = RendererPool(RENDER_WORKERS)
+    threading.Thread(target=_renderer_pool.start, daemon=True, name="dox-render-start").start()
+
+    path = str(Path(tempfile.mkdtemp(prefix="dox_render_")) / "render.sock")
+    try:
+        _render_server = _RenderServer(path, _renderer_pool)
+    except OSError as e:
+        logger.warning("Render socket unavailable, other processes won't share the pool: %s", e)
+    else:
+        threading.Thread(target=_render_server.serve_forever, daemon=True, name="dox-render-socket").start()
+        os.environ[RENDER_SOCKET_ENV] = path
+
+    return _renderer_pool
+
+def stop_renderer_pool() -> None:
+    global _renderer_pool, _render_server
+
+    if _render_server is not None and _renderer_pool is not None and _renderer_pool.pid == os.getpid():
+        path = _render_server.server_address
+        _render_server.shutdown()
+        _render_server.server_close()
+        shutil.rmtree(Path(path).parent, ignore_errors=True)
+        if os.environ.get(RENDER_SOCKET_ENV) == path:
+            del os.environ[RENDER_SOCKET_ENV]
+    _render_server = None
+
+    if _renderer_pool is not None and _renderer_pool.pid == os.getpid():
+        _renderer_pool.stop()
+    _renderer_pool = None
+
+# asks the pool served on a unix socket for an svg
+def _render_via_socket(path: str, mermaid_text: str, timeout: float) -> Optional[bytes]:
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            # the host spends up to timeout on the render itself
+            sock.settimeout(timeout + 1)
+            sock.connect(path)
+            sock.sendall((json.dumps({"text": mermaid_text, "timeout": timeout}) + "\n").encode("utf-8"))
+            with sock.makefile("rb") as f:
+                resp = json.loads(f.readline())
+    except (OSError, ValueError) as e:
+        logger.debug("Render socket request failed: %s", e)
+        return None
+
+    if resp.get("ok") and resp.get("svg"):
+        return resp["svg"].encode("utf-8")
+    return None
+
+# render via the warm worker pool: this process's own, or the one served on DOX_RENDER_SOCKET
+def render_via_pool(mermaid_text: str, svg_path: Path, timeout: int = 20) -> bool:
+    if _renderer_pool is not None and _renderer_pool.pid == os.getpid():
+        svg_bytes = _renderer_pool.render(mermaid_text, timeout=timeout)
+    elif os.getenv(RENDER_SOCKET_ENV):
+        svg_bytes = _render_via_socket(os.environ[RENDER_SOCKET_ENV], mermaid_text, timeout)
+    else:
+        return False
+    if not svg_bytes:
+        return False
+
+    svg_path.write_bytes(svg_bytes)
+    return True
+
+# renders without the cache: try warm workers, then CLI, then remote fallbacks.
+# with time_left, every attempt shares that many seconds and later ones are skipped once
+# it runs out. returns the name of the backend that produced the svg
+def _render_uncached(mmd_path: Path, svg_path: Path, mermaid_text: str, timeout: int = 20,
+                     time_left: Optional[float] = None) -> Optional[str]:
+    deadline = time.monotonic() + time_left if time_left is not None else None
+
+    def allowed(limit: float) -> float:
+        if deadline is None:
+            return limit
+        return min(limit, deadline - time.monotonic())
+
+    try:
+        if allowed(timeout) > 0 and render_via_pool(mermaid_text, svg_path, timeout=allowed(timeout)):
+            return "pool"
+    except Exception as e:
+        logger.debug("Render pool failed: %s", e)
+
     use_puppet_flag = PUPPETEER_CONFIG_PATH.exists()
 
     cmds = []
@@ -239,10 +810,12 @@ def render_mermaid_to_svg(mmd_path: Path, svg_path: Path, timeout: int = 20) ->
         cmds.append(["npx", "@mermaid-js/mermaid-cli", "-i", str(mmd_path), "-o", str(svg_path), "--quiet"])
 
     for cmd in cmds:
+        if allowed(timeout) <= 0:
+            return None
         try:
-            subprocess.run(cmd, check=True, capture_output=True, timeout=timeout)
+            subprocess.run(cmd, check=True, capture_output=True, timeout=allowed(timeout))
             if svg_path.exists():
-                return True
+                return cmd[0]
         except FileNotFoundError:
             continue
         except subprocess.CalledProcessError:
@@ -250,28 +823,74 @@ def render_mermaid_to_svg(mmd_path: Path, svg_path: Path, timeout: int = 20) ->
         except Exception:
             continue
 
-    if _DISABLE_REMOTE:
-        return False
+    if _DISABLE_REMOTE or allowed(REMOTE_RENDER_BUDGET) <= 0:
+        return None
+
+    return render_remote(mermaid_text, svg_path, budget=allowed(REMOTE_RENDER_BUDGET))
+
+# svg lookup in memory, then on disk; keyed by a hash of the mermaid source
+def cached_svg(key: str) -> Optional[bytes]:
+    svg_bytes = _svg_memory.get(key)
+    if svg_bytes is not None:
+        return svg_bytes
+
+    entry = cache.diagrams.get(key)
+    if entry is None:
+        return None
 
+    try:
+        svg_bytes = (entry / "diagram.svg").read_bytes()
+    except OSError:
+        return None
+
+    _svg_memory.put(key, svg_bytes)
+    return svg_bytes
+
+def store_svg(key: str, svg_bytes: bytes) -> None:
+    _svg_memory.put(key, svg_bytes)
+    cache.diagrams.put(key, {"diagram.svg": svg_bytes})
+
+# consolidated render function: cache, then warm workers, CLI and remote fallbacks.
+# returns the backend that produced the svg ("cache", "pool", "mmdc", "npx", "kroki", "mermaid.ink") or None
+def render_mermaid(mmd_path: Path, svg_path: Path, timeout: int = 20, time_left: Optional[float] = None) -> Optional[str]:
     try:
         mermaid_text = mmd_path.read_text(encoding="utf-8")
     except Exception:
-        return False
+        return None
 
-    if render_via_kroki(mermaid_text, svg_path, timeout=15):
-        return True
+    if not cache.CACHE_ENABLED:
+        return _render_uncached(mmd_path, svg_path, mermaid_text, timeout=timeout, time_left=time_left)
 
-    if render_via_mermaid_ink(mermaid_text, svg_path):
-        return True
+    key = hashlib.sha256(mermaid_text.encode("utf-8")).hexdigest()
+    svg_bytes = cached_svg(key)
+    if svg_bytes is not None:
+        svg_path.write_bytes(svg_bytes)
+        return "cache"
 
-    return False
+    backend = _render_uncached(mmd_path, svg_path, mermaid_text, timeout=timeout, time_left=time_left)
+    if backend is None:
+        return None
+
+    try:
+        store_svg(key, svg_path.read_bytes())
+    except OSError:
+        pass
+    return backend
+
+def render_mermaid_to_svg(mmd_path: Path, svg_path: Path, timeout: int = 20) -> bool:
+    return render_mermaid(mmd_path, svg_path, timeout=timeout) is not None
 
 # creates the docs folder and puts diagram in it
 def make_docs_with_diagram(repo_dir: Path,
                            project_name: str,
                            frameworks: List[str],
                            dependencies: Dict[str, List[str]],
-                           file_tree: Dict[str, Any]) -> Dict[str, Optional[str]]:
+                           file_tree: Any,
+                           import_graph: Optional[Dict[str, Any]] = None,
+                           projects: Optional[List[Dict[str, Any]]] = None,
+                           timer: Optional[metrics.StageTimer] = None,
+                           time_left: Optional[float] = None) -> Dict[str, Any]:
+    timer = timer or metrics.StageTimer()
     docs = repo_dir / "docs"
     mmd_path = docs / "diagram.mmd"
     svg_path = docs / "diagram.svg"
@@ -282,7 +901,9 @@ def make_docs_with_diagram(repo_dir: Path,
         return {"mmd": None, "svg": None, "rendered": False}
 
     try:
-        mermaid_text = generate_mermaid_syntax(project_name, frameworks, dependencies, file_tree)
+        with timer.stage("diagram_syntax"):
+            mermaid_text = generate_mermaid_syntax(project_name, frameworks, dependencies, file_tree, import_graph,
+                                                   projects)
     except Exception:
         mermaid_text = "flowchart TD\n  A[Architecture diagram unavailable]\n"
 
@@ -293,10 +914,11 @@ def make_docs_with_diagram(repo_dir: Path,
         return {"mmd": None, "svg": None, "rendered": False}
 
     try:
-        rendered = render_mermaid_to_svg(mmd_path, svg_path)
-        if rendered and svg_path.exists():
-            return {"mmd": str(mmd_path), "svg": str(svg_path), "rendered": True}
+        with timer.stage("diagram_render"):
+            backend = render_mermaid(mmd_path, svg_path, time_left=time_left)
+        if backend and svg_path.exists():
+            return {"mmd": str(mmd_path), "svg": str(svg_path), "rendered": True, "backend": backend}
     except Exception:
         pass
 
-    return {"mmd": str(mmd_path), "svg": None, "rendered": False}
\ No newline at end of file
+    return {"mmd": str(mmd_path), "svg": None, "rendered": False, "backend": "none"}
\ No newline at end of file
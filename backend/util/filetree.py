@@ -0,0 +1,140 @@
+import os
+from array import array
+from pathlib import Path
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+
+# size markers for nodes that are not plain files with a known size
+DIR = -1
+UNKNOWN_SIZE = -2
+
+
+# repo tree as parallel arrays in depth-first order, children sorted dirs first.
+# a node's children follow it in sibling order, so one pass rebuilds the nesting
+class FileTree:
+    __slots__ = ("names", "parents", "sizes", "depths")
+
+    def __init__(self) -> None:
+        self.names: List[str] = []
+        self.parents = array("i")
+        self.sizes = array("q")
+        self.depths = array("H")
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def add(self, name: str, parent: int, depth: int, size: Optional[int]) -> int:
+        self.names.append(name)
+        self.parents.append(parent)
+        self.depths.append(depth)
+        self.sizes.append(UNKNOWN_SIZE if size is None else size)
+        return len(self.names) - 1
+
+    def is_dir(self, i: int) -> bool:
+        return self.sizes[i] == DIR
+
+    def size(self, i: int) -> Optional[int]:
+        s = self.sizes[i]
+        return s if s >= 0 else None
+
+    # the nested {"name", "type", "children" | "size"} shape stored in file_tree
+    def to_dict(self) -> Optional[Dict[str, Any]]:
+        nodes: List[Dict[str, Any]] = []
+
+        for i, name in enumerate(self.names):
+            if self.sizes[i] == DIR:
+                node = {"name": name, "type": "dir", "children": []}
+            else:
+                node = {"name": name, "type": "file", "size": self.size(i)}
+            nodes.append(node)
+
+            parent = self.parents[i]
+            if parent >= 0:
+                nodes[parent]["children"].append(node)
+
+        return nodes[0] if nodes else None
+
+    @classmethod
+    def from_dict(cls, root: Optional[Dict[str, Any]]) -> "FileTree":
+        tree = cls()
+        stack = [(root, -1, 0)] if root else []
+
+        while stack:
+            node, parent, depth = stack.pop()
+            if node.get("type", "dir") == "dir":
+                i = tree.add(node.get("name", ""), parent, depth, DIR)
+                for child in reversed(node.get("children", []) or []):
+                    stack.append((child, i, depth + 1))
+            else:
+                tree.add(node.get("name", ""), parent, depth, node.get("size"))
+
+        return tree
+
+
+# accepts either a FileTree or the nested dict form
+def as_tree(tree: Any) -> FileTree:
+    if isinstance(tree, FileTree):
+        return tree
+    return FileTree.from_dict(tree)
+
+
+# nested dict form, for json and for callers that predate FileTree
+def as_dict(tree: Any) -> Optional[Dict[str, Any]]:
+    if isinstance(tree, FileTree):
+        return tree.to_dict()
+    return tree
+
+
+def _entry_size(entry: os.DirEntry) -> Optional[int]:
+    try:
+        return entry.stat().st_size
+    except OSError:
+        return None
+
+
+# one os.scandir walk that yields both the file list (up to entries, each directory's
+# files before its subdirectories) and the tree (up to max_depth, max_children per dir).
+# symlinked directories are listed but not followed
+def walk(root: Path, entries: int = 2000, max_depth: int = 6,
+         max_children: int = 200) -> Tuple[List[Path], FileTree]:
+    files: List[Path] = []
+    tree = FileTree()
+    tree.add(root.name, -1, 0, DIR)
+
+    def scan(path: str, depth: int, node: int) -> Iterator[Tuple[str, int, int]]:
+        try:
+            with os.scandir(path) as it:
+                items = [(e.is_dir(), e) for e in it]
+        except OSError:
+            return
+
+        items.sort(key=lambda x: (not x[0], x[1].name.lower()))
+
+        if len(files) < entries:
+            for is_dir, e in items:
+                if not is_dir and e.is_file():
+                    files.append(Path(e.path))
+                    if len(files) >= entries:
+                        break
+
+        in_tree = node >= 0 and depth < max_depth
+        shown = 0
+
+        for is_dir, e in items:
+            child = -1
+            if in_tree and shown < max_children:
+                shown += 1
+                child = tree.add(e.name, node, depth + 1, DIR if is_dir else _entry_size(e))
+
+            descend = (child >= 0 and depth + 1 < max_depth) or len(files) < entries
+            if is_dir and descend and not e.is_symlink():
+                yield e.path, depth + 1, child
+
+    stack = [scan(str(root), 0, 0)]
+    while stack:
+        nxt = next(stack[-1], None)
+        if nxt is None:
+            stack.pop()
+        else:
+            stack.append(scan(*nxt))
+
+    return files, tree
@@ -0,0 +1,222 @@
+import re
+import heapq
+import sys
+import os
+import posixpath
+from collections import Counter
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+
+try:
+    from .consts import NODE_BUILTINS
+except ImportError:
+    from util.consts import NODE_BUILTINS
+
+# source files the extractor understands
+SOURCE_LANGS = {
+    ".py": "py",
+    ".js": "js", ".jsx": "js", ".mjs": "js", ".cjs": "js",
+    ".ts": "js", ".tsx": "js", ".mts": "js", ".cts": "js",
+    ".go": "go",
+}
+# directory levels kept when naming an internal module, e.g. "src/api"
+MODULE_DEPTH = 2
+# caps on what the graph keeps, so memory stays bounded on huge repos
+MAX_MODULES = 500
+MAX_TARGETS = 200
+MAX_PACKAGES = 5000
+
+PY_STDLIB = set(sys.stdlib_module_names) | {"__future__"}
+
+PY_IMPORT_RE = re.compile(
+    r"^[ \t]*(?:from[ \t]+(\.*[\w.]*)[ \t]+import[ \t]+\(?([\w., \t]+)|import[ \t]+([\w., \t]+))",
+    flags=re.MULTILINE,
+)
+# "import x from 'y'", "export * from 'y'", "import 'y'", "require('y')" and "import('y')".
+# no leading \b: it stops the regex engine skipping ahead, so the word boundary is checked per match
+JS_IMPORT_RE = re.compile(r"(?:from|import|require)\s*\(?\s*['\"]([^'\"\n]+)['\"]")
+GO_IMPORT_RE = re.compile(r"^[ \t]*import[ \t]*(?:\(([^)]*)\)|(?:[\w.]+[ \t]+)?\"([^\"]+)\")", flags=re.MULTILINE)
+GO_SPEC_RE = re.compile(r"\"([^\"]+)\"")
+
+
+# language of a source file, or None when the extractor doesn't handle it
+def language(path: str) -> Optional[str]:
+    return SOURCE_LANGS.get(os.path.splitext(path)[1].lower())
+
+
+# yields (language, spec) for each import statement in a source file's text.
+# python specs keep their leading dots, e.g. "..models" or ".views.item"
+def extract(path: str, txt: str) -> Iterator[Tuple[str, str]]:
+    lang = language(path)
+
+    if lang == "py":
+        for m in PY_IMPORT_RE.finditer(txt):
+            if m.group(1) is not None:
+                base = m.group(1)
+                if base.strip("."):
+                    yield lang, base
+                else:
+                    # "from . import a, b" imports sibling modules
+                    for name in m.group(2).split(","):
+                        name = name.split()[0] if name.split() else ""
+                        if name:
+                            yield lang, base + name
+            else:
+                for name in m.group(3).split(","):
+                    name = name.split()[0] if name.split() else ""
+                    if name:
+                        yield lang, name
+
+    elif lang == "js":
+        for m in JS_IMPORT_RE.finditer(txt):
+            start = m.start()
+            if start and (txt[start - 1].isalnum() or txt[start - 1] in "_$."):
+                continue
+            yield lang, m.group(1)
+
+    elif lang == "go":
+        for m in GO_IMPORT_RE.finditer(txt):
+            if m.group(1) is not None:
+                for spec in GO_SPEC_RE.findall(m.group(1)):
+                    yield lang, spec
+            else:
+                yield lang, m.group(2)
+
+
+# external package name for a spec, or None for stdlib and relative imports
+def package_name(lang: str, spec: str) -> Optional[str]:
+    if lang == "py":
+        if spec.startswith("."):
+            return None
+        top = spec.split(".")[0]
+        return None if top in PY_STDLIB else top
+
+    if lang == "js":
+        # "@/", "~/" are tsconfig/bundler path aliases and "#" is a package.json subpath
+        # import; all point back into the repo
+        if spec.startswith((".", "/", "node:", "~", "#", "@/")):
+            return None
+        parts = spec.split("/")
+        if spec.startswith("@"):
+            if len(parts) < 2 or len(parts[0]) < 2 or not parts[1]:
+                return None
+            return "/".join(parts[:2])
+        name = parts[0]
+        return None if not name or name in NODE_BUILTINS else name
+
+    if lang == "go":
+        parts = spec.split("/")
+        if "." not in parts[0]:
+            return None
+        return "/".join(parts[:3])
+
+    return None
+
+
+# module-level import graph: which internal modules import which packages and
+# which other internal modules, counted incrementally one file at a time.
+# paths are posix strings relative to the repo root
+class ImportGraph:
+    def __init__(self, files: List[str]) -> None:
+        self.packages: Counter = Counter()
+        self.internal: Dict[str, Counter] = {}
+        self.external: Dict[str, Counter] = {}
+        # internal edges counted per source module, so ranking modules doesn't re-sum them
+        self.weights: Counter = Counter()
+        self.files = 0
+
+        # a single top-level folder (a zipped project) is not a module of its own
+        split = [tuple(f.split("/")) for f in files]
+        tops = {parts[0] for parts in split if len(parts) > 1}
+        self.strip = 1 if len(tops) == 1 and all(len(parts) > 1 for parts in split) else 0
+
+        # python packages and modules in the repo, by the name they're imported as
+        self.local: Dict[str, str] = {}
+        for parts in split:
+            if not parts[-1].endswith(".py"):
+                continue
+            parts = parts[self.strip:]
+            for i, name in enumerate(parts[:-1]):
+                self.local.setdefault(name, self.module_of(parts[:i + 1], is_dir=True))
+            self.local.setdefault(parts[-1][:-3], self.module_of(parts))
+
+    # "src/api" for src/api/v1/users.py; "." for files at the top
+    def module_of(self, parts: Tuple[str, ...], is_dir: bool = False) -> str:
+        dirs = parts if is_dir else parts[:-1]
+        return "/".join(dirs[:MODULE_DEPTH]) or "."
+
+    def _resolve(self, lang: str, spec: str, parts: Tuple[str, ...]) -> Optional[str]:
+        if lang == "py":
+            if spec.startswith("."):
+                level = len(spec) - len(spec.lstrip("."))
+                base = list(parts[:max(0, len(parts) - level)])
+                rest = [p for p in spec.lstrip(".").split(".") if p]
+                return self.module_of(tuple(base + rest))
+            return self.local.get(spec.split(".")[0])
+
+        if lang == "js" and spec.startswith("."):
+            target = posixpath.normpath(posixpath.join("/".join(parts[:-1]), spec))
+            if target.startswith(".."):
+                return None
+            return self.module_of(tuple(p for p in target.split("/") if p and p != "."))
+
+        return None
+
+    # returns the external packages counted for this file
+    def add(self, path: str, specs: Iterator[Tuple[str, str]]) -> set:
+        parts = tuple(path.split("/"))[self.strip:]
+        if not parts:
+            return set()
+
+        src = self.module_of(parts)
+        self.files += 1
+        seen = set()
+
+        for lang, spec in specs:
+            pkg = package_name(lang, spec)
+
+            if pkg is not None and (lang != "py" or pkg not in self.local):
+                # each package counts once per file, so one noisy file can't dominate
+                if pkg not in seen and (pkg in self.packages or len(self.packages) < MAX_PACKAGES):
+                    seen.add(pkg)
+                    self.packages[pkg] += 1
+                self._edge(self.external, src, pkg)
+                continue
+
+            dst = self._resolve(lang, spec, parts)
+            if dst is not None and dst != src and self._edge(self.internal, src, dst):
+                self.weights[src] += 1
+
+        return seen
+
+    # True when the edge was counted rather than dropped by the size caps
+    def _edge(self, table: Dict[str, Counter], src: str, dst: str) -> bool:
+        targets = table.get(src)
+        if targets is None:
+            if len(table) >= MAX_MODULES:
+                return False
+            targets = table[src] = Counter()
+        if dst in targets or len(targets) < MAX_TARGETS:
+            targets[dst] += 1
+            return True
+        return False
+
+    # packages ranked by the number of files importing them
+    def top_packages(self, n: int = 200) -> List[str]:
+        return [pkg for pkg, _ in heapq.nsmallest(n, self.packages.items(), key=lambda x: (-x[1], x[0]))]
+
+    # the n internal modules with the most outgoing internal imports, in to_dict's order
+    def top_modules(self, n: int) -> List[str]:
+        return [m for m, _ in heapq.nsmallest(n, self.weights.items(), key=lambda x: (-x[1], x[0]))]
+
+    # json-friendly form stored in the analysis metadata
+    def to_dict(self, max_modules: int = 50, max_targets: int = 20) -> Dict[str, Any]:
+        def trim(table: Dict[str, Counter]) -> Dict[str, Dict[str, int]]:
+            ranked = sorted(table.items(), key=lambda x: (-sum(x[1].values()), x[0]))[:max_modules]
+            return {src: dict(sorted(t.items(), key=lambda x: (-x[1], x[0]))[:max_targets]) for src, t in ranked}
+
+        return {
+            "files": self.files,
+            "packages": {pkg: self.packages[pkg] for pkg in self.top_packages(max_modules)},
+            "internal": trim(self.internal),
+            "external": trim(self.external),
+        }
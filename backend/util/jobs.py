@@ -0,0 +1,238 @@
+import os
+import time
+import json
+import uuid
+import shutil
+import asyncio
+import logging
+import tempfile
+from pathlib import Path
+from typing import Dict, Any, Awaitable, Callable, Optional
+
+try:
+    from .pipeline import AnalysisError, StageFile
+except ImportError:
+    from util.pipeline import AnalysisError, StageFile
+
+# analyses the job queue runs at once
+JOB_CONCURRENCY = max(1, int(os.getenv("DOX_JOB_CONCURRENCY", "2")))
+# seconds a finished job and its generated files are kept
+JOB_TTL = int(os.getenv("DOX_JOB_TTL", str(60 * 60)))
+# seconds one job may run once it starts; jobs are for long analyses, so this is well past
+# the request timeout. 0 turns it off
+JOB_TIMEOUT = float(os.getenv("DOX_JOB_TIMEOUT", str(30 * 60)))
+# seconds shutdown waits for running jobs before cancelling them, so a recycled worker finishes its work
+JOB_DRAIN_TIMEOUT = float(os.getenv("DOX_JOB_DRAIN_TIMEOUT", "30"))
+# job records shared by every web worker on the host
+JOBS_DIR = Path(os.getenv("DOX_JOBS_DIR", str(Path(tempfile.gettempdir()) / "dox_jobs")))
+
+logger = logging.getLogger(__name__)
+
+Runner = Callable[[Path, Path, str, Optional[Callable[[str], None]]], Awaitable[Dict[str, Any]]]
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass
+    return True
+
+
+# one queued analysis; owns its temp dir until it expires. its state is mirrored to a
+# record in JOBS_DIR, so whichever worker a poll lands on can answer it
+class Job:
+    def __init__(self, zip_path: Path, tmpdir: Path, key: str, job_id: Optional[str] = None) -> None:
+        self.id = job_id or uuid.uuid4().hex
+        self.zip_path = zip_path
+        self.tmpdir = tmpdir
+        self.key = key
+        self.status = "queued"
+        self.error: Optional[Dict[str, Any]] = None
+        self.result: Optional[Dict[str, Any]] = None
+        self.created = time.time()
+        self.finished: Optional[float] = None
+        self.pid = os.getpid()
+        self.stage_file = StageFile(str(tmpdir / "stage"))
+
+    @staticmethod
+    def record(job_id: str) -> Path:
+        return JOBS_DIR / f"{job_id}.json"
+
+    # writes the shared record; a temp file and rename keep readers from seeing half of it
+    def save(self) -> None:
+        data = {
+            "id": self.id,
+            "status": self.status,
+            "error": self.error,
+            "created": self.created,
+            "finished": self.finished,
+            "tmpdir": str(self.tmpdir),
+            "pid": self.pid,
+            "result": {k: self.result.get(k) for k in ("upload", "generated", "download_name", "metadata")}
+                      if self.result else None,
+        }
+        tmp = JOBS_DIR / f".{self.id}.{os.getpid()}.tmp"
+
+        try:
+            JOBS_DIR.mkdir(parents=True, exist_ok=True)
+            tmp.write_text(json.dumps(data), encoding="utf-8")
+            os.replace(tmp, self.record(self.id))
+        except (OSError, TypeError, ValueError):
+            logger.exception("Failed saving job record %s", self.id)
+            tmp.unlink(missing_ok=True)
+
+    # a job owned by another worker, read from its record. jobs whose worker died
+    # before finishing are reported as failed
+    @classmethod
+    def load(cls, job_id: str) -> Optional["Job"]:
+        if len(job_id) != 32 or any(c not in "0123456789abcdef" for c in job_id):
+            return None
+
+        path = cls.record(job_id)
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+
+        job = cls(Path(), Path(data["tmpdir"]), "", job_id=data["id"])
+        job.status = data["status"]
+        job.error = data["error"]
+        job.result = data["result"]
+        job.created = data["created"]
+        job.finished = data["finished"]
+        job.pid = data["pid"]
+
+        if job.finished is None and not _alive(job.pid):
+            job.status = "failed"
+            job.error = {"status_code": 503, "detail": "Worker exited before the job finished"}
+            try:
+                job.finished = path.stat().st_mtime
+            except OSError:
+                job.finished = time.time()
+
+        return job
+
+    def expired(self, now: float, ttl: int) -> bool:
+        return self.finished is not None and now - self.finished > ttl
+
+    def remove(self) -> None:
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+        self.record(self.id).unlink(missing_ok=True)
+
+    def info(self) -> Dict[str, Any]:
+        stage = self.status if self.status in ("queued", "done", "failed") else self.stage_file.read()
+        out = {
+            "id": self.id,
+            "status": self.status,
+            "stage": stage,
+            "created": self.created,
+            "finished": self.finished,
+        }
+
+        if self.error:
+            out["error"] = self.error
+        if self.result:
+            out["metadata"] = self.result.get("metadata")
+            out["expires"] = (self.finished or time.time()) + JOB_TTL
+
+        return out
+
+
+# runs jobs in the background with bounded concurrency and expires old results
+class JobQueue:
+    def __init__(self, runner: Runner, concurrency: int = JOB_CONCURRENCY, ttl: int = JOB_TTL) -> None:
+        self.runner = runner
+        self.concurrency = concurrency
+        self.ttl = ttl
+        self.jobs: Dict[str, Job] = {}
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    def submit(self, zip_path: Path, tmpdir: Path, key: str) -> Job:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.concurrency)
+
+        self.reap()
+        job = Job(zip_path, tmpdir, key)
+        job.save()
+        self.jobs[job.id] = job
+        self._tasks[job.id] = asyncio.create_task(self._run(job))
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        self.reap()
+        job = self.jobs.get(job_id)
+        if job is None:
+            job = Job.load(job_id)
+            if job is not None and job.expired(time.time(), self.ttl):
+                return None
+        return job
+
+    async def _run(self, job: Job) -> None:
+        try:
+            async with self._slots:
+                job.status = "running"
+                job.save()
+                job.result = await self.runner(job.zip_path, job.tmpdir, job.key, job.stage_file)
+                job.status = "done"
+        except AnalysisError as e:
+            job.status = "failed"
+            job.error = {"status_code": e.status_code, "detail": e.detail}
+        except asyncio.CancelledError:
+            job.status = "failed"
+            job.error = {"status_code": 503, "detail": "Job cancelled"}
+            raise
+        except Exception as e:
+            logger.exception("Job %s failed", job.id)
+            job.status = "failed"
+            job.error = {"status_code": 500, "detail": f"Analysis failed: {e}"}
+        finally:
+            job.finished = time.time()
+            job.save()
+            self._tasks.pop(job.id, None)
+
+    # drops finished jobs older than the ttl along with their files
+    def reap(self) -> None:
+        now = time.time()
+
+        for job_id, job in list(self.jobs.items()):
+            if job.expired(now, self.ttl):
+                job.remove()
+                del self.jobs[job_id]
+
+    # also expires records left by other workers, including ones that have since exited
+    def reap_shared(self) -> None:
+        self.reap()
+        now = time.time()
+
+        try:
+            records = list(JOBS_DIR.glob("*.json"))
+        except OSError:
+            return
+
+        for path in records:
+            if path.stem in self.jobs:
+                continue
+            job = Job.load(path.stem)
+            if job is not None and job.expired(now, self.ttl):
+                job.remove()
+
+    # periodic reaper started from the app lifespan
+    async def reap_forever(self, interval: float = 60.0) -> None:
+        while True:
+            await asyncio.to_thread(self.reap_shared)
+            await asyncio.sleep(interval)
+
+    # lets running jobs finish for up to drain seconds, then cancels the rest. finished
+    # jobs stay on disk for other workers to serve until the ttl reaper removes them
+    async def shutdown(self, drain: float = JOB_DRAIN_TIMEOUT) -> None:
+        if self._tasks and drain > 0:
+            await asyncio.wait(list(self._tasks.values()), timeout=drain)
+
+        for task in list(self._tasks.values()):
+            task.cancel()
+        await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+        self.jobs.clear()
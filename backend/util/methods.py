@@ -1,15 +1,49 @@
+import os
 import shutil
+import hashlib
 import json
 import re
 import zipfile
 import tomllib
+import time
 from starlette.responses import StreamingResponse
-from starlette.background import BackgroundTask
-from typing import Dict, Any, List, Optional
-from fastapi import UploadFile, HTTPException
+from collections import Counter
+from typing import Callable, Dict, Any, Iterable, List, Optional, Tuple
+from fastapi import UploadFile, HTTPException, Request
+from python_multipart.multipart import MultipartParser, parse_options_header
+from python_multipart.exceptions import MultipartParseError
 from pathlib import Path
 from typing import Iterator
+from starlette.concurrency import run_in_threadpool
 from util.consts import EXTENSIONS, FRAMEWORKS, PACKAGES, MAX_UPLOAD, UPLOAD_EXT
+from util.filetree import FileTree, as_tree, walk
+import util.workers as workers
+import util.imports as imports
+import util.consts as consts
+import util.cache as cache
+import util.archive as archive
+
+# bytes per read while ingesting an upload
+UPLOAD_CHUNK = int(os.getenv("DOX_UPLOAD_CHUNK", str(1024 * 1024)))
+ZIP_LOCAL_SIG = b"PK\x03\x04"
+ZIP_EOCD_SIG = b"PK\x05\x06"
+EOCD_SEARCH = 0xFFFF + 22
+
+# files listed for analysis; how much of them gets read is bounded by the scan budgets
+MAX_FILES = int(os.getenv("DOX_MAX_FILES", "20000"))
+# a scan stops after this many seconds or characters read; 0 turns a budget off
+SCAN_TIME_BUDGET = float(os.getenv("DOX_SCAN_TIME_BUDGET", "10"))
+SCAN_BYTE_BUDGET = int(os.getenv("DOX_SCAN_BYTE_BUDGET", str(64 * 1024 * 1024)))
+# a sampling detector is resolved once this many files in a row add nothing new
+DETECTOR_PATIENCE = int(os.getenv("DOX_DETECTOR_PATIENCE", "150"))
+# the import detector is resolved once its top packages and modules hold still for
+# DETECTOR_PATIENCE source files; compared every IMPORT_CHECK_EVERY files
+IMPORT_STABLE_TOP = int(os.getenv("DOX_IMPORT_STABLE_TOP", "10"))
+IMPORT_CHECK_EVERY = 10
+# env-reading files listed before the env detector counts as resolved
+MAX_ENV_FILES = 50
+# sub-projects analyzed on their own, shallowest first; deeper ones fold into their parent
+MAX_PROJECTS = int(os.getenv("DOX_MAX_PROJECTS", "20"))
 
 # grabs languages from file extensions
 def get_languages(files: List[Path]) -> List[str]:
@@ -24,25 +58,10 @@ def get_languages(files: List[Path]) -> List[str]:
     return sorted(res)
 
 # grabs frameworks from files
-def get_frameworks(files: List[Path], sample_limit: int = 400) -> List[str]:
-    res = set()
-    sample_files = files[:sample_limit]
-    file_texts = []
-
-    for f in sample_files:
-        file_texts.append((f, read_text_safe(f, max_chars=4000).lower()))
-
-    for framework, keyword in FRAMEWORKS.items():
-        found = False
-        for f, txt in file_texts:
-            if any(k.lower() in txt for k in keyword):
-                res.add(framework)
-                found = True
-                break
-        if found:
-            continue
-
-    return sorted(res)
+def get_frameworks(files: List[Path], sample_limit: Optional[int] = None) -> List[str]:
+    detector = FrameworkDetector()
+    scan_files(schedule_files(files), [detector], sample_limit=sample_limit)
+    return detector.result()
 
 
 # grabs package from files
@@ -57,121 +76,887 @@ def get_packages(files: List[Path]) -> Optional[str]:
     return None
 
 
-# unzips zipfiles
-def unzip(zip_path: Path, dest: Path) -> None:
+# unzips zipfiles; with a budget the archive is vetted up front and each member is
+# charged against the temp disk limit before it is written
+def unzip(zip_path: Path, dest: Path, budget: Any = None) -> None:
     with zipfile.ZipFile(zip_path, "r") as file:
-        names = file.namelist()
-        for name in names:
-            p = Path(name)
+        infos = file.infolist()
+        for info in infos:
+            p = Path(info.filename)
 
             if p.is_absolute() or ".." in p.parts:
                 raise HTTPException(status_code=400, detail="Invalid archive entry")
-        file.extractall(dest)
+
+        if budget is None:
+            file.extractall(dest)
+            return
+
+        budget.check_archive(infos)
+        for info in infos:
+            budget.check()
+            budget.charge_disk(info.file_size)
+            file.extract(info, dest)
 
 
-# extracts text from files
-def read_text_safe(path: Path, max_chars: int = 200_000) -> str:
+# extracts text from files, reading only the prefix that is needed
+def read_text_safe(path: Path, max_chars: Optional[int] = 200_000) -> str:
     try:
-        txt = path.read_text(encoding="utf-8", errors="ignore")
-        return txt[:max_chars]
+        with path.open("r", encoding="utf-8", errors="ignore") as f:
+            return f.read(max_chars)
     except Exception:
         return ""
 
 
-# save upload zipfile to temporary directory
-def save_upload(tmp: Path, upload: UploadFile) -> Path:
-    filename = Path(upload.filename or "upload.zip").name
-    dest = tmp / filename
+# a repo extracted to disk; util.archive.ZipRepo reads one in place from the upload
+class DirRepo:
+    def __init__(self, root: Path) -> None:
+        self.root = root
+        self._walked: Optional[tuple] = None
 
-    if dest.suffix.lower() not in {s.lower() for s in UPLOAD_EXT}:
-        raise HTTPException(status_code=400, detail="Not in approved format")
+    # list_files and tree share one directory walk; tree takes whichever walk ran last
+    def _walk(self, entries: Optional[int] = None) -> tuple:
+        if self._walked is not None and entries is None:
+            return self._walked
+        entries = 2000 if entries is None else entries
+        if self._walked is None or self._walked[0] != entries:
+            files, tree = walk(self.root, entries=entries)
+            self._walked = (entries, files, tree)
+        return self._walked
 
-    total = 0
+    def path(self, name: str) -> Path:
+        return self.root / name
 
-    with dest.open("wb") as f:
-        while True:
-            chunk = upload.file.read(1024 * 64)
+    def exists(self, path: Path) -> bool:
+        return path.exists()
 
-            if not chunk:
-                break
-            total += len(chunk)
+    def read_text(self, path: Path, max_chars: Optional[int] = None) -> str:
+        return read_text_safe(path, max_chars=max_chars)
 
-            if total > MAX_UPLOAD:
-                try:
-                    f.close()
-                    dest.unlink(missing_ok=True)
-                except Exception:
-                    pass
-                raise HTTPException(status_code=413, detail="Upload too large")
+    def list_files(self, entries: int = 2000) -> List[Path]:
+        return list(self._walk(entries)[1])
 
-            f.write(chunk)
+    def tree(self) -> FileTree:
+        return self._walk()[2]
 
-    return dest
 
-# list all files out
-def get_files(root: Path, entries: int = 2000) -> List[Path]:
-    files = []
+# wraps a plain directory path, passing repo objects through untouched
+def as_repo(root: Any) -> Any:
+    if isinstance(root, (str, os.PathLike)):
+        return DirRepo(Path(root))
+    return root
 
-    for p in root.rglob("*"):
-        if p.is_file():
-            files.append(p)
-            if len(files) >= entries:
-                break
 
-    return files
+ENV_FILE_NAMES = (".env", ".env.example", ".env.local", ".env.sample")
+ENV_MARKERS = ("process.env", "os.environ", "dotenv")
 
-# create a tree structure for file mapping
-def make_tree(root: Path, max_depth: int = 6, max_entries: int = 500) -> Dict[str, Any]:
 
-    def node(p: Path, depth: int):
-        if depth > max_depth:
-            return None
+# builds a regex that shares common prefixes between words, so matching cost
+# depends on the text length rather than the number of words
+def _trie_pattern(words: List[str]) -> str:
+    trie: Dict[str, Any] = {}
+    for w in words:
+        node = trie
+        for ch in w:
+            node = node.setdefault(ch, {})
+        node[""] = True
+
+    def emit(node: Dict[str, Any]) -> str:
+        subs = [re.escape(ch) + emit(child) for ch, child in sorted(node.items()) if ch]
+        if not subs:
+            return ""
+        if "" in node:
+            return "(?:" + "|".join(subs) + ")?"
+        if len(subs) == 1:
+            return subs[0]
+        return "(?:" + "|".join(subs) + ")"
+
+    return emit(trie)
+
+
+# finds every keyword from a label -> keywords table in a single scan of the text
+class KeywordMatcher:
+    def __init__(self, table: Dict[str, List[str]]) -> None:
+        labels: Dict[str, set] = {}
+        for label, keywords in table.items():
+            for k in keywords:
+                labels.setdefault(k.lower(), set()).add(label)
+
+        # the regex reports the longest keyword at each position, so a hit also
+        # counts for every shorter keyword that is a prefix of it
+        self.labels = {
+            k: set().union(*(v for other, v in labels.items() if k.startswith(other)))
+            for k in labels
+        }
+        # the lookahead lets matches overlap, so one keyword can't hide another
+        self.regex = re.compile("(?=(" + _trie_pattern(list(labels)) + "))")
+
+    def find(self, txt: str) -> set:
+        hits = set()
+        for k in set(self.regex.findall(txt.lower())):
+            hits |= self.labels[k]
+        return hits
 
-        if p.is_dir():
-            children = []
 
+FRAMEWORK_MATCHER = KeywordMatcher(FRAMEWORKS)
+ENV_MARKER_RE = re.compile(_trie_pattern(list(ENV_MARKERS)))
+
+
+# detectors are fed one file at a time by scan_files. feed is split into extract, a
+# json-friendly per-file result that scan_files can cache, and apply, which merges it
+
+
+# detector for framework keywords
+class FrameworkDetector:
+    name = "frameworks"
+    max_chars = 4000
+
+    def __init__(self) -> None:
+        self.found = set()
+        self.stale = 0
+
+    def extract(self, path: Path, txt: str) -> List[str]:
+        return sorted(FRAMEWORK_MATCHER.find(txt[:self.max_chars]))
+
+    def feed(self, path: Path, txt: str) -> None:
+        self.apply(path, self.extract(path, txt))
+
+    def apply(self, path: Path, hits: List[str]) -> None:
+        new = set(hits) - self.found
+        if new:
+            self.found |= new
+            self.stale = 0
+        else:
+            self.stale += 1
+
+    # resolved once every framework is seen, or a run of files turned up nothing new
+    @property
+    def done(self) -> bool:
+        return len(self.found) == len(FRAMEWORKS) or self.stale >= DETECTOR_PATIENCE
+
+    def result(self) -> List[str]:
+        return sorted(self.found)
+
+
+# detector for env files and code that reads environment variables
+class EnvDetector:
+    name = "env"
+    max_chars = 2000
+
+    def __init__(self, root: Any, files: List[Path]) -> None:
+        self.root = as_repo(root).root
+        names = {f.name for f in files}
+        self.found = {i for i in ENV_FILE_NAMES if i in names}
+        self.stale = 0
+
+    def extract(self, path: Path, txt: str) -> bool:
+        return ENV_MARKER_RE.search(txt, 0, self.max_chars) is not None
+
+    def feed(self, path: Path, txt: str) -> None:
+        self.apply(path, self.extract(path, txt))
+
+    def apply(self, path: Path, marked: bool) -> None:
+        if marked:
+            self.stale = 0
             try:
-                iter_children = sorted(p.iterdir(), key=lambda x: (not x.is_dir(), x.name.lower()))
+                self.found.add(str(path.relative_to(self.root)))
             except Exception:
-                iter_children = []
+                self.found.add(str(path))
+        else:
+            self.stale += 1
+
+    # resolved once enough examples are listed, or a run of files had none
+    @property
+    def done(self) -> bool:
+        return len(self.found) >= MAX_ENV_FILES or self.stale >= DETECTOR_PATIENCE
+
+    def result(self) -> List[str]:
+        return sorted(self.found)
+
+
+# detector for imports across source files; builds the module import graph and ranks
+# packages for the dependency heuristic. stops once the ranking settles, so on a big repo
+# the counts and the long tail come from a spread sample rather than every file
+class ImportDetector:
+    name = "imports"
+    max_chars = 16_000
+    # reads source files past the sample, until resolved
+    full = True
+
+    def __init__(self, root: Any, files: List[Path], owner: Optional[Dict[Path, Any]] = None) -> None:
+        root_str = as_repo(root).root.as_posix()
+        self.prefix = "" if root_str == "." else root_str.rstrip("/") + "/"
+        self.graph = imports.ImportGraph([self._rel(f) for f in files])
+        # file -> Project, so each sub-project also ranks its own packages
+        self.owner = owner or {}
+        self.ranking: tuple = ()
+        self.fed = 0
+        self.stale = 0
+
+    # posix path relative to the repo root, by string slicing rather than relative_to
+    def _rel(self, path: Path) -> str:
+        p = path.as_posix()
+        return p[len(self.prefix):] if p.startswith(self.prefix) else p
+
+    def wants(self, path: Path) -> bool:
+        return imports.language(path.name) is not None
+
+    def extract(self, path: Path, txt: str) -> List[tuple]:
+        return list(imports.extract(path.name, txt))
+
+    def feed(self, path: Path, txt: str) -> None:
+        self.apply(path, self.extract(path, txt))
+
+    def apply(self, path: Path, specs: List[tuple]) -> None:
+        packages = self.graph.add(self._rel(path), iter(specs))
+        project = self.owner.get(path)
+        if project is not None:
+            project.packages.update(packages)
+
+        self.fed += 1
+        if self.fed % IMPORT_CHECK_EVERY == 0:
+            ranking = (tuple(self.graph.top_packages(IMPORT_STABLE_TOP)),
+                       tuple(self.graph.top_modules(IMPORT_STABLE_TOP)))
+            if ranking != self.ranking:
+                self.ranking = ranking
+                self.stale = 0
+            else:
+                self.stale += IMPORT_CHECK_EVERY
+
+    # resolved once the top packages and modules, which the readme and diagram show,
+    # stayed the same for a run of source files
+    @property
+    def done(self) -> bool:
+        return self.stale >= DETECTOR_PATIENCE
+
+    def result(self) -> List[str]:
+        return self.graph.top_packages(200)
+
+
+# framework detection per sub-project: one extract per file, applied to the repo-wide
+# detector and to the detector of the project that owns the file
+class ProjectFrameworkDetector:
+    name = FrameworkDetector.name
+    max_chars = FrameworkDetector.max_chars
+
+    def __init__(self, projects: List[Any], owner: Dict[Path, Any]) -> None:
+        self.repo = FrameworkDetector()
+        self.projects = projects
+        self.owner = owner
+
+    def extract(self, path: Path, txt: str) -> List[str]:
+        return self.repo.extract(path, txt)
+
+    def feed(self, path: Path, txt: str) -> None:
+        self.apply(path, self.extract(path, txt))
+
+    def apply(self, path: Path, hits: List[str]) -> None:
+        self.repo.apply(path, hits)
+        project = self.owner.get(path)
+        if project is not None and not project.frameworks.done:
+            project.frameworks.apply(path, hits)
+
+    @property
+    def done(self) -> bool:
+        return self.repo.done and all(p.frameworks.done for p in self.projects)
+
+    def result(self) -> List[str]:
+        return self.repo.result()
+
+
+# directories whose manifests belong to vendored or generated code, never to a sub-project
+PROJECT_SKIP_DIRS = {
+    "node_modules", "vendor", "third_party", ".venv", "venv", "site-packages",
+    "dist", "build", ".git", ".tox", "__pycache__",
+}
+PROJECT_MANIFESTS = {n for names in PACKAGES.values() for n in names}
+
+
+# a directory with its own package manifest, plus the files below it no deeper project
+# claims. path is posix relative to the repo root, "" for the root itself
+class Project:
+    def __init__(self, path: str, manifests: List[Path]) -> None:
+        self.path = path
+        self.manifests = manifests
+        self.files: List[Path] = []
+        self.package_manager = get_packages(manifests)
+        self.frameworks = FrameworkDetector()
+        self.packages: Counter = Counter()
+        self.dependencies: Dict[str, List[str]] = {}
+
+    # prefix for paths inside the project, as taken by repo.path
+    @property
+    def base(self) -> str:
+        return f"{self.path}/" if self.path else ""
+
+    @property
+    def label(self) -> str:
+        return self.path or "(root)"
+
+    def to_dict(self, repo: Any) -> Dict[str, Any]:
+        return {
+            "path": self.label,
+            "package_manager": self.package_manager,
+            "languages": get_languages(self.files),
+            "frameworks": self.frameworks.result(),
+            "entry_points": detect_entry_points(repo, self.files, base=self.base),
+            "dependencies": self.dependencies,
+            "files": len(self.files),
+        }
+
+
+# finds every directory holding a package manifest, at any depth, and assigns each file to
+# the deepest one containing it. returns the projects, shallowest first, and file -> project
+def discover_projects(root: Any, files: List[Path]) -> Tuple[List[Project], Dict[Path, Project]]:
+    root_str = as_repo(root).root.as_posix()
+    prefix = "" if root_str == "." else root_str.rstrip("/") + "/"
+    manifests: Dict[str, List[Path]] = {}
+    dirs: List[str] = []
 
-            for child in iter_children:
-                if len(children) >= 200:
+    for f in files:
+        p = f.as_posix()
+        d = (p[len(prefix):] if p.startswith(prefix) else p).rpartition("/")[0]
+        dirs.append(d)
+        if f.name in PROJECT_MANIFESTS and not PROJECT_SKIP_DIRS.intersection(d.split("/")):
+            manifests.setdefault(d, []).append(f)
+
+    chosen = sorted(manifests, key=lambda d: (d.count("/") + 1 if d else 0, d))[:MAX_PROJECTS]
+    projects = {d: Project(d, manifests[d]) for d in chosen}
+    owner: Dict[Path, Project] = {}
+    # directory -> nearest enclosing project, filled in as directories are seen
+    nearest: Dict[str, Optional[Project]] = {}
+
+    for f, d in zip(files, dirs):
+        project = nearest.get(d, False)
+        if project is False:
+            up = d
+            while True:
+                project = projects.get(up)
+                if project is not None or not up:
                     break
-                cn = node(child, depth + 1)
-                if cn:
-                    children.append(cn)
+                up = up.rpartition("/")[0]
+            nearest[d] = project
+        if project is not None:
+            owner[f] = project
+            project.files.append(f)
+
+    return list(projects.values()), owner
+
+
+# prefixes read ahead of the detectors, per i/o thread
+READ_AHEAD = 4
+# planned files whose cached detector results are fetched from the scan cache in one go
+SCAN_PREFETCH = 512
+
+# files read first, by name: manifests, then framework and deploy config, then entry points
+MANIFEST_NAMES = {n.lower() for names in PACKAGES.values() for n in names} | {
+    "go.sum", "gemfile", "pom.xml", "build.gradle", "build.gradle.kts", "composer.json",
+}
+CONFIG_NAMES = set(ENV_FILE_NAMES) | {
+    "next.config.js", "next.config.mjs", "next.config.ts", "nuxt.config.js", "nuxt.config.ts",
+    "vite.config.js", "vite.config.ts", "vue.config.js", "svelte.config.js", "angular.json",
+    "tsconfig.json", "settings.py", "wsgi.py", "asgi.py", "manage.py", "config.ru",
+    "dockerfile", "docker-compose.yml", "docker-compose.yaml", "procfile",
+}
+ENTRY_NAMES = {
+    "main.py", "app.py", "server.py", "index.py", "index.js", "server.js", "app.js",
+    "index.ts", "main.ts", "server.ts", "main.go",
+}
+
+
+# orders files by how useful they are likely to be: manifests, config files and entry
+# points first (shallowest first), then one file per directory in turn, so any prefix
+# of the order is a sample spread across the whole repo
+def schedule_files(files: List[Path]) -> List[Path]:
+    tiers: List[List[Path]] = [[], [], []]
+    groups: Dict[str, List[Path]] = {}
 
-            return {"name": p.name, "type": "dir", "children": children}
+    for f in files:
+        name = f.name.lower()
+        if name in MANIFEST_NAMES:
+            tiers[0].append(f)
+        elif name in CONFIG_NAMES:
+            tiers[1].append(f)
+        elif name in ENTRY_NAMES:
+            tiers[2].append(f)
         else:
-            # st_size is an attribute (not a function)
-            try:
-                size = p.stat().st_size
-            except Exception:
-                size = None
-            return {"name": p.name, "type": "file", "size": size}
+            groups.setdefault(f.parent.as_posix(), []).append(f)
+
+    ordered = [f for tier in tiers for f in sorted(tier, key=lambda p: (len(p.parts), p.as_posix()))]
+
+    active = [groups[d] for d in sorted(groups, key=lambda d: (d.count("/"), d))]
+    rank = 0
+    while active:
+        ordered.extend(q[rank] for q in active)
+        rank += 1
+        active = [q for q in active if len(q) > rank]
+
+    return ordered
+
+
+# pairs each file with the detectors that want it: the first sample_limit files go to
+# every detector, the rest only to detectors marked full. a detector's wants() filters further
+def _scan_plan(files: List[Path], detectors: List[Any], sample_limit: Optional[int]) -> List[tuple]:
+    plan = []
+    full = [d for d in detectors if getattr(d, "full", False)]
+    limit = len(files) if sample_limit is None else sample_limit
+
+    for i, f in enumerate(files):
+        pool = detectors if i < limit else full
+        if not pool:
+            break
+        wanted = [d for d in pool if not hasattr(d, "wants") or d.wants(f)]
+        if wanted:
+            plan.append((f, wanted, max(d.max_chars for d in wanted)))
+
+    return plan
+
+
+# detector code and tables (FRAMEWORKS, ENV_MARKERS, the import extractor); part of every
+# scan key, so a deploy that changes them doesn't read results from the persistent cache
+SCAN_VERSION = cache.code_version(__file__, imports.__file__, consts.__file__)
+
+
+# per-file results are keyed by the detector, its prefix length and the file's (crc, size),
+# so a re-upload only reads the members that changed
+def _scan_key(detector: Any, path: Path, fp: tuple) -> str:
+    return f"{SCAN_VERSION}:{detector.name}:{detector.max_chars}:{path.as_posix()}:{fp[0]:08x}:{fp[1]}"
+
+
+def _live(detectors: List[Any]) -> bool:
+    return any(not getattr(d, "done", False) for d in detectors)
+
+
+# reads planned files in order and hands each text to the detectors that want it and
+# are not yet resolved. files nobody needs any more are skipped, and the scan stops when
+# every detector is resolved, a budget runs out or cancel (anything with is_set()) is set. prefixes are read
+# concurrently on the i/o pool but fed in file order, so results don't depend on which
+# read finishes first. returns what was read and why the scan stopped
+def scan_files(files: List[Path], detectors: List[Any], sample_limit: Optional[int] = None, repo: Any = None,
+               cancel: Any = None, time_budget: float = SCAN_TIME_BUDGET,
+               byte_budget: int = SCAN_BYTE_BUDGET) -> Dict[str, Any]:
+    stats = {"files_read": 0, "files_cached": 0, "chars_read": 0, "stopped": "complete"}
+    if not detectors:
+        return stats
+
+    read = repo.read_text if repo is not None else read_text_safe
+    fingerprint = getattr(repo, "fingerprint", None) if cache.CACHE_ENABLED else None
+    plan = _scan_plan(files, detectors, sample_limit)
+    deadline = time.monotonic() + time_budget if time_budget > 0 else None
+
+    def stop_reason() -> Optional[str]:
+        if cancel is not None and cancel.is_set():
+            return "cancelled"
+        if deadline is not None and time.monotonic() >= deadline:
+            return "time_budget"
+        if byte_budget > 0 and stats["chars_read"] >= byte_budget:
+            return "byte_budget"
+        if not _live(detectors):
+            return "resolved"
+        return None
+
+    # cached results are fetched for SCAN_PREFETCH planned files at a time, so a cold
+    # scan costs one cache query per stretch of files rather than one per file
+    prefetched: Dict[str, bytes] = {}
+    fetched_to = 0
+
+    def prefetch(upto: int) -> None:
+        nonlocal fetched_to
+        if fingerprint is None or upto <= fetched_to:
+            return
+        end = min(len(plan), max(upto, fetched_to + SCAN_PREFETCH))
+        keys = []
+        for f, wanted, _ in plan[fetched_to:end]:
+            fp = fingerprint(f)
+            if fp is not None:
+                keys.extend(_scan_key(d, f, fp) for d in wanted
+                            if hasattr(d, "extract") and not getattr(d, "done", False))
+        prefetched.update(cache.scan_results.get_many(keys))
+        fetched_to = end
+
+    # cached results for the live detectors on plan[n], whether the text is still needed,
+    # and the (crc, size) fingerprint the results are stored under
+    def lookup(n: int) -> tuple:
+        f, wanted, _ = plan[n]
+        prefetch(n + 1)
+        fp = fingerprint(f) if fingerprint is not None else None
+        hits: Dict[int, Any] = {}
+
+        if fp is not None:
+            for i, d in enumerate(wanted):
+                if hasattr(d, "extract") and not getattr(d, "done", False):
+                    raw = prefetched.pop(_scan_key(d, f, fp), None)
+                    if raw is not None:
+                        hits[i] = json.loads(raw)
+
+        need = any(i not in hits and not getattr(d, "done", False) for i, d in enumerate(wanted))
+        return hits, need, fp
+
+    def feed(f: Path, wanted: List[Any], txt: Optional[str], hits: Dict[int, Any], fp: Optional[tuple]) -> None:
+        if txt is None:
+            stats["files_cached"] += 1
+        else:
+            stats["files_read"] += 1
+            stats["chars_read"] += len(txt)
+
+        for i, d in enumerate(wanted):
+            if getattr(d, "done", False):
+                continue
+            if i in hits:
+                d.apply(f, hits[i])
+            elif txt is None:
+                continue
+            elif hasattr(d, "extract"):
+                value = d.extract(f, txt)
+                if fp is not None:
+                    cache.scan_results.put(_scan_key(d, f, fp), json.dumps(value).encode("utf-8"))
+                d.apply(f, value)
+            else:
+                d.feed(f, txt)
+
+    if workers.IO_THREADS <= 1 or len(plan) < 2:
+        for n, (f, wanted, max_chars) in enumerate(plan):
+            reason = stop_reason()
+            if reason:
+                stats["stopped"] = reason
+                return stats
+            if _live(wanted):
+                hits, need, fp = lookup(n)
+                feed(f, wanted, read(f, max_chars=max_chars) if need else None, hits, fp)
+        return stats
+
+    pool = workers.get_io_executor()
+    window = workers.IO_THREADS * READ_AHEAD
+    pending: Dict[int, Any] = {}
+    submitted = 0
 
-    return node(root, 0)
+    try:
+        for i, (f, wanted, _) in enumerate(plan):
+            reason = stop_reason()
+            if reason:
+                stats["stopped"] = reason
+                return stats
+
+            while submitted < len(plan) and submitted < i + window:
+                nf, nwanted, nmax = plan[submitted]
+                if _live(nwanted):
+                    hits, need, fp = lookup(submitted)
+                    fut = pool.submit(read, nf, max_chars=nmax) if need else None
+                    pending[submitted] = (fut, hits, fp)
+                submitted += 1
+
+            entry = pending.pop(i, None)
+            if entry is not None:
+                fut, hits, fp = entry
+                feed(f, wanted, fut.result() if fut is not None else None, hits, fp)
+    finally:
+        for fut, _, _ in pending.values():
+            if fut is not None:
+                fut.cancel()
+
+    return stats
+
+
+# runs all content detectors over a single pass of the repo files. manifests at any depth
+# mark sub-projects; each gets its own dependencies, frameworks, entry points and import
+# ranking from the same pass, and the repo-level fields merge them
+def scan_repo(root: Any, files: List[Path], sample_limit: Optional[int] = None,
+              cancel: Any = None) -> Dict[str, Any]:
+    repo = as_repo(root)
+    projects, owner = discover_projects(repo, files)
+    for project in projects:
+        project.dependencies = get_manifest_dependencies(repo, project.manifests, base=project.base)
+
+    frameworks = ProjectFrameworkDetector(projects, owner)
+    env = EnvDetector(repo, files)
+    import_detector = ImportDetector(repo, files, owner)
+
+    scan = scan_files(schedule_files(files), [frameworks, env, import_detector],
+                      sample_limit=sample_limit, repo=repo, cancel=cancel)
+    cache.scan_results.flush()
+
+    for project in projects:
+        if not project.dependencies:
+            project.dependencies["heuristic"] = [
+                pkg for pkg, _ in sorted(project.packages.items(), key=lambda x: (-x[1], x[0]))[:200]]
+
+    if not projects:
+        dependencies = {"heuristic": import_detector.result()}
+        package_manager = get_packages(files)
+        entry_points = detect_entry_points(repo, files)
+    elif len(projects) == 1:
+        dependencies = projects[0].dependencies
+        if "heuristic" in dependencies:
+            dependencies = {"heuristic": import_detector.result()}
+        package_manager = projects[0].package_manager
+        entry_points = _unique(detect_entry_points(repo, projects[0].files, base=projects[0].base)
+                               + detect_entry_points(repo, [f for f in files if f not in owner]))
+    else:
+        dependencies = {f"{p.label}: {k}": v for p in projects for k, v in p.dependencies.items()}
+        package_manager = ", ".join(_unique([p.package_manager for p in projects if p.package_manager])) or None
+        entry_points = _unique([e for p in projects for e in detect_entry_points(repo, p.files, base=p.base)]
+                               + detect_entry_points(repo, [f for f in files if f not in owner]))
+
+    return {
+        "frameworks": frameworks.result(),
+        "env_files": env.result(),
+        "dependencies": dependencies,
+        "package_manager": package_manager,
+        "entry_points": entry_points,
+        "projects": [p.to_dict(repo) for p in projects],
+        "import_graph": import_detector.graph.to_dict(),
+        "scan": scan,
+    }
+
+
+def _unique(items: List[str]) -> List[str]:
+    return list(dict.fromkeys(items))
+
+
+# writes one uploaded zip to disk chunk by chunk, hashing and validating in the same pass:
+# the name is checked before anything is written, the signature on the first bytes and the
+# size on every chunk, so a bad upload is rejected as soon as the bad bytes arrive
+class UploadWriter:
+    def __init__(self, tmp: Path, filename: Optional[str], hasher: Any = None, chunk_size: int = UPLOAD_CHUNK) -> None:
+        self.dest = tmp / Path(filename or "upload.zip").name
+        if self.dest.suffix.lower() not in {s.lower() for s in UPLOAD_EXT}:
+            raise HTTPException(status_code=400, detail="Not in approved format")
+
+        self.hasher = hasher
+        self.chunk_size = chunk_size
+        self.total = 0
+        self.head = b""
+        self.tail = b""
+        self.buf: List[bytes] = []
+        self.buffered = 0
+        self.f: Any = None
+
+    async def write(self, chunk: bytes) -> None:
+        if not chunk:
+            return
+
+        # multipart data can arrive a few bytes at a time, so the signature waits for 4
+        if len(self.head) < 4:
+            self.head = (self.head + chunk)[:4]
+            if len(self.head) == 4 and self.head not in (ZIP_LOCAL_SIG, ZIP_EOCD_SIG):
+                raise HTTPException(status_code=400, detail="Not a zip archive")
+
+        self.total += len(chunk)
+        if self.total > MAX_UPLOAD:
+            raise HTTPException(status_code=413, detail="Upload too large")
+
+        if self.hasher is not None:
+            self.hasher.update(chunk)
+        self.tail = (self.tail + chunk)[-EOCD_SEARCH:]
+
+        self.buf.append(chunk)
+        self.buffered += len(chunk)
+        if self.buffered >= self.chunk_size:
+            await self._flush()
+
+    async def _flush(self) -> None:
+        if self.f is None:
+            self.f = await run_in_threadpool(self.dest.open, "wb")
+        data = b"".join(self.buf)
+        self.buf = []
+        self.buffered = 0
+        await run_in_threadpool(self.f.write, data)
+
+    async def finish(self) -> Path:
+        if self.total == 0:
+            raise HTTPException(status_code=400, detail="Empty upload")
+        if len(self.head) < 4:
+            raise HTTPException(status_code=400, detail="Not a zip archive")
+        # the end-of-central-directory record sits in the last 64 KiB + 22 bytes
+        if ZIP_EOCD_SIG not in self.tail:
+            raise HTTPException(status_code=400, detail="Truncated zip archive")
+
+        await self._flush()
+        self.f.close()
+        self.f = None
+        return self.dest
+
+    def abort(self) -> None:
+        if self.f is not None:
+            self.f.close()
+            self.f = None
+        self.dest.unlink(missing_ok=True)
+
+
+# the checks UploadWriter makes while streaming, for a zip already on disk such as a bundle member
+def check_zip(path: Path) -> None:
+    size = path.stat().st_size
+    if size == 0:
+        raise HTTPException(status_code=400, detail="Empty upload")
+    if size > MAX_UPLOAD:
+        raise HTTPException(status_code=413, detail="Upload too large")
 
+    with path.open("rb") as f:
+        head = f.read(4)
+        f.seek(max(0, size - EOCD_SEARCH))
+        tail = f.read()
+    if head not in (ZIP_LOCAL_SIG, ZIP_EOCD_SIG):
+        raise HTTPException(status_code=400, detail="Not a zip archive")
+    if ZIP_EOCD_SIG not in tail:
+        raise HTTPException(status_code=400, detail="Truncated zip archive")
 
-# check for env files
-def get_env(root: Path, files: List[Path]) -> List[str]:
-    res = set()
-    names = {f.name for f in files}
 
-    for i in (".env", ".env.example", ".env.local", ".env.sample"):
-        if i in names:
-            res.add(i)
+# save upload zipfile to temporary directory, hashing and validating in the same pass
+async def save_upload(tmp: Path, upload: UploadFile, hasher: Any = None, chunk_size: int = UPLOAD_CHUNK) -> Path:
+    if upload.size is not None and upload.size > MAX_UPLOAD:
+        raise HTTPException(status_code=413, detail="Upload too large")
+
+    writer = UploadWriter(tmp, upload.filename, hasher, chunk_size)
+    try:
+        while True:
+            chunk = await upload.read(chunk_size)
+            if not chunk:
+                break
+            await writer.write(chunk)
+        return await writer.finish()
+    except BaseException:
+        writer.abort()
+        raise
+
+
+# reads a multipart body straight off the request and writes each file part named field
+# through an UploadWriter while it arrives, instead of letting the framework spool the whole
+# body first. body_limit also bounds chunked bodies, which have no content-length.
+# returns one dict per file: source, tmpdir (from make_dir), zip_path and sha256, or source
+# and error once a file is rejected. strict raises the first rejection instead, for
+# endpoints that take a single file
+async def receive_uploads(request: Request, field: str, make_dir: Callable[[], Path], body_limit: int,
+                          max_files: int = 1, strict: bool = True) -> List[Dict[str, Any]]:
+    content_type, options = parse_options_header(request.headers.get("content-type", ""))
+    boundary = options.get(b"boundary")
+    if content_type != b"multipart/form-data" or not boundary:
+        raise HTTPException(status_code=422, detail="Expected a multipart/form-data body")
+
+    # parser callbacks only record what they see; the async loop below acts on it
+    events: List[Tuple[str, Any]] = []
+    headers: Dict[bytes, bytes] = {}
+    name = value = b""
+    ended = False
+
+    def on_header_field(data: bytes, start: int, end: int) -> None:
+        nonlocal name
+        name += data[start:end]
+
+    def on_header_value(data: bytes, start: int, end: int) -> None:
+        nonlocal value
+        value += data[start:end]
+
+    def on_header_end() -> None:
+        nonlocal name, value
+        headers[name.lower()] = value
+        name = value = b""
+
+    def on_headers_finished() -> None:
+        events.append(("headers", dict(headers)))
+        headers.clear()
+
+    def on_end() -> None:
+        nonlocal ended
+        ended = True
+
+    parser = MultipartParser(boundary, {
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_part_data": lambda data, start, end: events.append(("data", data[start:end])),
+        "on_part_end": lambda: events.append(("end", None)),
+        "on_end": on_end,
+    })
+
+    items: List[Dict[str, Any]] = []
+    item: Optional[Dict[str, Any]] = None
+    writer: Optional[UploadWriter] = None
+
+    def reject(e: HTTPException) -> None:
+        nonlocal writer
+        if writer is not None:
+            writer.abort()
+            writer = None
+        shutil.rmtree(item.pop("tmpdir"), ignore_errors=True)
+        item.pop("hasher", None)
+        if strict:
+            raise e
+        item["error"] = {"status_code": e.status_code, "detail": e.detail}
+
+    try:
+        received = 0
+        async for chunk in request.stream():
+            received += len(chunk)
+            if received > body_limit:
+                raise HTTPException(status_code=413, detail="Upload too large")
 
-    for f in files[:400]:  # sample to limit I/O
-        txt = read_text_safe(f, max_chars=2000)
-        if "process.env" in txt or "os.environ" in txt or "dotenv" in txt:
             try:
-                res.add(str(f.relative_to(root)))
-            except Exception:
-                res.add(str(f))
+                parser.write(chunk)
+            except MultipartParseError:
+                raise HTTPException(status_code=400, detail="Malformed multipart body")
+
+            for kind, payload in events:
+                if kind == "headers":
+                    _, disposition = parse_options_header(payload.get(b"content-disposition", b""))
+                    filename = disposition.get(b"filename")
+                    item = writer = None
+                    if disposition.get(b"name", b"").decode("utf-8", "replace") != field or filename is None:
+                        continue
+                    if len(items) >= max_files:
+                        raise HTTPException(status_code=413, detail=f"Request has more than {max_files} files")
+
+                    filename = filename.decode("utf-8", "replace")
+                    item = {"source": filename or "repo.zip", "tmpdir": make_dir(), "hasher": hashlib.sha256()}
+                    items.append(item)
+                    try:
+                        writer = UploadWriter(item["tmpdir"], filename, item["hasher"])
+                    except HTTPException as e:
+                        reject(e)
+
+                elif kind == "data" and writer is not None:
+                    try:
+                        await writer.write(payload)
+                    except HTTPException as e:
+                        reject(e)
+
+                elif kind == "end" and writer is not None:
+                    try:
+                        item["zip_path"] = await writer.finish()
+                        item["sha256"] = item.pop("hasher").hexdigest()
+                    except HTTPException as e:
+                        reject(e)
+                    writer = None
+            events.clear()
+
+        if not ended:
+            raise HTTPException(status_code=400, detail="Incomplete multipart body")
+        if not items:
+            raise HTTPException(status_code=422, detail=f"Missing file field '{field}'")
+    except BaseException:
+        if writer is not None:
+            writer.abort()
+        for it in items:
+            if "tmpdir" in it:
+                shutil.rmtree(it["tmpdir"], ignore_errors=True)
+        raise
+
+    return items
+
+# list all files out
+def get_files(root: Path, entries: int = 2000) -> List[Path]:
+    return walk(root, entries=entries, max_depth=0)[0]
+
+# create a tree structure for file mapping
+def make_tree(root: Path, max_depth: int = 6, max_entries: int = 500) -> Dict[str, Any]:
+    return walk(root, entries=0, max_depth=max_depth)[1].to_dict()
 
-    return sorted(res)
+
+# check for env files
+def get_env(root: Any, files: List[Path]) -> List[str]:
+    repo = as_repo(root)
+    detector = EnvDetector(repo, files)
+    scan_files(schedule_files(files), [detector], repo=repo)
+    return detector.result()
 
 # check for testing files
 def get_test(root: Path, files: List[Path]) -> bool:
@@ -186,32 +971,35 @@ def get_test(root: Path, files: List[Path]) -> bool:
     return False
 
 
-# find dependencies based on package
-def get_dependencies(root: Path, files: List[Path]) -> Dict[str, List[str]]:
+# find dependencies declared in package manifests; base is a sub-project's "dir/" prefix
+def get_manifest_dependencies(root: Any, files: List[Path], base: str = "") -> Dict[str, List[str]]:
+    repo = as_repo(root)
     package = get_packages(files)
     res = {}
 
     if package:
         if package == "npm":
-            pj = root / "package.json"
-            if pj.exists():
-                pj_txt = json.loads(pj.read_text(encoding="utf-8"))
+            pj = repo.path(base + "package.json")
+            if repo.exists(pj):
+                try:
+                    pj_txt = json.loads(repo.read_text(pj))
+                except ValueError:
+                    pj_txt = {}
                 for k in ("dependencies", "devDependencies", "peerDependencies", "optionalDependencies"):
-                    if isinstance(pj_txt.get(k), dict):
+                    if isinstance(pj_txt, dict) and isinstance(pj_txt.get(k), dict):
                         res[k] = list(pj_txt.get(k).keys())[:200]
 
         elif package == "pip":
-            req = root / "requirements.txt"
-            if req.exists():
-                lines = [l.strip() for l in req.read_text(encoding="utf-8").splitlines() if l.strip() and not l.strip().startswith("#")]
+            req = repo.path(base + "requirements.txt")
+            if repo.exists(req):
+                lines = [l.strip() for l in repo.read_text(req).splitlines() if l.strip() and not l.strip().startswith("#")]
                 res["requirements.txt"] = lines[:200]
 
-            pyproj = root / "pyproject.toml"
+            pyproj = repo.path(base + "pyproject.toml")
 
-            if pyproj.exists() and tomllib:
+            if repo.exists(pyproj) and tomllib:
                 try:
-                    content = pyproj.read_bytes()
-                    parsed = tomllib.loads(content) if hasattr(tomllib, "loads") else tomllib.loads(pyproj.read_text())
+                    parsed = tomllib.loads(repo.read_text(pyproj))
                     tool = parsed.get("tool", {})
                     poetry = tool.get("poetry") or parsed.get("project")
 
@@ -227,71 +1015,69 @@ def get_dependencies(root: Path, files: List[Path]) -> Dict[str, List[str]]:
                     pass
 
         elif package == "go":
-            gm = root / "go.mod"
-            if gm.exists():
-                txt = gm.read_text(encoding="utf-8")
+            gm = repo.path(base + "go.mod")
+            if repo.exists(gm):
+                txt = repo.read_text(gm)
                 matches = re.findall(r"^\s*require\s+([^\s]+)", txt, flags=re.MULTILINE)
                 res["go.mod"] = matches[:200]
 
         elif package == "cargo":
-            cm = root / "Cargo.toml"
+            cm = repo.path(base + "Cargo.toml")
 
-            if cm.exists():
-                text = cm.read_text(encoding="utf-8", errors="ignore")
+            if repo.exists(cm):
+                text = repo.read_text(cm)
                 matches = re.findall(r'^\s*([\w_-]+)\s*=\s*".+"', text, flags=re.MULTILINE)
                 res["cargo"] = matches[:200]
 
-    if not res:
-        heuristic = []
-        for f in files[:400]:
-            txt = read_text_safe(f, max_chars=4000)
-
-            for m in re.finditer(r"^\s*(?:from\s+([A-Za-z0-9_\.]+)\s+import|import\s+([A-Za-z0-9_\.]+))", txt, flags=re.MULTILINE):
-                module = m.group(1) or m.group(2)
-                if module:
-                    heuristic.append(module.split(".")[0])
+    return res
 
-            for m in re.finditer(r"(?:require\(|from\s+|import\s+).?['\"]([a-zA-Z0-9@/\-_\.\$]+)['\"]", txt):
-                heuristic.append(m.group(1))
+# find dependencies based on package, falling back to scanning imports
+def get_dependencies(root: Any, files: List[Path]) -> Dict[str, List[str]]:
+    repo = as_repo(root)
+    res = get_manifest_dependencies(repo, files)
 
-        res["heuristic"] = sorted(set(heuristic), key=lambda x: heuristic.count(x), reverse=True)[:200]
+    if not res:
+        detector = ImportDetector(repo, files)
+        scan_files(files, [detector], repo=repo)
+        res["heuristic"] = detector.result()
 
     return res
 
-# find entry points from files
-def detect_entry_points(root: Path, files: List[Path]) -> List[str]:
+# find entry points from files; base is a sub-project's "dir/" prefix
+def detect_entry_points(root: Any, files: List[Path], base: str = "") -> List[str]:
+    repo = as_repo(root)
     entries = []
     filename_map = {f.name.lower(): f for f in files}
 
     for cand in ("main.py", "app.py", "server.py", "manage.py", "index.py"):
         if cand in filename_map:
             try:
-                entries.append(str(filename_map[cand].relative_to(root)))
+                entries.append(str(filename_map[cand].relative_to(repo.root)))
             except Exception:
                 entries.append(str(filename_map[cand]))
 
     for cand in ("index.js", "server.js", "app.js", "index.ts"):
         if cand in filename_map:
             try:
-                entries.append(str(filename_map[cand].relative_to(root)))
+                entries.append(str(filename_map[cand].relative_to(repo.root)))
             except Exception:
                 entries.append(str(filename_map[cand]))
 
-    pj = root / "package.json"
-    if pj.exists():
+    pj = repo.path(base + "package.json")
+    if repo.exists(pj):
         try:
-            pjtxt = json.loads(pj.read_text(encoding="utf-8"))
+            pjtxt = json.loads(repo.read_text(pj))
             main = pjtxt.get("main")
             if main:
-                entries.append(main)
+                entries.append(base + main)
             scripts = pjtxt.get("scripts", {})
             if isinstance(scripts, dict) and "start" in scripts:
-                entries.append("npm start (script)")
+                entries.append(f"npm start ({base}package.json)" if base else "npm start (script)")
         except Exception:
             pass
 
-    if (root / "go.mod").exists():
-        entries.append("go module (go.mod)")
+    if repo.exists(repo.path(base + "go.mod")):
+        entries.append(f"go module ({base}go.mod)")
 
     seen = set()
     out = []
@@ -301,27 +1087,25 @@ def detect_entry_points(root: Path, files: List[Path]) -> List[str]:
             seen.add(e)
     return out
 
-# convert file tree structure to .md
-def tree_to_markdown(tree: dict, prefix: str = "") -> str:
+# convert file tree structure to .md; takes a FileTree or the nested dict form
+def tree_to_markdown(tree: Any, prefix: str = "") -> str:
+    if not tree:
+        return ""
+
+    t = as_tree(tree)
     lines = []
 
-    def walk(node: dict, indent: str):
-        name = node.get("name", "")
-        ntype = node.get("type", "dir")
-        if ntype == "dir":
+    for i, name in enumerate(t.names):
+        indent = "  " * t.depths[i]
+        if t.is_dir(i):
             lines.append(f"{indent}{name}/")
-            for child in node.get("children", []):
-                walk(child, indent + "  ")
         else:
-            size = node.get("size")
+            size = t.size(i)
             if size is None:
                 lines.append(f"{indent}{name}")
             else:
                 lines.append(f"{indent}{name} ({size} bytes)")
 
-    if not tree:
-        return ""
-    walk(tree, "")
     return "\n".join(lines)
 
 # replaces blanks in template.md
@@ -350,36 +1134,31 @@ def render_template(template_path: Path, mapping: dict) -> str:
 def re_placeholder_cleanup(s: str) -> str:
     return re.sub(r"\{[^\}]+\}", "", s)
 
-# creates iterator from files
-def file_iterator(path: Path, chunk_size: int = 8192) -> Iterator[bytes]:
-    with path.open("rb") as f:
-        while True:
-            chunk = f.read(chunk_size)
-            if not chunk:
-                break
-            yield chunk
-
-# streams directory out to user
-def stream_dir(root_dir: Path, download_name: str) -> StreamingResponse:
-    parent = root_dir.parent or Path("/tmp")
-    base = parent / f"{root_dir.name}_archive"
-    archive_path_str = shutil.make_archive(base_name=str(base), format="zip", root_dir=str(root_dir))
-    archive_path = Path(archive_path_str)
-
-    iterator = file_iterator(archive_path)
+# streams zip bytes out to user as they're produced, removing cleanup_dirs once the
+# response ends; the generator's finally also runs when the client hangs up mid-stream
+def stream_zip(chunks: Iterator[bytes], download_name: str, cleanup_dirs: Iterable[Path] = (),
+               on_done: Optional[Callable[[int], None]] = None) -> StreamingResponse:
     filename_header = download_name if download_name.endswith(".zip") else f"{download_name}.zip"
     headers = {"Content-Disposition": f'attachment; filename="{filename_header}"'}
+    dirs = list(cleanup_dirs)
 
-    def cleanup(archive_p=archive_path, root_p=root_dir):
+    def iterator() -> Iterator[bytes]:
+        sent = 0
         try:
-            if archive_p.exists():
-                archive_p.unlink()
-        except Exception:
-            pass
-        
-        try:
-            shutil.rmtree(root_p, ignore_errors=True)
-        except Exception:
-            pass
-
-    return StreamingResponse(iterator, media_type="application/zip", headers=headers, background=BackgroundTask(cleanup))
\ No newline at end of file
+            for chunk in chunks:
+                sent += len(chunk)
+                yield chunk
+            if on_done is not None:
+                on_done(sent)
+        finally:
+            close = getattr(chunks, "close", None)
+            if close is not None:
+                close()
+            for d in dirs:
+                shutil.rmtree(d, ignore_errors=True)
+
+    return StreamingResponse(iterator(), media_type="application/zip", headers=headers)
+
+# streams directory out to user, zipping it on the fly
+def stream_dir(root_dir: Path, download_name: str) -> StreamingResponse:
+    return stream_zip(archive.stream_dir_archive(root_dir), download_name, cleanup_dirs=[root_dir])
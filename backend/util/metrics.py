@@ -0,0 +1,272 @@
+import os
+import json
+import time
+import uuid
+import fcntl
+import tempfile
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+BYTES_BUCKETS = tuple(1024 * 4 ** i for i in range(11))
+COUNT_BUCKETS = (10, 50, 100, 500, 1000, 2000, 5000, 20000, 100000, 200000)
+# every web worker writes its counters here so a scrape answered by any of them covers all
+METRICS_DIR = Path(os.getenv("DOX_METRICS_DIR", str(Path(tempfile.gettempdir()) / "dox_metrics")))
+# seconds between a worker's snapshots; a scrape always snapshots the worker answering it
+METRICS_FLUSH_INTERVAL = float(os.getenv("DOX_METRICS_FLUSH_INTERVAL", "5"))
+# counters of workers that have exited, folded together so their files don't pile up
+RETIRED = "retired.json"
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: Dict[str, str]) -> Labels:
+    return tuple(sorted(labels.items()))
+
+def _escape(v: str) -> str:
+    return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _fmt_labels(labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+    items = list(labels) + ([extra] if extra else [])
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in items) + "}"
+
+def _fmt_num(v: float) -> str:
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str) -> None:
+        self.name = name
+        self.help_text = help_text
+        self.values: Dict[Labels, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = _labels(labels)
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    # values defaults to this process's own
+    def render(self, values: Optional[Dict[Labels, float]] = None) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, v in sorted((self.values if values is None else values).items()):
+                lines.append(f"{self.name}{_fmt_labels(labels)} {_fmt_num(v)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, buckets: Tuple[float, ...]) -> None:
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.series: Dict[Labels, List[float]] = {}
+        self._lock = threading.Lock()
+
+    # series layout: one count per bucket, then +Inf count, then sum
+    def observe(self, value: float, **labels: str) -> None:
+        key = _labels(labels)
+        with self._lock:
+            s = self.series.setdefault(key, [0] * (len(self.buckets) + 1) + [0.0])
+            for i, b in enumerate(self.buckets):
+                if value <= b:
+                    s[i] += 1
+            s[len(self.buckets)] += 1
+            s[-1] += value
+
+    # series defaults to this process's own
+    def render(self, series: Optional[Dict[Labels, List[float]]] = None) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for labels, s in sorted((self.series if series is None else series).items()):
+                for i, b in enumerate(self.buckets):
+                    lines.append(f"{self.name}_bucket{_fmt_labels(labels, ('le', _fmt_num(b)))} {s[i]}")
+                lines.append(f"{self.name}_bucket{_fmt_labels(labels, ('le', '+Inf'))} {s[len(self.buckets)]}")
+                lines.append(f"{self.name}_sum{_fmt_labels(labels)} {_fmt_num(s[-1])}")
+                lines.append(f"{self.name}_count{_fmt_labels(labels)} {s[len(self.buckets)]}")
+        return lines
+
+
+# collects per-stage wall time for one request; plain dicts so it crosses process pools
+class StageTimer:
+    def __init__(self) -> None:
+        self.stages: Dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def add(self, name: str, seconds: float) -> None:
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def merge(self, stages: Dict[str, float]) -> None:
+        for name, seconds in stages.items():
+            self.add(name, seconds)
+
+    # Server-Timing header value, durations in milliseconds
+    def header(self) -> str:
+        return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.stages.items())
+
+
+stage_duration = Histogram("dox_stage_duration_seconds", "Wall time per pipeline stage.", DURATION_BUCKETS)
+stage_bytes = Histogram("dox_stage_bytes", "Bytes processed per pipeline stage.", BYTES_BUCKETS)
+stage_files = Histogram("dox_stage_files", "Files handled per pipeline stage.", COUNT_BUCKETS)
+render_backend = Counter("dox_render_backend_total", "Diagram renders by the backend that produced the svg.")
+analyses = Counter("dox_analyses_total", "Analyses by outcome.")
+
+REGISTRY = [stage_duration, stage_bytes, stage_files, render_backend, analyses]
+
+
+# records the timings and sizes reported by one pipeline run
+def observe(stages: Dict[str, float], stats: Dict[str, int], backend: Optional[str]) -> None:
+    for name, seconds in stages.items():
+        stage_duration.observe(seconds, stage=name)
+
+    if "upload_bytes" in stats:
+        stage_bytes.observe(stats["upload_bytes"], stage="upload")
+    if "scan_bytes" in stats:
+        stage_bytes.observe(stats["scan_bytes"], stage="scan")
+    if "files" in stats:
+        stage_files.observe(stats["files"], stage="list_files")
+    if "files_read" in stats:
+        stage_files.observe(stats["files_read"], stage="scan")
+    if "files_cached" in stats:
+        stage_files.observe(stats["files_cached"], stage="scan_cached")
+
+    if backend is not None:
+        render_backend.inc(backend=backend)
+
+
+# cache hit/miss counters, which live on the caches themselves
+def cache_lines(caches: Dict[str, Dict[str, int]]) -> List[str]:
+    lines = []
+    for field in ("hits", "misses"):
+        name = f"dox_cache_{field}_total"
+        lines.append(f"# HELP {name} Cache {field} by cache.")
+        lines.append(f"# TYPE {name} counter")
+        for cache_name, stats in sorted(caches.items()):
+            lines.append(f"{name}{_fmt_labels(_labels({'cache': cache_name}))} {stats.get(field, 0)}")
+    return lines
+
+
+_process: Tuple[int, str] = (0, "")
+
+
+# this process's snapshot file; named by pid plus a random suffix so a reused pid can't
+# overwrite the counters of the process that had it before
+def _snapshot_path() -> Path:
+    global _process
+    if _process[0] != os.getpid():
+        _process = (os.getpid(), f"{os.getpid()}-{uuid.uuid4().hex[:8]}.json")
+    return METRICS_DIR / _process[1]
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass
+    return True
+
+
+# this process's counters, histograms and cache stats in json-friendly form
+def snapshot(caches: Dict[str, Dict[str, int]]) -> Dict[str, Any]:
+    series: Dict[str, List[Any]] = {}
+    for metric in REGISTRY:
+        with metric._lock:
+            values = metric.values if isinstance(metric, Counter) else metric.series
+            series[metric.name] = [[list(map(list, labels)), v] for labels, v in values.items()]
+    return {"pid": os.getpid(), "series": series, "caches": caches}
+
+
+# writes this process's snapshot; called periodically and before answering a scrape
+def dump(caches: Dict[str, Dict[str, int]]) -> None:
+    path = _snapshot_path()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(snapshot(caches)), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def _add(total: Dict[str, Any], snap: Dict[str, Any]) -> None:
+    for name, items in snap.get("series", {}).items():
+        merged = total["series"].setdefault(name, {})
+        for labels, v in items:
+            key = tuple(tuple(pair) for pair in labels)
+            if isinstance(v, list):
+                old = merged.get(key)
+                merged[key] = [a + b for a, b in zip(old, v)] if old else list(v)
+            else:
+                merged[key] = merged.get(key, 0) + v
+
+    for cache_name, stats in snap.get("caches", {}).items():
+        merged = total["caches"].setdefault(cache_name, {})
+        for field, v in stats.items():
+            merged[field] = merged.get(field, 0) + v
+
+
+def _plain(total: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "series": {name: [[list(map(list, k)), v] for k, v in items.items()] for name, items in total["series"].items()},
+        "caches": total["caches"],
+    }
+
+
+# sums the snapshots of every worker on the host, this one's taken fresh. snapshots of
+# exited workers are folded into RETIRED under a lock, so each is counted exactly once
+def aggregate(caches: Dict[str, Dict[str, int]]) -> Dict[str, Any]:
+    dump(caches)
+    total: Dict[str, Any] = {"series": {}, "caches": {}}
+
+    with (METRICS_DIR / ".lock").open("a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        retired_path = METRICS_DIR / RETIRED
+        retired: Dict[str, Any] = {"series": {}, "caches": {}}
+        try:
+            _add(retired, json.loads(retired_path.read_text(encoding="utf-8")))
+        except (OSError, ValueError):
+            pass
+
+        exited = []
+        for path in METRICS_DIR.glob("*.json"):
+            if path.name == RETIRED:
+                continue
+            try:
+                snap = json.loads(path.read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                continue
+            if snap.get("pid") != os.getpid() and not _alive(snap.get("pid", 0)):
+                _add(retired, snap)
+                exited.append(path)
+            else:
+                _add(total, snap)
+
+        if exited:
+            tmp = retired_path.with_suffix(".tmp")
+            tmp.write_text(json.dumps(_plain(retired)), encoding="utf-8")
+            os.replace(tmp, retired_path)
+            for path in exited:
+                path.unlink(missing_ok=True)
+
+    _add(total, _plain(retired))
+    return total
+
+
+# prometheus text exposition format, summed over every web worker
+def render(caches: Dict[str, Dict[str, int]]) -> str:
+    total = aggregate(caches)
+    lines: List[str] = []
+    for metric in REGISTRY:
+        lines.extend(metric.render(total["series"].get(metric.name, {})))
+    lines.extend(cache_lines(total["caches"]))
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,374 @@
+import os
+import re
+import logging
+from pathlib import Path
+from typing import Dict, Any, Callable, Optional, Tuple
+from fastapi import HTTPException
+
+try:
+    from . import methods, diagram, archive, metrics, cache
+    from .budget import Budget
+    from .filetree import as_dict
+except ImportError:
+    import util.methods as methods
+    import util.diagram as diagram
+    import util.archive as archive
+    import util.metrics as metrics
+    import util.cache as cache
+    from util.budget import Budget
+    from util.filetree import as_dict
+
+TEMPLATE_PATH = Path(__file__).resolve().parent / "template.md"
+# "zip" analyzes the upload in place; "extract" unpacks it to disk first
+ANALYZE_MODE = os.getenv("DOX_ANALYZE_MODE", "zip").lower()
+# part of every result-cache key, so a deploy that changes the analysis code or the
+# template stops serving results built by the previous one
+RESULT_VERSION = cache.code_version(TEMPLATE_PATH, *Path(__file__).resolve().parent.glob("*.py"))
+
+logger = logging.getLogger(__name__)
+
+PLACEHOLDER_RE = re.compile(r"\{([^\}]+)\}")
+# template.md split into (literal, placeholder) pairs, keyed by its mtime
+_compiled: Dict[Any, list] = {}
+
+# fallback used when template.md is missing
+DEFAULT_TEMPLATE = (
+    "# {project_name}\n\n"
+    "{summary}\n\n"
+    "## Detected Languages\n\n"
+    "{languages}\n\n"
+    "## Detected Frameworks\n\n"
+    "{frameworks}\n\n"
+    "## Package Manager\n\n"
+    "{package_manager}\n\n"
+    "{projects}"
+    "## Entry Points\n\n"
+    "{entry_points}\n\n"
+    "## Project Structure\n\n"
+    "```\n"
+    "{project_structure}\n"
+    "```\n\n"
+    "## Dependencies\n\n"
+    "{dependencies}\n\n"
+    "## Environment Configuration\n\n"
+    "{environment_files}\n\n"
+    "## Test Files Detected\n\n"
+    "{test_status}\n"
+)
+
+
+# picklable stand-in for HTTPException so errors survive a process pool
+class AnalysisError(Exception):
+    def __init__(self, status_code: int, detail: str) -> None:
+        super().__init__(status_code, detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+# opens the upload for analysis, either in place or extracted to tmpdir/repo
+def open_repo(zip_path: Path, tmpdir: Path, budget: Optional[Budget] = None) -> Any:
+    try:
+        if ANALYZE_MODE == "extract":
+            repo_dir = tmpdir / "repo"
+            repo_dir.mkdir(exist_ok=True)
+            methods.unzip(zip_path, repo_dir, budget=budget)
+            return methods.DirRepo(repo_dir)
+
+        return archive.ZipRepo(zip_path, budget=budget)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Failed to unpack zip: {e}")
+
+
+# runs every detector over an opened repo
+def analyze_repo(repo: Any, timer: Optional[metrics.StageTimer] = None,
+                 stats: Optional[Dict[str, Any]] = None, budget: Optional[Budget] = None) -> Dict[str, Any]:
+    timer = timer or metrics.StageTimer()
+
+    with timer.stage("list_files"):
+        files = repo.list_files(methods.MAX_FILES)
+
+    if not files:
+        raise HTTPException(status_code=400, detail="Archive contained no files")
+    if stats is not None:
+        stats["files"] = len(files)
+
+    with timer.stage("detect"):
+        scan = methods.scan_repo(repo, files, cancel=budget)
+    if budget is not None:
+        budget.check()
+    if stats is not None:
+        stats["files_read"] = scan["scan"]["files_read"]
+        stats["files_cached"] = scan["scan"]["files_cached"]
+        stats["scan_bytes"] = scan["scan"]["chars_read"]
+        stats["scan_stopped"] = scan["scan"]["stopped"]
+
+    languages = methods.get_languages(files)
+    frameworks = scan["frameworks"]
+    summary_bits = []
+
+    if languages:
+        summary_bits.append("built with " + ", ".join(languages))
+
+    if frameworks:
+        summary_bits.append("uses " + ", ".join(frameworks))
+
+    projects = scan["projects"]
+    if len(projects) > 1:
+        summary_bits.append(f"{len(projects)} sub-projects (" + ", ".join(p["path"] for p in projects) + ")")
+
+    with timer.stage("detect"):
+        has_tests = methods.get_test(repo, files)
+
+    with timer.stage("tree"):
+        file_tree = repo.tree()
+
+    return {
+        "projectName": "repo",
+        "languages": languages,
+        "frameworks": frameworks,
+        "package_manager": scan["package_manager"],
+        "entry_points": scan["entry_points"],
+        "dependencies": scan["dependencies"],
+        "projects": projects,
+        "has_tests": has_tests,
+        "env_files": scan["env_files"],
+        "file_tree": file_tree,
+        "import_graph": scan["import_graph"],
+        "summary": "; ".join(summary_bits) if summary_bits else "",
+    }
+
+
+# template.md parsed once per process and re-read only when the file changes
+def _template() -> list:
+    try:
+        mtime = TEMPLATE_PATH.stat().st_mtime_ns
+    except OSError:
+        mtime = None
+
+    parts = _compiled.get(mtime)
+    if parts is None:
+        text = TEMPLATE_PATH.read_text(encoding="utf-8") if mtime is not None else DEFAULT_TEMPLATE
+        pieces = PLACEHOLDER_RE.split(text)
+        # literals sit at even indexes and placeholder names at odd ones
+        parts = [(pieces[i], pieces[i + 1] if i + 1 < len(pieces) else None) for i in range(0, len(pieces), 2)]
+        _compiled.clear()
+        _compiled[mtime] = parts
+    return parts
+
+
+# table of sub-projects for monorepos; empty, and so left out, for a single project
+def _projects_section(projects: Optional[list]) -> str:
+    if not projects or len(projects) < 2:
+        return ""
+
+    def cell(values: Any) -> str:
+        if isinstance(values, list):
+            values = ", ".join(values)
+        return str(values or "-").replace("|", "\\|")
+
+    rows = ["## Sub-projects", "", "| Path | Package Manager | Languages | Frameworks | Entry Points |",
+            "| --- | --- | --- | --- | --- |"]
+    for p in projects:
+        rows.append(f"| {cell(p['path'])} | {cell(p['package_manager'])} | {cell(p['languages'])} "
+                    f"| {cell(p['frameworks'])} | {cell(p['entry_points'])} |")
+    return "\n".join(rows) + "\n\n---\n\n"
+
+
+# fills template.md from the analysis metadata
+def render_readme(metadata: Dict[str, Any]) -> str:
+    languages = metadata["languages"]
+    frameworks = metadata["frameworks"]
+    entry_points = metadata["entry_points"]
+    dependencies = metadata["dependencies"]
+    env_files = metadata["env_files"]
+
+    if dependencies:
+        parts = []
+        for k, v in dependencies.items():
+            if isinstance(v, list) and v:
+                parts.append(f"**{k}**\n" + "\n".join(f"- {x}" for x in v))
+            elif isinstance(v, list):
+                parts.append(f"**{k}**: (none detected)")
+            else:
+                parts.append(f"**{k}**: {v}")
+        deps_txt = "\n\n".join(parts)
+    else:
+        deps_txt = "None detected"
+
+    mapping = {
+        "project_name": metadata["projectName"],
+        "summary": metadata["summary"],
+        "languages": "\n".join(languages) if languages else "None detected",
+        "frameworks": "\n".join(frameworks) if frameworks else "None detected",
+        "package_manager": metadata["package_manager"] or "None detected",
+        "projects": _projects_section(metadata.get("projects")),
+        "entry_points": "\n".join(entry_points) if entry_points else "None detected",
+        "project_structure": methods.tree_to_markdown(metadata["file_tree"]),
+        "dependencies": deps_txt,
+        "environment_files": "\n".join(env_files) if env_files else "None detected",
+        "test_status": "Yes" if metadata["has_tests"] else "No",
+    }
+
+    readme = "".join(lit + (str(mapping.get(name, "")) if name is not None else "") for lit, name in _template())
+    return PLACEHOLDER_RE.sub("", readme)
+
+
+# writes docs/diagram.* and appends the diagram section to the readme;
+# returns the readme and the render backend that produced the svg
+def add_diagram(repo_dir: Path, metadata: Dict[str, Any], readme: str,
+                timer: Optional[metrics.StageTimer] = None, time_left: Optional[float] = None) -> Tuple[str, Optional[str]]:
+    try:
+        diagram_info = diagram.make_docs_with_diagram(
+            repo_dir=repo_dir,
+            project_name=metadata["projectName"],
+            frameworks=metadata["frameworks"],
+            dependencies=metadata["dependencies"],
+            file_tree=metadata["file_tree"],
+            import_graph=metadata.get("import_graph"),
+            projects=metadata.get("projects"),
+            timer=timer,
+            time_left=time_left,
+        )
+    except Exception:
+        logger.exception("Diagram generation failed")
+        docs_dir = repo_dir / "docs"
+        fallback_mmd = docs_dir / "diagram.mmd"
+        try:
+            docs_dir.mkdir(parents=True, exist_ok=True)
+            fallback_mmd.write_text("flowchart TD\n  A[Architecture diagram unavailable]\n", encoding="utf-8")
+            diagram_info = {"mmd": str(fallback_mmd), "svg": None, "rendered": False}
+        except Exception:
+            diagram_info = {"mmd": None, "svg": None, "rendered": False}
+
+    if diagram_info.get("rendered") and diagram_info.get("svg"):
+        readme += "\n\n## Automatically generated architecture diagram\n\n"
+        readme += f"![Architecture](docs/diagram.svg)\n"
+    else:
+        mmd_path = diagram_info.get("mmd")
+
+        if mmd_path:
+            try:
+                mermaid_source = Path(mmd_path).read_text(encoding="utf-8")
+            except Exception:
+                mermaid_source = ""
+
+            readme += mermaid_section(mermaid_source)
+
+    return readme, diagram_info.get("backend")
+
+
+# readme section embedding unrendered mermaid source
+def mermaid_section(source: str) -> str:
+    if not source:
+        return ""
+    return "\n\n## Automatically generated architecture diagram (Mermaid)\n\n```mermaid\n" + source + "\n```\n"
+
+
+# mermaid source for the metadata, without rendering or writing anything
+def mermaid_text(metadata: Dict[str, Any]) -> str:
+    try:
+        return diagram.generate_mermaid_syntax(
+            metadata["projectName"], metadata["frameworks"], metadata["dependencies"],
+            metadata["file_tree"], metadata.get("import_graph"), metadata.get("projects"))
+    except Exception:
+        logger.exception("Diagram generation failed")
+        return "flowchart TD\n  A[Architecture diagram unavailable]\n"
+
+
+# progress callback that records the current stage in a file, so it works from any pool
+class StageFile:
+    def __init__(self, path: str) -> None:
+        self.path = path
+
+    def __call__(self, stage: str) -> None:
+        try:
+            Path(self.path).write_text(stage, encoding="utf-8")
+        except Exception:
+            pass
+
+    def read(self) -> Optional[str]:
+        try:
+            return Path(self.path).read_text(encoding="utf-8") or None
+        except Exception:
+            return None
+
+
+# full /analyze pipeline; runs on a worker, never on the event loop.
+# the budget is checked between stages and inside extraction, scanning and rendering.
+# the result names the upload and the generated files, which the caller streams back as
+# one zip. output "json" stops after the readme and mermaid text: no diagram render or
+# generated files, and the result carries readme and mermaid instead
+def run_analysis(zip_path: str, tmpdir: str, progress: Optional[Callable[[str], None]] = None,
+                 budget: Optional[Budget] = None, output: str = "archive") -> Dict[str, Any]:
+    tmp = Path(tmpdir)
+    upload = Path(zip_path)
+    progress = progress or (lambda stage: None)
+    budget = budget or Budget()
+    timer = metrics.StageTimer()
+    stats = {"upload_bytes": upload.stat().st_size}
+
+    budget.start()
+
+    try:
+        budget.charge_disk(stats["upload_bytes"])
+        budget.check()
+
+        progress("unpacking")
+        with timer.stage("unpack"):
+            repo = open_repo(upload, tmp, budget)
+        try:
+            progress("scanning")
+            metadata = analyze_repo(repo, timer, stats, budget)
+        finally:
+            if isinstance(repo, archive.ZipRepo):
+                repo.close()
+
+        if output == "json":
+            progress("rendering")
+            with timer.stage("readme"):
+                readme = render_readme(metadata)
+            with timer.stage("diagram_syntax"):
+                mermaid = mermaid_text(metadata)
+
+            return {
+                "metadata": {**metadata, "file_tree": as_dict(metadata["file_tree"])},
+                "readme": readme + mermaid_section(mermaid),
+                "mermaid": mermaid,
+                "timings": timer.stages,
+                "stats": stats,
+                "backend": None,
+            }
+
+        # generated files get their own dir; the response zip is streamed later from the upload
+        # plus this dir, so no archive is built here
+        out_dir = tmp / "generated"
+        out_dir.mkdir(exist_ok=True)
+
+        progress("rendering")
+        readme_path = out_dir / "README.md"
+        with timer.stage("readme"):
+            readme = render_readme(metadata)
+            readme_path.write_text(readme, encoding="utf-8")
+
+        budget.check()
+        readme, backend = add_diagram(out_dir, metadata, readme, timer, budget.remaining())
+        readme_path.write_text(readme, encoding="utf-8")
+    except HTTPException as e:
+        raise AnalysisError(e.status_code, e.detail)
+    finally:
+        if budget.cancel_path:
+            Path(budget.cancel_path).unlink(missing_ok=True)
+
+    safe_name = (metadata["projectName"] or "project").replace(" ", "_")
+
+    return {
+        "upload": str(upload),
+        "generated": str(out_dir),
+        "download_name": f"{safe_name}.zip",
+        "metadata": {**metadata, "file_tree": as_dict(metadata["file_tree"])},
+        "timings": timer.stages,
+        "stats": stats,
+        "backend": backend,
+    }
@@ -0,0 +1,59 @@
+// long-lived mermaid renderer: keeps one headless browser warm and answers
+// newline-delimited JSON requests on stdin with JSON responses on stdout.
+//   -> {"id": 1, "type": "render", "text": "flowchart TD ..."}
+//   <- {"id": 1, "ok": true, "svg": "<svg ..."}
+//   -> {"id": 2, "type": "ping"}
+//   <- {"id": 2, "ok": true}
+import { readFileSync } from "node:fs";
+import readline from "node:readline";
+import puppeteer from "puppeteer";
+import { renderMermaid } from "@mermaid-js/mermaid-cli";
+
+const configPath = process.argv[2];
+const launchConfig = configPath ? JSON.parse(readFileSync(configPath, "utf8")) : {};
+
+const browser = await puppeteer.launch({ headless: "new", ...launchConfig });
+
+function respond(message) {
+  process.stdout.write(JSON.stringify(message) + "\n");
+}
+
+// requests are answered strictly in order; the python side sends one at a time
+let queue = Promise.resolve();
+
+async function handle(line) {
+  let req;
+  try {
+    req = JSON.parse(line);
+  } catch (err) {
+    respond({ id: null, ok: false, error: "bad request" });
+    return;
+  }
+
+  if (req.type === "ping") {
+    const connected = typeof browser.isConnected === "function" ? browser.isConnected() : browser.connected;
+    respond({ id: req.id, ok: connected });
+    return;
+  }
+
+  try {
+    const { data } = await renderMermaid(browser, req.text, "svg", {});
+    respond({ id: req.id, ok: true, svg: Buffer.from(data).toString("utf8") });
+  } catch (err) {
+    respond({ id: req.id, ok: false, error: String(err && err.message ? err.message : err) });
+  }
+}
+
+const rl = readline.createInterface({ input: process.stdin });
+rl.on("line", (line) => {
+  queue = queue.then(() => handle(line));
+});
+rl.on("close", async () => {
+  await queue;
+  await browser.close();
+  process.exit(0);
+});
+
+browser.on("disconnected", () => process.exit(1));
+
+respond({ ready: true });
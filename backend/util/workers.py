@@ -0,0 +1,72 @@
+import os
+import asyncio
+import threading
+import logging
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Any, Callable, Optional
+
+# "thread" or "process"; process pools sidestep the GIL for detector-heavy work
+POOL_KIND = os.getenv("DOX_POOL", "thread").lower()
+POOL_SIZE = max(1, int(os.getenv("DOX_POOL_SIZE", str(os.cpu_count() or 2))))
+# analyses allowed in flight at once; extra requests wait for a free slot
+MAX_CONCURRENT = max(1, int(os.getenv("DOX_MAX_CONCURRENT", str(POOL_SIZE))))
+# threads for blocking file reads during scanning; 1 reads sequentially
+IO_THREADS = max(1, int(os.getenv("DOX_IO_THREADS", "8")))
+
+logger = logging.getLogger(__name__)
+
+_executor: Optional[Executor] = None
+_io_executor: Optional[ThreadPoolExecutor] = None
+_io_lock = threading.Lock()
+_slots: Optional[asyncio.Semaphore] = None
+
+
+# lazily creates the shared executor
+def get_executor() -> Executor:
+    global _executor
+
+    if _executor is None:
+        if POOL_KIND == "process":
+            _executor = ProcessPoolExecutor(max_workers=POOL_SIZE)
+        else:
+            _executor = ThreadPoolExecutor(max_workers=POOL_SIZE, thread_name_prefix="dox-worker")
+        logger.info("Started %s pool with %d workers", POOL_KIND, POOL_SIZE)
+
+    return _executor
+
+
+# lazily creates the i/o pool; each process, including pool workers, gets its own
+def get_io_executor() -> ThreadPoolExecutor:
+    global _io_executor
+
+    with _io_lock:
+        if _io_executor is None:
+            _io_executor = ThreadPoolExecutor(max_workers=IO_THREADS, thread_name_prefix="dox-io")
+
+    return _io_executor
+
+
+# runs fn on the worker pool without blocking the event loop
+async def run(fn: Callable[..., Any], *args: Any) -> Any:
+    global _slots
+
+    if _slots is None:
+        _slots = asyncio.Semaphore(MAX_CONCURRENT)
+
+    async with _slots:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(get_executor(), fn, *args)
+
+
+# stops the executors on app shutdown
+def shutdown() -> None:
+    global _executor, _io_executor, _slots
+
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+    with _io_lock:
+        if _io_executor is not None:
+            _io_executor.shutdown(wait=False, cancel_futures=True)
+            _io_executor = None
+    _slots = None